@@ -1,6 +1,6 @@
 import time
 
-from grow.moisture import Moisture
+from grow.moisture import MoistureArray
 
 print("""moisture.py - Print out sensor reading in Hz
 
@@ -9,14 +9,11 @@ Press Ctrl+C to exit!
 """)
 
 
-m1 = Moisture(1)
-m2 = Moisture(2)
-m3 = Moisture(3)
+meters = MoistureArray(channels=(1, 2, 3))
 
 while True:
-    print(f"""1: {m1.moisture}
-2: {m2.moisture}
-3: {m3.moisture}
-""")
+    for reading in meters.snapshot.channels:
+        print(f"{reading.channel}: {reading.moisture}")
+    print("")
     time.sleep(1.0)
 
@@ -3,7 +3,6 @@ import logging
 import math
 import pathlib
 import sys
-import threading
 import time
 
 import ltr559
@@ -14,8 +13,12 @@ from fonts.ttf import RobotoMedium as UserFont
 from PIL import Image, ImageDraw, ImageFont
 
 from grow import Piezo
+from grow.dosing import DoseScheduler
+from grow.metrics import Metrics
 from grow.moisture import Moisture
-from grow.pump import Pump
+from grow.pump import Pump, global_budget
+from grow.recorder import Recorder
+from grow.scheduler import default_scheduler
 
 FPS = 10
 
@@ -651,9 +654,13 @@ class Channel:
         self._wet_point = wet_point
         self._dry_point = dry_point
         self.last_dose = time.time()
+        self.scheduler = None
+        self._dose = None
         self.icon = icon
         self._enabled = enabled
         self.alarm = False
+        self.recorder = None
+        self.metrics = None
         self.title = f"Channel {display_channel}" if title is None else title
 
         self.sensor.set_wet_point(wet_point)
@@ -741,26 +748,66 @@ Dry point: {dry_point}
             dry_point=self.dry_point,
         )
 
-    def water(self):
+    def water(self, priority=0):
         if not self.auto_water:
             return False
+        # Already queued, or running
+        if self._dose is not None and not self._dose.done():
+            return False
         if time.time() - self.last_dose > self.watering_delay:
-            self.pump.dose(self.pump_speed, self.pump_time, blocking=False)
-            self.last_dose = time.time()
+            # Give up if the dose can't start before the next one would be due anyway
+            self._dose = self.scheduler.submit(
+                self.channel, self.pump_speed, self.pump_time, priority=priority, deadline=time.time() + self.watering_delay
+            )
+            self._dose.add_done_callback(self._dosed)
             return True
         return False
 
+    def _dosed(self, future):
+        # Only count doses that actually delivered water
+        if not future.cancelled() and future.result():
+            self.last_dose = time.time()
+
     def render(self, image, font):
         pass
 
+    def record_to(self, recorder):
+        self.recorder = recorder
+        recorder.attach_moisture(self.channel, self.sensor)
+        recorder.attach_pump(self.pump)
+
+    def export_to(self, metrics):
+        self.metrics = metrics
+        metrics.attach_moisture(self.channel, self.sensor)
+        metrics.attach_pump(self.pump)
+        metrics.set_alarm(self.channel, self.alarm)
+
+    def set_alarm(self, alarm):
+        if alarm != self.alarm:
+            if self.recorder is not None:
+                self.recorder.record_alarm(self.channel, alarm)
+            if self.metrics is not None:
+                self.metrics.set_alarm(self.channel, alarm)
+        self.alarm = alarm
+
     def update(self):
         if not self.enabled:
             return
+        if self.sensor.stale:
+            # No pulses from the sensor, so its saturation can't be trusted to water by
+            if self.sensor.timestamp is None:
+                # Still waiting for the first reading
+                return
+            if not self.alarm:
+                logging.warning("Alarm on Channel: {} - sensor is not responding".format(self.channel))
+            self.set_alarm(True)
+            return
         sat = self.sensor.saturation
         if sat < self.water_level:
-            if self.water():
+            # The driest channel is watered first
+            if self.water(priority=round((self.water_level - sat) * 100)):
                 logging.info(
-                    "Watering Channel: {} - rate {:.2f} for {:.2f}sec".format(
+                    "Queued watering Channel: {} - rate {:.2f} for {:.2f}sec".format(
                         self.channel, self.pump_speed, self.pump_time
                     )
                 )
@@ -771,9 +818,9 @@ Dry point: {dry_point}
                         self.channel, sat * 100, self.warn_level * 100
                     )
                 )
-            self.alarm = True
+            self.set_alarm(True)
         else:
-            self.alarm = False
+            self.set_alarm(False)
 
 
 class Alarm(View):
@@ -805,19 +852,11 @@ class Alarm(View):
             and self._triggered
             and time.time() - self._time_last_beep > self.interval
         ):
+            # Three short beeps, all timed from the shared scheduler thread
             self.piezo.beep(self.beep_frequency, 0.1, blocking=False)
-            threading.Timer(
-                0.3,
-                self.piezo.beep,
-                args=[self.beep_frequency, 0.1],
-                kwargs={"blocking": False},
-            ).start()
-            threading.Timer(
-                0.6,
-                self.piezo.beep,
-                args=[self.beep_frequency, 0.1],
-                kwargs={"blocking": False},
-            ).start()
+            scheduler = default_scheduler()
+            scheduler.call_later(0.3, self.piezo.beep, self.beep_frequency, 0.1, False)
+            scheduler.call_later(0.6, self.piezo.beep, self.beep_frequency, 0.1, False)
             self._time_last_beep = time.time()
 
             self._triggered = False
@@ -1037,6 +1076,11 @@ def main():
         Channel(3, 3, 3),
     ]
 
+    # Doses queue up rather than being dropped while another pump runs, and run side by side if the power budget allows
+    scheduler = DoseScheduler({channel.channel: channel.pump for channel in channels}, concurrency=len(channels))
+    for channel in channels:
+        channel.scheduler = scheduler
+
     alarm = Alarm(image)
 
     config = Config()
@@ -1055,6 +1099,27 @@ def main():
 
     alarm.update_from_yml(config.get_general())
 
+    # Run pumps side by side if "power_budget: <duty units>" is set under general, eg: 2.0 for two pumps at full speed
+    power_budget = config.get_general().get("power_budget")
+    if power_budget:
+        global_budget.capacity = power_budget
+
+    # Log readings, doses and alarms to SQLite if "database: path/to/grow.db" is set under general
+    database = config.get_general().get("database")
+    if database:
+        recorder = Recorder(database)
+        for channel in channels:
+            channel.record_to(recorder)
+
+    # Serve Prometheus metrics on http://<your-pi-host>:<port>/metrics if "metrics_port: <port>" is set under general
+    metrics = None
+    metrics_port = config.get_general().get("metrics_port")
+    if metrics_port:
+        metrics = Metrics()
+        metrics.serve(metrics_port)
+        for channel in channels:
+            channel.export_to(metrics)
+
     print("Channels:")
     for channel in channels:
         print(channel)
@@ -1116,6 +1181,8 @@ Low Light Value {:.2f}
     )
 
     while True:
+        frame_start = time.time()
+
         for channel in channels:
             config.set_channel(channel.channel, channel)
             channel.update()
@@ -1145,6 +1212,9 @@ Low Light Value {:.2f}
 
         config.save()
 
+        if metrics is not None:
+            metrics.observe_frame(time.time() - frame_start)
+
         time.sleep(1.0 / FPS)
 
 
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+import argparse
+
+from grow.pump import FlowModel, Pump, flow_model_path
+
+"""
+Measure how much water a pump delivers, so it can be dosed by volume.
+
+Put the end of the hose in a measuring jug. The pump will run for a few seconds
+at each speed in turn, and after each run you enter how many millilitres it delivered.
+
+The fitted flow model is saved for the channel, and used by Pump.dose_volume:
+
+    pump = Pump(1)
+    pump.dose_volume(50)  # 50ml
+"""
+
+parser = argparse.ArgumentParser(description="Calibrate pump flow rate for volume based dosing.")
+parser.add_argument("channel", type=int, choices=(1, 2, 3), help="Pump channel to calibrate")
+parser.add_argument("--speeds", type=float, nargs="+", default=[0.5, 0.75, 1.0], help="Speeds to run the pump at")
+parser.add_argument("--duration", type=float, default=5.0, help="Time, in seconds, to run the pump for at each speed")
+parser.add_argument("--reset", action="store_true", help="Discard any previous calibration runs")
+args = parser.parse_args()
+
+pump = Pump(args.channel)
+model = pump.flow_model
+
+if args.reset:
+    for sample in model.samples:
+        print("Discarding: {:.2f} speed for {:.1f}s gave {:.1f}ml".format(*sample))
+    model = FlowModel(path=flow_model_path(args.channel))
+
+for speed in args.speeds:
+    input(f"Empty the jug and press Enter to run pump {args.channel} at {speed:.2f} for {args.duration:.1f}s ")
+    pump.dose(speed, args.duration, blocking=True)
+    volume = float(input("Millilitres delivered: "))
+    model.add_sample(speed, args.duration, volume)
+
+print(f"Saved to {flow_model_path(args.channel)}")
+print(f"Pump does not move water below speed {model.minimum_speed:.2f}")
+for speed in args.speeds:
+    print(f"Speed {speed:.2f}: {model.rate(speed):.2f}ml/s")
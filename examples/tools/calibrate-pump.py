@@ -6,6 +6,7 @@ import ST7735
 from fonts.ttf import RobotoMedium as UserFont
 from PIL import Image, ImageDraw, ImageFont
 
+from grow.filters import EMAFilter
 from grow.moisture import Moisture
 from grow.pump import Pump
 
@@ -34,14 +35,14 @@ dose_time = 0.96  # Time (in seconds) for water dose
 
 # Here be dragons!
 FPS = 15  # Display framerate
-NUM_SAMPLES = 10  # Number of saturation level samples to average over
+NUM_SAMPLES = 10  # Approximate number of saturation level samples to average over
 DOSE_FREQUENCY = 30.0  # Minimum time between automatic waterings (in seconds)
 
 BUTTONS = [5, 6, 16, 24]
 LABELS = ["A", "B", "X", "Y"]
 
 p = Pump(pump_channel)
-m = Moisture(moisture_channel)
+m = Moisture(moisture_channel, filter=EMAFilter(2.0 / (NUM_SAMPLES + 1)))
 
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
@@ -49,7 +50,6 @@ GPIO.setup(BUTTONS, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
 mode = 0
 last_dose = time.time()
-saturation = [1.0 for _ in range(NUM_SAMPLES)]
 
 display = ST7735.ST7735(
     port=0, cs=1, dc=9, backlight=12, rotation=270, spi_speed_hz=80000000
@@ -114,13 +114,11 @@ current_saturation = 0
 try:
     while True:
         # New moisture readings are available approximately 1/sec
-        # push them into the list for averagering
+        # and are averaged as they arrive by the sensor's filter
         if m.new_data:
             current_saturation = m.saturation
-            saturation.append(current_saturation)
-            saturation = saturation[-NUM_SAMPLES:]
 
-        avg_saturation = sum(saturation) / float(NUM_SAMPLES)
+        avg_saturation = m.filtered_saturation
 
         # Trigger a dose of water if the average saturation is less than the specified dry level
         # dose frequency is rate limited, so this doesn't re-trigger before the moistrure sensor
@@ -2,34 +2,165 @@
 @jorjun Anno Vvii ☉ in ♓ ☽ in ♋
 License: MIT
 Description: Web API for moisture readings: http://<your-pi-host>:8080/
+Live readings are pushed as Server-Sent Events from: http://<your-pi-host>:8080/stream
+Saturation history: http://<your-pi-host>:8080/history?channel=1&from=<time>&to=<time>&points=300
+Prometheus metrics: http://<your-pi-host>:8080/metrics
 """
+import asyncio
+import contextlib
 import json
 import logging
+import time
 from functools import partial
 
 from aiohttp import web
 
-from grow.moisture import Moisture
+from grow.history import DEFAULT_TIERS
+from grow.metrics import CONTENT_TYPE, Metrics
+from grow.moisture import MoistureArray, put_latest
+
+# Frames queued per client before the oldest are dropped
+CLIENT_QUEUE_SIZE = 8
+
+# History defaults to the last day, in at most MAX_POINTS entries
+HISTORY_SPAN = 24 * 60 * 60
+HISTORY_POINTS = 300
+MAX_POINTS = 2000
 
 json_response = partial(web.json_response, dumps=partial(json.dumps, default=str))
 routes = web.RouteTableDef()
 
 
-@routes.get("/")  # Or whatever URL path you want
-async def reading(request):
+class Broadcast:
+    """Fan one encoded frame out to every connected client."""
+
+    def __init__(self, maxsize=CLIENT_QUEUE_SIZE):
+        self._maxsize = maxsize
+        self._clients = set()
+        self.latest = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(self._maxsize)
+        self._clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._clients.discard(queue)
+
+    def publish(self, frame):
+        self.latest = frame
+        for queue in self._clients:
+            put_latest(queue, frame)
+
+
+def encode_frame(snapshot):
     data = {
-        "m1": meter[0].moisture,
-        "m2": meter[1].moisture,
-        "m3": meter[2].moisture,
+        "timestamp": snapshot.timestamp,
+        "channels": [
+            {
+                "channel": reading.channel,
+                "saturation": round(reading.saturation, 4),
+                "hz": round(reading.moisture, 2),
+                "active": reading.active,
+                "stale": reading.stale,
+                "timestamp": reading.timestamp,
+            }
+            for reading in snapshot.channels
+        ],
     }
+    return f"data: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+async def publish_snapshots(broadcast):
+    # One reader for all clients, each snapshot is encoded once however many are connected
+    async with meter.snapshots() as snapshots:
+        async for snapshot in snapshots:
+            broadcast.publish(encode_frame(snapshot))
+
+
+async def fan_out(app):
+    app["broadcast"] = Broadcast()
+    task = asyncio.ensure_future(publish_snapshots(app["broadcast"]))
+    yield
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+@routes.get("/")  # Or whatever URL path you want
+async def reading(request):
+    # All three readings come from the same sampling window
+    snapshot = meter.snapshot
+    data = {f"m{reading.channel}": reading.moisture for reading in snapshot.channels}
     return json_response(data)
 
 
+@routes.get("/history")
+async def history(request):
+    try:
+        channel = int(request.query.get("channel", 1))
+        end = float(request.query.get("to", time.time()))
+        start = float(request.query.get("from", end - HISTORY_SPAN))
+        points = int(request.query.get("points", HISTORY_POINTS))
+    except ValueError:
+        raise web.HTTPBadRequest(text="channel, from, to and points must be numbers")
+
+    if channel not in meter.channels:
+        raise web.HTTPNotFound(text=f"channel must be one of {meter.channels}")
+    if not 1 <= points <= MAX_POINTS or start >= end:
+        raise web.HTTPBadRequest(text=f"points must be 1 to {MAX_POINTS} and from must be before to")
+
+    # Reads from the coarsest tier that fits, then buckets down to points on the Pi
+    times, minimum, mean, maximum = meter[channel].query_history(start, end, points)
+    return json_response({
+        "channel": channel,
+        "time": times,
+        "min": minimum,
+        "mean": mean,
+        "max": maximum,
+    })
+
+
+@routes.get("/metrics")
+async def metrics_endpoint(request):
+    response = web.Response(text=metrics.render())
+    response.headers["Content-Type"] = CONTENT_TYPE
+    return response
+
+
+@routes.get("/stream")
+async def stream(request):
+    broadcast = request.app["broadcast"]
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+    })
+    await response.prepare(request)
+
+    queue = broadcast.subscribe()
+    try:
+        # Start new clients off with the current readings instead of an empty page
+        if broadcast.latest is not None:
+            await response.write(broadcast.latest)
+        while True:
+            await response.write(await queue.get())
+    except ConnectionResetError:
+        pass
+    finally:
+        broadcast.unsubscribe(queue)
+
+    return response
+
+
 if __name__ == "__main__":
     app = web.Application()
     logging.basicConfig(level=logging.INFO)
     app.add_routes(routes)
-    meter = [Moisture(_+1) for _ in range(3)]
+    app.cleanup_ctx.append(fan_out)
+    meter = MoistureArray(channels=(1, 2, 3), history_tiers=DEFAULT_TIERS)
+    metrics = Metrics()
+    for channel in meter.channels:
+        metrics.attach_moisture(channel, meter[channel])
     web.run_app(
         app,
         host="0.0.0.0",
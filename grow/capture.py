@@ -0,0 +1,161 @@
+import fcntl
+import os
+import select
+import struct
+import threading
+import time
+
+GPIO_CHIP = "/dev/gpiochip0"
+
+GPIOHANDLE_REQUEST_INPUT = 1 << 0
+GPIOEVENT_REQUEST_RISING_EDGE = 1 << 0
+
+# _IOWR(0xB4, 0x04, struct gpioevent_request)
+GPIO_GET_LINEEVENT_IOCTL = 0xC030B404
+
+# struct gpioevent_request: lineoffset, handleflags, eventflags, consumer_label[32], fd
+_EVENT_REQUEST = struct.Struct("III32si")
+
+# struct gpioevent_data: timestamp (ns), id, padding
+_EVENT_DATA = struct.Struct("QI4x")
+
+# The kernel queues at most 16 events per line
+_EVENT_BATCH = 16
+
+
+class GPIOChipEventSource(object):
+    """Rising edge events from the Linux GPIO character device."""
+
+    def __init__(self, chip=GPIO_CHIP, consumer="grow"):
+        """Open a GPIO chip for edge event capture.
+
+        Events are timestamped by the kernel as the edge arrives, so timing is not
+        affected by how long Python takes to get around to reading them.
+
+        Kernel timestamps are CLOCK_MONOTONIC (Linux 5.7 onwards) and are converted
+        to time.time() seconds when read.
+
+        :param chip: Path to the GPIO character device
+        :param consumer: Label shown against requested lines in gpioinfo
+
+        """
+        self._chip = os.open(chip, os.O_RDWR | os.O_CLOEXEC)
+        self._consumer = consumer.encode("ascii")
+        self._lines = {}
+        self._poll = select.poll()
+
+    def add(self, pin):
+        """Request rising edge events for a BCM pin."""
+        request = bytearray(_EVENT_REQUEST.pack(pin, GPIOHANDLE_REQUEST_INPUT, GPIOEVENT_REQUEST_RISING_EDGE, self._consumer, 0))
+        fcntl.ioctl(self._chip, GPIO_GET_LINEEVENT_IOCTL, request)
+        fd = _EVENT_REQUEST.unpack(request)[4]
+        self._lines[fd] = pin
+        self._poll.register(fd, select.POLLIN)
+
+    def remove(self, pin):
+        """Release a previously requested BCM pin."""
+        for fd, line in list(self._lines.items()):
+            if line == pin:
+                self._poll.unregister(fd)
+                os.close(fd)
+                del self._lines[fd]
+
+    def read(self, timeout=None):
+        """Wait for edge events and return every event queued so far.
+
+        :param timeout: Time, in seconds, to wait for an event. None waits forever.
+        :returns: dict of BCM pin to a list of edge timestamps, oldest first
+
+        """
+        events = {}
+        ready = self._poll.poll(None if timeout is None else timeout * 1000)
+        offset = time.time() - time.monotonic()
+
+        for fd, _ in ready:
+            data = os.read(fd, _EVENT_DATA.size * _EVENT_BATCH)
+            events.setdefault(self._lines[fd], []).extend(timestamp / 1e9 + offset for timestamp, _ in _EVENT_DATA.iter_unpack(data))
+
+        return events
+
+    def close(self):
+        """Release all lines and close the GPIO chip."""
+        for pin in list(self._lines.values()):
+            self.remove(pin)
+        os.close(self._chip)
+
+
+class PulseCapture(object):
+    """Batched pulse capture shared by several sensors."""
+
+    def __init__(self, source=None, interval=0.1, background=True):
+        """Create a new pulse capture.
+
+        A single thread drains every requested line once per interval and hands each
+        sensor a batch of timestamps, instead of calling into Python on every edge.
+
+        :param source: Edge event source, defaults to a GPIOChipEventSource
+        :param interval: Time, in seconds, between batches. Must be short enough that the kernel queue does not fill.
+        :param background: If true, start a thread on the first register. Otherwise call poll() yourself.
+
+        """
+        self._source = source if source is not None else GPIOChipEventSource()
+        self._interval = interval
+        self._background = background
+        self._callbacks = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def background(self):
+        """Return True if this capture runs its own thread."""
+        return self._background
+
+    def register(self, pin, callback):
+        """Deliver edges on a BCM pin to callback.
+
+        :param pin: BCM pin to capture
+        :param callback: Called with a list of edge timestamps, oldest first
+
+        """
+        self._source.add(pin)
+        self._callbacks[pin] = callback
+        if self._background:
+            self.start()
+
+    def unregister(self, pin):
+        """Stop delivering edges on a BCM pin."""
+        self._callbacks.pop(pin, None)
+        self._source.remove(pin)
+
+    def poll(self, timeout=0):
+        """Read and dispatch one batch of edge events.
+
+        :param timeout: Time, in seconds, to wait for an event
+
+        """
+        events = self._source.read(timeout)
+        for pin, timestamps in events.items():
+            callback = self._callbacks.get(pin)
+            if callback is not None and timestamps:
+                callback(timestamps)
+
+    def start(self):
+        """Start the capture thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the capture thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.poll(self._interval)
+            # Let edges queue up in the kernel so the next read is a batch
+            self._stop_event.wait(self._interval)
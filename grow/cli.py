@@ -0,0 +1,141 @@
+import argparse
+import json
+import sys
+import time
+
+from .client import DEFAULT_SOCKET, GrowClient, socket_path
+
+
+def _connect(args):
+    """Return a GrowClient, or None if no daemon is running."""
+    try:
+        return GrowClient(args.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+
+
+def _read_hardware(args):
+    # Only imported without a daemon, RPi.GPIO and the sensors are slow to set up
+    from .moisture import MoistureArray
+
+    meter = MoistureArray(channels=args.channels, interval=args.interval, background=False)
+    time.sleep(args.interval)
+    return meter.sample()
+
+
+def _print_snapshot(snapshot, as_json):
+    if as_json:
+        print(json.dumps({"timestamp": snapshot.timestamp, "channels": [reading._asdict() for reading in snapshot.channels]}))
+        return
+    for reading in snapshot.channels:
+        state = "stale" if reading.stale else "active" if reading.active else "inactive"
+        print(f"{reading.channel}: {reading.saturation:.3f} saturation, {reading.moisture:.2f} Hz, {state}")
+
+
+def read(args, client):
+    if client is not None:
+        snapshot = client.snapshot()
+        snapshot = snapshot._replace(channels=tuple(reading for reading in snapshot.channels if reading.channel in args.channels))
+    else:
+        snapshot = _read_hardware(args)
+    _print_snapshot(snapshot, args.json)
+
+
+def status(args, client):
+    if client is None:
+        print(f"No daemon running on {socket_path(args.socket)}, reading hardware directly", file=sys.stderr)
+        _print_snapshot(_read_hardware(args), args.json)
+        return
+
+    result = client.status()
+    if args.json:
+        print(json.dumps({
+            "timestamp": result["snapshot"].timestamp,
+            "channels": [reading._asdict() for reading in result["snapshot"].channels],
+            "pumps": result["pumps"],
+            "power": result["power"],
+            "telemetry": {channel: telemetry._asdict() for channel, telemetry in result["telemetry"].items()},
+        }))
+        return
+
+    age = time.time() - result["snapshot"].timestamp if result["snapshot"].timestamp is not None else float("inf")
+    print(f"Daemon on {socket_path(args.socket)}, last sample {age:.1f}s ago")
+    _print_snapshot(result["snapshot"], False)
+    for channel, speed in sorted(result["pumps"].items()):
+        telemetry = result["telemetry"][channel]
+        print(f"Pump {channel}: {'running at ' + format(speed, '.2f') if speed else 'stopped'}, "
+              f"run {telemetry.on_time:.1f}s over {telemetry.doses} doses ({telemetry.rejected} rejected, {telemetry.aborted} aborted), "
+              f"about {telemetry.volume:.0f}ml")
+    print(f"Power headroom: {result['power']['headroom']:.2f} of {result['power']['capacity']:.2f} duty units")
+
+
+def dose(args, client):
+    if client is not None:
+        accepted = client.dose(args.channel, args.speed, args.duration)
+    else:
+        from .pump import Pump
+
+        # Without a daemon the pump stops when this process exits, so wait for the dose
+        accepted = Pump(args.channel).dose(args.speed, args.duration, blocking=True)
+
+    if not accepted:
+        print("Dose refused, is another pump running?", file=sys.stderr)
+        return 1
+
+
+def history(args, client):
+    if client is None:
+        print(f"History needs a daemon running on {socket_path(args.socket)}", file=sys.stderr)
+        return 1
+
+    end = time.time()
+    times, minimum, mean, maximum = client.history(args.channel, end - args.span, end, args.points)
+    if args.json:
+        print(json.dumps({"time": times, "min": minimum, "mean": mean, "max": maximum}))
+        return
+    for row in zip(times, minimum, mean, maximum):
+        print("{:.0f} {:.3f} {:.3f} {:.3f}".format(*row))
+
+
+def main(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--socket", default=None, help=f"Path of the grow daemon's Unix socket, defaults to $GROW_SOCKET, $XDG_RUNTIME_DIR/grow.sock or {DEFAULT_SOCKET}")
+    common.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    parser = argparse.ArgumentParser(prog="grow", description="Read moisture and run pumps on a Grow HAT.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name, function, help in (("read", read, "Print the latest moisture readings"), ("status", status, "Print readings and pump state")):
+        command = commands.add_parser(name, help=help, parents=[common])
+        command.add_argument("channels", type=int, nargs="*", default=[1, 2, 3], help="Channels to read, defaults to all")
+        command.add_argument("--interval", type=float, default=1.0, help="Time, in seconds, to count pulses for if there is no daemon")
+        command.set_defaults(function=function)
+
+    command = commands.add_parser("dose", help="Run a pump", parents=[common])
+    command.add_argument("channel", type=int, choices=(1, 2, 3))
+    command.add_argument("speed", type=float, help="Pump speed from 0.0 to 1.0")
+    command.add_argument("duration", type=float, help="Time, in seconds, to run the pump for")
+    command.set_defaults(function=dose)
+
+    command = commands.add_parser("history", help="Print saturation history as time, min, mean and max", parents=[common])
+    command.add_argument("channel", type=int, choices=(1, 2, 3))
+    command.add_argument("--span", type=float, default=24 * 60 * 60, help="Time, in seconds, to go back, defaults to one day")
+    command.add_argument("--points", type=int, default=100, help="Maximum number of rows")
+    command.set_defaults(function=history)
+
+    args = parser.parse_args(argv)
+    args.channels = tuple(getattr(args, "channels", ()))
+
+    client = _connect(args)
+    try:
+        return args.function(args, client)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        if client is not None:
+            client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import json
+import os
+import socket
+
+from .readings import ChannelReading, MoistureSnapshot, PumpTelemetry
+
+# Used when neither GROW_SOCKET nor XDG_RUNTIME_DIR is set, eg: by a system service with RuntimeDirectory=grow
+DEFAULT_SOCKET = "/run/grow/grow.sock"
+
+
+def socket_path(path=None):
+    """Return path, or the GROW_SOCKET environment variable, or grow.sock in XDG_RUNTIME_DIR, or DEFAULT_SOCKET.
+
+    Unlike /tmp, neither directory can be written by other users, so nobody else can put a socket in the daemon's place.
+
+    """
+    if path is not None:
+        return path
+    if "GROW_SOCKET" in os.environ:
+        return os.environ["GROW_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "grow.sock")
+    return DEFAULT_SOCKET
+
+
+def encode(message):
+    """Encode a message as one line of compact JSON."""
+    return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def decode_snapshot(snapshot):
+    """Convert a snapshot received from the daemon into a MoistureSnapshot."""
+    return MoistureSnapshot(snapshot["timestamp"], tuple(ChannelReading(**reading) for reading in snapshot["channels"]))
+
+
+class GrowClient(object):
+    """Thin client for a grow.daemon.GrowDaemon."""
+
+    def __init__(self, path=None, timeout=5.0):
+        """Connect to a running daemon.
+
+        :param path: Path to the daemon's Unix socket, see socket_path
+        :param timeout: Time, in seconds, to wait for a response
+
+        """
+        self._path = socket_path(path)
+        self._timeout = timeout
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(self._path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile("rwb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _send(self, command, **arguments):
+        arguments["command"] = command
+        self._file.write(encode(arguments))
+        self._file.flush()
+
+    def _receive(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Daemon closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response.get("result")
+
+    def _request(self, command, **arguments):
+        self._send(command, **arguments)
+        return self._receive()
+
+    def snapshot(self):
+        """Return the latest MoistureSnapshot."""
+        return decode_snapshot(self._request("snapshot"))
+
+    def status(self):
+        """Return a dict of the latest snapshot, the speed and PumpTelemetry of each pump, and the power budget's capacity and headroom."""
+        status = self._request("status")
+        status["snapshot"] = decode_snapshot(status["snapshot"])
+        status["pumps"] = {int(channel): speed for channel, speed in status["pumps"].items()}
+        status["telemetry"] = {int(channel): PumpTelemetry(**telemetry) for channel, telemetry in status["telemetry"].items()}
+        return status
+
+    def dose(self, channel, speed, duration):
+        """Run a pump at speed for duration seconds, without waiting for it to finish.
+
+        Returns False if the dose was refused, eg: because another pump is running.
+
+        """
+        return self._request("dose", channel=channel, speed=speed, duration=duration)
+
+    def stop(self, channel):
+        """Stop a pump."""
+        self._request("stop", channel=channel)
+
+    def beep(self, frequency=440, timeout=0.1):
+        """Beep the piezo, without waiting for it to finish."""
+        return self._request("beep", frequency=frequency, timeout=timeout)
+
+    def history(self, channel, start, end=None, points=300):
+        """Return downsampled saturation history, see grow.moisture.Moisture.query_history.
+
+        :returns: tuple of lists of times, minimum, mean and maximum saturation
+
+        """
+        history = self._request("history", channel=channel, start=start, end=end, points=points)
+        return history["time"], history["min"], history["mean"], history["max"]
+
+    def subscribe(self):
+        """Return an iterator that yields every new MoistureSnapshot, forever.
+
+        Uses this connection exclusively, open another GrowClient for requests.
+
+        """
+        self._request("subscribe")
+        # Snapshots arrive at the sampling interval, not the response timeout
+        self._socket.settimeout(None)
+        return self._snapshots()
+
+    def _snapshots(self):
+        while True:
+            yield decode_snapshot(self._receive())
+
+    def close(self):
+        """Close the connection."""
+        self._file.close()
+        self._socket.close()
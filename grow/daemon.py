@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+
+from .client import DEFAULT_SOCKET, encode, socket_path
+from .history import DEFAULT_TIERS
+from .moisture import MoistureArray, put_latest
+from .piezo import Piezo
+from .pump import Pump, global_budget, telemetry_path
+
+# Snapshots queued per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 8
+
+# Only the daemon's own user can connect, and so dose the pumps
+SOCKET_MODE = 0o600
+
+
+def _snapshot(snapshot):
+    return {"timestamp": snapshot.timestamp, "channels": [reading._asdict() for reading in snapshot.channels]}
+
+
+class GrowDaemon(object):
+    """Single owner of the Grow moisture sensors, pumps and piezo."""
+
+    def __init__(self, path=None, meter=None, pumps=None, piezo=None):
+        """Create a new daemon.
+
+        Clients connect to a Unix domain socket and send one JSON request per line,
+        eg: {"command": "dose", "channel": 1, "speed": 0.5, "duration": 1.0}, and get
+        back one JSON response per line, either {"ok": true, "result": ...} or
+        {"ok": false, "error": "..."}. An "id" in a request is copied to its response.
+
+        Commands are snapshot, status, dose, stop, beep, history and subscribe.
+        After a subscribe, every new snapshot is sent as a response until the client disconnects.
+
+        Snapshots are encoded once per sample and shared by every subscriber.
+
+        :param path: Path of the Unix socket, see grow.client.socket_path
+        :param meter: MoistureArray to publish, defaults to channels 1, 2 and 3 with DEFAULT_TIERS history
+        :param pumps: dict of channel to Pump, defaults to channels 1, 2 and 3
+        :param piezo: Piezo to beep, defaults to a new Piezo
+
+        """
+        self._path = socket_path(path)
+        self._meter = meter if meter is not None else MoistureArray(history_tiers=DEFAULT_TIERS)
+        self._pumps = pumps if pumps is not None else {channel: Pump(channel, telemetry_file=telemetry_path(channel)) for channel in (1, 2, 3)}
+        self._piezo = piezo if piezo is not None else Piezo()
+        self._subscribers = set()
+        self._connections = set()
+        self._server = None
+        self._fan_out = None
+        self._commands = {
+            "snapshot": self._command_snapshot,
+            "status": self._command_status,
+            "dose": self._command_dose,
+            "stop": self._command_stop,
+            "beep": self._command_beep,
+            "history": self._command_history,
+        }
+
+    @property
+    def path(self):
+        """Return the path of the Unix socket."""
+        return self._path
+
+    async def start(self):
+        """Start accepting clients.
+
+        Raises RuntimeError if another daemon is already listening on the socket.
+
+        """
+        _claim_socket(self._path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self._path)
+        os.chmod(self._path, SOCKET_MODE)
+        self._fan_out = asyncio.ensure_future(self._publish_snapshots())
+
+    async def serve_forever(self):
+        """Start accepting clients and run until cancelled."""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stop accepting clients and remove the socket."""
+        if self._fan_out is not None:
+            self._fan_out.cancel()
+            try:
+                await self._fan_out
+            except asyncio.CancelledError:
+                pass
+            self._fan_out = None
+        if self._server is not None:
+            self._server.close()
+            for connection in list(self._connections):
+                connection.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+
+    async def _publish_snapshots(self):
+        async with self._meter.snapshots() as snapshots:
+            async for snapshot in snapshots:
+                line = encode({"ok": True, "result": _snapshot(snapshot)})
+                for queue in self._subscribers:
+                    put_latest(queue, line)
+
+    async def _handle(self, reader, writer):
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Request is not a JSON object")
+                    command = request.pop("command")
+                    request_id = request.pop("id", None)
+                except (ValueError, KeyError):
+                    writer.write(encode({"ok": False, "error": "Requests must be a JSON object with a command"}))
+                    await writer.drain()
+                    continue
+
+                if command == "subscribe":
+                    writer.write(encode(self._response(request_id, True, result=None)))
+                    await self._subscribe(writer)
+                    break
+
+                writer.write(encode(self._dispatch(command, request, request_id)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    async def _subscribe(self, writer):
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            while True:
+                writer.write(await queue.get())
+                await writer.drain()
+        finally:
+            self._subscribers.discard(queue)
+
+    def _response(self, request_id, ok, **fields):
+        response = {"ok": ok}
+        if request_id is not None:
+            response["id"] = request_id
+        response.update(fields)
+        return response
+
+    def _dispatch(self, command, arguments, request_id):
+        try:
+            handler = self._commands[command]
+        except KeyError:
+            return self._response(request_id, False, error=f"Unknown command: {command}")
+        try:
+            return self._response(request_id, True, result=handler(**arguments))
+        except (TypeError, ValueError, KeyError, RuntimeError) as e:
+            logging.warning("%s failed: %r", command, e)
+            return self._response(request_id, False, error=f"{command} failed: {e!r}")
+
+    def _command_snapshot(self):
+        return _snapshot(self._meter.snapshot)
+
+    def _command_status(self):
+        return {
+            "snapshot": _snapshot(self._meter.snapshot),
+            "pumps": {channel: pump.get_speed() for channel, pump in self._pumps.items()},
+            "power": {"capacity": global_budget.capacity, "headroom": global_budget.headroom()},
+            "telemetry": {channel: pump.telemetry._asdict() for channel, pump in self._pumps.items()},
+        }
+
+    def _command_dose(self, channel, speed, duration):
+        return self._pumps[channel].dose(speed, duration, blocking=False)
+
+    def _command_stop(self, channel):
+        self._pumps[channel].stop()
+
+    def _command_beep(self, frequency=440, timeout=0.1):
+        return self._piezo.beep(frequency, timeout, blocking=False)
+
+    def _command_history(self, channel, start, end=None, points=300):
+        times, minimum, mean, maximum = self._meter[channel].query_history(start, end, points)
+        return {"time": times, "min": minimum, "mean": mean, "max": maximum}
+
+
+def _claim_socket(path):
+    """Make way for the daemon's socket, removing one left behind by a daemon that did not shut down cleanly.
+
+    Raises RuntimeError if a daemon is still listening on it, rather than taking the
+    socket over and leaving two processes driving the hardware, or if the socket or
+    its directory belongs to another user.
+
+    """
+    directory = os.path.dirname(path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if directory:
+            # Only created private, an existing directory is left as it is
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        try:
+            probe.connect(path)
+        except FileNotFoundError:
+            return
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    except PermissionError as e:
+        raise RuntimeError(f"{path} belongs to another user, set GROW_SOCKET to a path of your own") from e
+    finally:
+        probe.close()
+    raise RuntimeError(f"Another grow daemon is already listening on {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Own the Grow HAT hardware and share it over a Unix socket.")
+    parser.add_argument("--socket", default=None, help=f"Path of the Unix socket, defaults to $GROW_SOCKET, $XDG_RUNTIME_DIR/grow.sock or {DEFAULT_SOCKET}")
+    parser.add_argument("--interval", type=float, default=1.0, help="Time, in seconds, between moisture samples")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    # Check before touching the hardware, which the running daemon owns
+    try:
+        _claim_socket(socket_path(args.socket))
+    except RuntimeError as e:
+        logging.error("%s", e)
+        return 1
+
+    daemon = GrowDaemon(args.socket, meter=MoistureArray(interval=args.interval, history_tiers=DEFAULT_TIERS))
+    logging.info("Listening on %s", daemon.path)
+    try:
+        asyncio.run(daemon.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import concurrent.futures
+import heapq
+import itertools
+import threading
+import time
+
+
+class _DoseRequest(object):
+    def __init__(self, channel, speed, duration, priority, deadline, ramp):
+        self.channel = channel
+        self.speed = speed
+        self.duration = duration
+        self.priority = priority
+        self.deadline = deadline
+        self.ramp = ramp
+        self.future = concurrent.futures.Future()
+
+
+class DoseScheduler(object):
+    """Queue of pump doses, run in priority order across channels."""
+
+    def __init__(self, pumps, concurrency=1, background=True):
+        """Create a new dose scheduler.
+
+        Doses are queued instead of being refused when another pump is running. The
+        highest priority dose whose pump is free starts as soon as there is room in the
+        concurrency budget, and its Future completes once the dose has been delivered.
+
+        Each dose also needs room in its pump's PowerBudget, so doses wait for running
+        pumps to free enough duty rather than being refused. Raise concurrency to let
+        doses at reduced speed run side by side within the budget.
+
+        :param pumps: dict of channel to grow.pump.Pump
+        :param concurrency: Maximum number of doses to run at the same time
+        :param background: If true, start a thread to run doses. Otherwise call run_pending() yourself.
+
+        """
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1")
+
+        self._pumps = dict(pumps)
+        self._concurrency = concurrency
+        self._queue = []
+        self._sequence = itertools.count()
+        # channel: (end time, request, Handle of the pump's stop)
+        self._running = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        if background:
+            self.start()
+
+    def submit(self, channel, speed, duration, priority=0, deadline=None, ramp=None):
+        """Queue a dose.
+
+        The returned Future resolves to True once the pump has stopped at the end of the dose,
+        or False if the deadline passed before it could start or the dose was stopped early or
+        replaced on the pump. If the pump raised an exception, the Future raises it too.
+        Cancel it to drop a dose that has not started.
+
+        :param channel: Pump channel
+        :param speed: Pump speed from 0.0 to 1.0
+        :param duration: Time, in seconds, to run the pump for
+        :param priority: Higher priority doses run first, doses of equal priority run in the order queued
+        :param deadline: time.time() after which the dose should no longer start, None to wait forever
+        :param ramp: Speed profile from grow.ramps, None to run at speed throughout
+        :returns: concurrent.futures.Future
+
+        """
+        if channel not in self._pumps:
+            raise ValueError(f"Channel must be one of {sorted(self._pumps)}")
+        if speed < 0 or speed > 1.0:
+            raise ValueError("Speed must be between 0 and 1")
+
+        request = _DoseRequest(channel, speed, duration, priority, deadline, ramp)
+        with self._condition:
+            heapq.heappush(self._queue, (-priority, next(self._sequence), request))
+            self._condition.notify()
+        return request.future
+
+    def pending(self, channel=None):
+        """Return the number of doses queued but not yet started.
+
+        :param channel: Only count doses for this channel, None for all channels
+
+        """
+        with self._condition:
+            return sum(1 for _, _, request in self._queue if channel is None or request.channel == channel)
+
+    def running(self):
+        """Return the channels with a dose in progress."""
+        with self._condition:
+            return tuple(self._running)
+
+    def run_pending(self, now=None):
+        """Finish doses that have run their time, then start as many queued doses as will fit.
+
+        :param now: Current time.time(), defaults to now
+        :returns: time.time() at which there is next something to do, or None if nothing is queued or running
+
+        """
+        now = time.time() if now is None else now
+        with self._condition:
+            times = []
+            for channel, (end, request, handle) in list(self._running.items()):
+                if handle is None or not handle.pending:
+                    # A stop that was cancelled means the dose was cut short or replaced on the pump
+                    del self._running[channel]
+                    request.future.set_result(handle is not None and not handle.cancelled)
+                else:
+                    # The pump stops itself on its own scheduler, so look again shortly if it is late
+                    times.append(max(end, now + 0.01))
+
+            # Expired and cancelled doses are dropped even while every slot is taken,
+            # a deadline left in the queue would otherwise wake the thread continuously
+            queue = []
+            for entry in self._queue:
+                request = entry[2]
+                if request.future.cancelled():
+                    continue
+                if request.deadline is not None and now > request.deadline:
+                    if request.future.set_running_or_notify_cancel():
+                        request.future.set_result(False)
+                    continue
+                queue.append(entry)
+            if len(queue) < len(self._queue):
+                heapq.heapify(queue)
+                self._queue = queue
+
+            waiting = []
+            while self._queue and len(self._running) < self._concurrency:
+                entry = heapq.heappop(self._queue)
+                request = entry[2]
+                # One dose per pump at a time, and only once the budget has room, counting pumps outside this scheduler
+                pump = self._pumps[request.channel]
+                if request.channel in self._running or pump.budget.headroom(request.channel) < request.speed - 1e-9:
+                    waiting.append(entry)
+                    continue
+                if not request.future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    accepted = pump.dose(request.speed, request.duration, blocking=False, ramp=request.ramp)
+                except Exception as e:
+                    # eg: the PWM backend failed, report it on the Future and carry on with the queue
+                    request.future.set_exception(e)
+                    continue
+                if accepted:
+                    self._running[request.channel] = (now + request.duration, request, pump.stop_handle)
+                    times.append(now + request.duration)
+                else:
+                    request.future.set_result(False)
+
+            for entry in waiting:
+                heapq.heappush(self._queue, entry)
+
+            times += [request.deadline for _, _, request in self._queue if request.deadline is not None and request.deadline > now]
+            if times:
+                return min(times)
+            return None
+
+    def start(self):
+        """Start the dosing thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the dosing thread. Doses already running are left to finish."""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            next_event = self.run_pending()
+            with self._condition:
+                if self._stop_event.is_set():
+                    break
+                timeout = None if next_event is None else max(0, next_event - time.time())
+                # Recheck regularly while doses wait on power used by pumps started outside this scheduler
+                if self._queue:
+                    timeout = 0.1 if timeout is None else min(timeout, 0.1)
+                self._condition.wait(timeout)
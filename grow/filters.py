@@ -0,0 +1,148 @@
+import bisect
+import collections
+
+
+class EMAFilter(object):
+    """Exponential moving average."""
+
+    def __init__(self, alpha=0.2):
+        """Create a new exponential moving average filter.
+
+        :param alpha: Weight, from 0.0 to 1.0, given to each new value. 2 / (N + 1) approximates an N sample average.
+
+        """
+        if alpha <= 0 or alpha > 1.0:
+            raise ValueError("Alpha must be greater than 0 and at most 1")
+
+        self._alpha = alpha
+        self._value = None
+
+    @property
+    def value(self):
+        """Return the filtered value, or None if no values have been seen."""
+        return self._value
+
+    def update(self, value):
+        """Add a new value and return the filtered value."""
+        if self._value is None:
+            self._value = value
+        else:
+            self._value += self._alpha * (value - self._value)
+        return self._value
+
+    def reset(self):
+        """Forget all previous values."""
+        self._value = None
+
+
+class MedianFilter(object):
+    """Rolling median with outlier rejection."""
+
+    def __init__(self, size=5, threshold=None):
+        """Create a new rolling median filter.
+
+        Values are kept in insertion order and in sorted order, so each update is
+        a binary search plus a list insert and removal.
+
+        :param size: Number of values to take the median of
+        :param threshold: Values further than this from the median are rejected. None to accept all values.
+
+        """
+        if size < 1:
+            raise ValueError("Size must be at least 1")
+
+        self._size = size
+        self._threshold = threshold
+        self._window = collections.deque()
+        self._sorted = []
+        self._rejected = 0
+        self._value = None
+
+    @property
+    def value(self):
+        """Return the filtered value, or None if no values have been seen."""
+        return self._value
+
+    @property
+    def rejected(self):
+        """Return the number of consecutive values rejected as outliers."""
+        return self._rejected
+
+    def update(self, value):
+        """Add a new value and return the filtered value."""
+        if self._threshold is not None and self._value is not None and abs(value - self._value) > self._threshold:
+            self._rejected += 1
+            if self._rejected < self._size:
+                return self._value
+            # A whole window of "outliers" is a real step change, start again from here
+            self.reset()
+
+        self._rejected = 0
+        self._window.append(value)
+        bisect.insort(self._sorted, value)
+
+        if len(self._window) > self._size:
+            oldest = self._window.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+
+        count = len(self._sorted)
+        middle = count // 2
+        if count % 2:
+            self._value = self._sorted[middle]
+        else:
+            self._value = (self._sorted[middle - 1] + self._sorted[middle]) / 2.0
+
+        return self._value
+
+    def reset(self):
+        """Forget all previous values."""
+        self._window.clear()
+        self._sorted = []
+        self._rejected = 0
+        self._value = None
+
+
+class KalmanFilter(object):
+    """One dimensional Kalman filter for a slowly drifting value."""
+
+    def __init__(self, process_variance=0.01, measurement_variance=1.0):
+        """Create a new Kalman filter.
+
+        The value is modelled as a random walk observed through noisy measurements.
+
+        :param process_variance: How much the true value is expected to change between updates
+        :param measurement_variance: How noisy each measurement is expected to be
+
+        """
+        self._process_variance = process_variance
+        self._measurement_variance = measurement_variance
+        self._value = None
+        self._variance = None
+
+    @property
+    def value(self):
+        """Return the filtered value, or None if no values have been seen."""
+        return self._value
+
+    @property
+    def variance(self):
+        """Return the estimated variance of the filtered value."""
+        return self._variance
+
+    def update(self, value):
+        """Add a new value and return the filtered value."""
+        if self._value is None:
+            self._value = value
+            self._variance = self._measurement_variance
+            return self._value
+
+        variance = self._variance + self._process_variance
+        gain = variance / (variance + self._measurement_variance)
+        self._value += gain * (value - self._value)
+        self._variance = (1.0 - gain) * variance
+        return self._value
+
+    def reset(self):
+        """Forget all previous values."""
+        self._value = None
+        self._variance = None
@@ -0,0 +1,461 @@
+import array
+import bisect
+import collections
+import math
+import mmap
+import os
+import struct
+import time
+
+HistoryTier = collections.namedtuple("HistoryTier", ("name", "resolution", "capacity"))
+
+# One hour of raw readings, a week of minutes and a year of hours
+DEFAULT_TIERS = (
+    HistoryTier("raw", 1, 60 * 60),
+    HistoryTier("minute", 60, 7 * 24 * 60),
+    HistoryTier("hour", 60 * 60, 365 * 24),
+)
+
+
+def downsample(times, minimum, mean, maximum, points, start=None, end=None):
+    """Aggregate timestamped entries into at most points equal-width buckets.
+
+    Each bucket keeps the lowest minimum and highest maximum of its entries, so short
+    spikes survive however far the data is reduced, and the mean of their means.
+    Buckets with no entries are left out.
+
+    :param times: Entry times, oldest first
+    :param minimum: Minimum of each entry
+    :param mean: Mean of each entry
+    :param maximum: Maximum of each entry
+    :param points: Maximum number of buckets to return, eg: the width of a graph in pixels
+    :param start: Start of the first bucket, leave as None for the first time
+    :param end: End of the last bucket, leave as None for the last time
+    :returns: tuple of lists of bucket start times, minimum, mean and maximum
+
+    """
+    if points < 1:
+        raise ValueError("Points must be at least 1")
+
+    if len(times) <= points:
+        return list(times), list(minimum), list(mean), list(maximum)
+
+    start = times[0] if start is None else start
+    end = times[-1] if end is None else end
+    width = (end - start) / points
+
+    result = ([], [], [], [])
+    bucket, count, total, lowest, highest = None, 0, 0.0, math.inf, -math.inf
+    for timestamp, low, average, high in zip(times, minimum, mean, maximum):
+        index = min(points - 1, int((timestamp - start) / width)) if width > 0 else 0
+        if index != bucket:
+            if bucket is not None:
+                _emit(result, start + bucket * width, lowest, total / count, highest)
+            bucket, count, total, lowest, highest = index, 0, 0.0, math.inf, -math.inf
+        count += 1
+        total += average
+        lowest = min(lowest, low)
+        highest = max(highest, high)
+
+    _emit(result, start + bucket * width, lowest, total / count, highest)
+    return result
+
+
+def _emit(result, timestamp, minimum, mean, maximum):
+    for values, value in zip(result, (timestamp, minimum, mean, maximum)):
+        values.append(value)
+
+
+class RingBuffer(object):
+    """Fixed-capacity ring buffer backed by a compact array."""
+
+    def __init__(self, capacity, typecode="f", storage=None, total=0):
+        """Create a new ring buffer.
+
+        Every value is stored twice, at its slot and again one capacity further on,
+        so the most recent values always sit in one contiguous run of storage.
+
+        Appends are O(1) and never move existing values.
+
+        :param capacity: Maximum number of values held, older values are overwritten
+        :param typecode: array typecode for storage, "f" for 32bit float, "d" for 64bit
+        :param storage: Optional writable buffer of 2 * capacity items to use instead of a new array, eg: a memoryview of an mmap
+        :param total: Number of values already appended to storage
+
+        """
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1")
+
+        self._capacity = capacity
+        self._typecode = typecode
+        if storage is None:
+            storage = array.array(typecode, bytes(array.array(typecode).itemsize * capacity * 2))
+        elif len(storage) != capacity * 2:
+            raise ValueError("Storage must hold exactly 2 * capacity items")
+        self._data = storage
+        self._total = total
+        # Number of appends started, runs one ahead of total while an append is in progress
+        self._pending = total
+
+    def __len__(self):
+        return min(self._total, self._capacity)
+
+    def __iter__(self):
+        return iter(self.latest())
+
+    @property
+    def capacity(self):
+        """Return the maximum number of values held."""
+        return self._capacity
+
+    @property
+    def total(self):
+        """Return the number of values ever appended."""
+        return self._total
+
+    def append(self, value):
+        """Append a value, overwriting the oldest if the buffer is full."""
+        index = self._total % self._capacity
+        self._pending = self._total + 1
+        self._data[index] = value
+        self._data[index + self._capacity] = value
+        self._total += 1
+
+    def clear(self):
+        """Discard all values."""
+        self._total = 0
+        self._pending = 0
+
+    def copy(self, end=None, count=None):
+        """Return a copy of the values appended before the end'th append, oldest first.
+
+        Safe to call while another thread appends. Any values overwritten during
+        the copy are dropped from the front of the result.
+
+        :param end: Value of total to copy up to, leave as None for the latest value
+        :param count: Maximum number of values to return, leave as None for all values
+
+        """
+        end = self._total if end is None else end
+        first = max(0, end - self._capacity)
+        if count is not None:
+            first = max(first, end - count)
+        stop = end % self._capacity + self._capacity
+        values = array.array(self._typecode)
+        values.frombytes(memoryview(self._data)[stop - (end - first):stop].cast("B"))
+
+        # The slot of a value is rewritten once the writer reaches value + capacity
+        overrun = self._pending - (first + self._capacity)
+        if overrun > 0:
+            del values[:overrun]
+
+        return values
+
+    def view(self, count=None):
+        """Return the last count values, oldest first.
+
+        The result is a memoryview onto the buffer itself, no values are copied.
+
+        :param count: Number of values to return, leave as None for all values
+
+        """
+        length = len(self)
+        count = length if count is None else max(0, min(count, length))
+        end = self._total % self._capacity + self._capacity
+        return memoryview(self._data)[end - count:end]
+
+    def latest(self, count=None):
+        """Return the last count values, newest first.
+
+        :param count: Number of values to return, leave as None for all values
+
+        """
+        return self.view(count)[::-1]
+
+
+class _Tier(object):
+    def __init__(self, tier, raw=False):
+        self.name, self.resolution, self.capacity = tier
+        self.times = RingBuffer(self.capacity, "d")
+        self.mean = RingBuffer(self.capacity)
+        if raw:
+            # Raw values are their own minimum and maximum
+            self.minimum = self.maximum = self.mean
+        else:
+            self.minimum = RingBuffer(self.capacity)
+            self.maximum = RingBuffer(self.capacity)
+        # Running aggregate of the bucket being filled
+        self.bucket = None
+        self.count = 0
+        self.sum = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+
+    def append(self, timestamp, minimum, mean, maximum):
+        if self.minimum is not self.mean:
+            self.minimum.append(minimum)
+            self.maximum.append(maximum)
+        self.mean.append(mean)
+        # Times go last, readers use their total as the number of complete entries
+        self.times.append(timestamp)
+
+
+class TieredHistory(object):
+    """Multi-resolution history with bounded memory."""
+
+    def __init__(self, tiers=DEFAULT_TIERS):
+        """Create a new tiered history.
+
+        The first tier stores every value. Each following tier stores the minimum, mean and
+        maximum of fixed-length buckets, rolled up from the tier before as each bucket closes.
+
+        Every tier is a fixed-size set of ring buffers, so memory use does not grow over time.
+
+        :param tiers: List of HistoryTier(name, resolution, capacity), finest first. Resolution is in seconds.
+
+        """
+        if not tiers:
+            raise ValueError("At least one tier is required")
+
+        self._tiers = [_Tier(tier, raw=index == 0) for index, tier in enumerate(tiers)]
+        self._names = {tier.name: tier for tier in self._tiers}
+
+    @property
+    def tiers(self):
+        """Return the HistoryTier of each tier, finest first."""
+        return tuple(HistoryTier(tier.name, tier.resolution, tier.capacity) for tier in self._tiers)
+
+    def append(self, timestamp, value):
+        """Add a new value and roll it up into any buckets that close.
+
+        :param timestamp: time.time() of the value, must not go backwards
+        :param value: Value to add
+
+        """
+        self._tiers[0].append(timestamp, value, value, value)
+        self._roll_up(1, timestamp, value, value, 1, value)
+
+    def _roll_up(self, index, timestamp, minimum, total, count, maximum):
+        if index >= len(self._tiers):
+            return
+
+        tier = self._tiers[index]
+        bucket = math.floor(timestamp / tier.resolution) * tier.resolution
+
+        if tier.bucket is not None and bucket != tier.bucket and tier.count:
+            low, mean, high, closed = tier.low, tier.sum / tier.count, tier.high, tier.bucket
+            tier.append(closed, low, mean, high)
+            self._roll_up(index + 1, closed, low, tier.sum, tier.count, high)
+            tier.count = 0
+            tier.sum = 0.0
+            tier.low = math.inf
+            tier.high = -math.inf
+
+        tier.bucket = bucket
+        tier.count += count
+        tier.sum += total
+        tier.low = min(tier.low, minimum)
+        tier.high = max(tier.high, maximum)
+
+    def select(self, span, points):
+        """Return the name of the finest tier that fits span into at most points entries.
+
+        Falls back to the coarsest tier if none fit.
+
+        :param span: Length of time, in seconds, to be shown
+        :param points: Maximum number of entries wanted, eg: the width of a graph in pixels
+
+        """
+        for tier in self._tiers:
+            if span / tier.resolution <= points and tier.resolution * tier.capacity >= span:
+                return tier.name
+        return self._tiers[-1].name
+
+    def covering(self, start):
+        """Return the name of the finest tier that still holds entries as far back as start.
+
+        Read the whole range from this tier and reduce it with downsample, rather than
+        picking a tier by resolution alone, which may have already discarded the range.
+
+        Falls back to the coarsest tier if none reach back that far.
+
+        :param start: Earliest time.time() wanted
+
+        """
+        for tier in self._tiers:
+            total = tier.times.total
+            # A tier that has never wrapped still holds everything it was given
+            if total <= tier.capacity:
+                return tier.name
+            if tier.times.view()[0] <= start:
+                return tier.name
+        return self._tiers[-1].name
+
+    def read(self, name, start=None, end=None, current=False):
+        """Return copies of a tier's entries between two times, oldest first.
+
+        Aggregated entries are timestamped with the start of their bucket.
+
+        :param name: Name of the tier to read
+        :param start: Earliest time.time() to include, leave as None for the oldest entry
+        :param end: Latest time.time() to include, leave as None for the newest entry
+        :param current: If true, include the bucket still being filled, so the newest readings are not left out
+        :returns: tuple of times, minimum, mean and maximum arrays
+
+        """
+        try:
+            tier = self._names[name]
+        except KeyError:
+            raise ValueError(f"Tier must be one of: {', '.join(self._names)}")
+
+        total = tier.times.total
+        times = tier.times.copy(total)
+        minimum = tier.minimum.copy(total, len(times))
+        mean = tier.mean.copy(total, len(times))
+        maximum = tier.maximum.copy(total, len(times))
+
+        # Entries overwritten during the copy are dropped from the front, line the arrays up again
+        length = min(len(times), len(minimum), len(mean), len(maximum))
+        times, minimum, mean, maximum = (values[len(values) - length:] for values in (times, minimum, mean, maximum))
+
+        first = bisect.bisect_left(times, start) if start is not None else 0
+        last = bisect.bisect_right(times, end) if end is not None else length
+        times, minimum, mean, maximum = times[first:last], minimum[first:last], mean[first:last], maximum[first:last]
+
+        if current and tier.minimum is not tier.mean:
+            # Read while the writer may be closing the bucket, so skip it unless it is newer than every entry and consistent
+            bucket, count, total, low, high = tier.bucket, tier.count, tier.sum, tier.low, tier.high
+            if (bucket is not None and count and low <= high
+                    and (not length or bucket > tier.times.view()[-1])
+                    and (start is None or bucket >= start) and (end is None or bucket <= end)):
+                for values, value in zip((times, minimum, mean, maximum), (bucket, low, total / count, high)):
+                    values.append(value)
+
+        return times, minimum, mean, maximum
+
+
+class HistoryFile(object):
+    """Memory-mapped, on-disk history of timestamped readings."""
+
+    MAGIC = b"GROWHIST"
+    VERSION = 1
+
+    # magic, version, capacity, total, wet point, dry point, created, updated
+    _HEADER = struct.Struct("<8sIIQdddd")
+    _HEADER_SIZE = 64
+    _TOTAL_OFFSET = 16
+    _CALIBRATION_OFFSET = 24
+    _UPDATED_OFFSET = 48
+
+    def __init__(self, path, capacity=24 * 60 * 60):
+        """Open, or create, a history file.
+
+        The file is a fixed-size ring of timestamps and values, laid out like RingBuffer,
+        behind a small header holding the write count, calibration and timestamps.
+
+        Appends write a few bytes into the mapping and leave it to the kernel to write dirty
+        pages back, so there is no bulk I/O. Reads are zero-copy views onto the mapping.
+
+        Data is stored in native byte order.
+
+        :param path: Path to the history file, one per channel
+        :param capacity: Number of readings to hold if the file is created. An existing file keeps its own capacity.
+
+        """
+        self._path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size == 0:
+                size = self._size(capacity)
+                os.ftruncate(fd, size)
+                self._mmap = mmap.mmap(fd, size)
+                now = time.time()
+                self._HEADER.pack_into(self._mmap, 0, self.MAGIC, self.VERSION, capacity, 0, math.nan, math.nan, now, now)
+            else:
+                self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, version, capacity, total, _, _, _, _ = self._HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC or version != self.VERSION or size != self._size(capacity):
+            self._mmap.close()
+            raise ValueError(f"{path} is not a compatible history file")
+
+        times_end = self._HEADER_SIZE + capacity * 2 * 8
+        view = memoryview(self._mmap)
+        times = view[self._HEADER_SIZE:times_end]
+        values = view[times_end:]
+        # Every view onto the mapping must be released before it can be closed
+        self._views = [view, times, values, times.cast("d"), values.cast("f")]
+        self._times = RingBuffer(capacity, "d", self._views[3], total)
+        self._values = RingBuffer(capacity, "f", self._views[4], total)
+
+    @classmethod
+    def _size(cls, capacity):
+        return cls._HEADER_SIZE + capacity * 2 * (8 + 4)
+
+    @property
+    def path(self):
+        """Return the path of the history file."""
+        return self._path
+
+    @property
+    def times(self):
+        """Return the RingBuffer of reading timestamps."""
+        return self._times
+
+    @property
+    def values(self):
+        """Return the RingBuffer of readings."""
+        return self._values
+
+    @property
+    def created(self):
+        """Return the time.time() at which the file was created."""
+        return self._HEADER.unpack_from(self._mmap, 0)[6]
+
+    @property
+    def updated(self):
+        """Return the time.time() of the last append."""
+        return self._HEADER.unpack_from(self._mmap, 0)[7]
+
+    @property
+    def calibration(self):
+        """Return the stored (wet_point, dry_point), either may be None if never stored."""
+        wet_point, dry_point = struct.unpack_from("<dd", self._mmap, self._CALIBRATION_OFFSET)
+        return (None if math.isnan(wet_point) else wet_point, None if math.isnan(dry_point) else dry_point)
+
+    @calibration.setter
+    def calibration(self, calibration):
+        wet_point, dry_point = (math.nan if value is None else value for value in calibration)
+        struct.pack_into("<dd", self._mmap, self._CALIBRATION_OFFSET, wet_point, dry_point)
+
+    def append(self, timestamp, value):
+        """Append a timestamped reading.
+
+        :param timestamp: time.time() of the reading
+        :param value: Reading to store
+
+        """
+        self._values.append(value)
+        self._times.append(timestamp)
+        # The header is written last, so a crash mid-append loses at most this reading
+        struct.pack_into("<Q", self._mmap, self._TOTAL_OFFSET, self._times.total)
+        struct.pack_into("<d", self._mmap, self._UPDATED_OFFSET, timestamp)
+
+    def flush(self):
+        """Ask the kernel to write the file back to disk now."""
+        self._mmap.flush()
+
+    def close(self):
+        """Flush and unmap the file.
+
+        The times and values buffers can no longer be used, and any views taken
+        from them, eg: with RingBuffer.view, must be released first.
+
+        """
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.flush()
+        self._mmap.close()
@@ -0,0 +1,169 @@
+import http.server
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Main loop frame time histogram buckets, in seconds, around the 100ms frame of a 10 FPS loop
+FRAME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_FAMILIES = (
+    ("grow_moisture_hz", "gauge", "Latest moisture reading in pulses per second"),
+    ("grow_moisture_saturation", "gauge", "Latest moisture reading as saturation from 0.0 to 1.0"),
+    ("grow_moisture_active", "gauge", "1 if the moisture sensor was producing valid readings at the latest reading"),
+    ("grow_moisture_stale", "gauge", "1 if the latest moisture reading was taken without any recent pulses"),
+    ("grow_moisture_reading_timestamp_seconds", "gauge", "Unix time of the latest moisture reading, subtract from time() for its age"),
+    ("grow_moisture_readings_total", "counter", "Number of moisture readings taken"),
+    ("grow_pump_doses_total", "counter", "Number of doses requested, by whether the pump accepted them"),
+    ("grow_pump_run_seconds_total", "counter", "Time the pump has been asked to run for by accepted doses"),
+    ("grow_pump_on_seconds_total", "counter", "Time the pump has spent running at any speed"),
+    ("grow_pump_duty_seconds_total", "counter", "Time the pump has spent running, weighted by speed"),
+    ("grow_pump_volume_ml_total", "counter", "Millilitres the pump has delivered, estimated from its calibrated flow model"),
+    ("grow_pump_aborted_doses_total", "counter", "Number of doses stopped before their time was up"),
+    ("grow_alarm", "gauge", "1 if the channel's alarm is raised"),
+)
+
+
+class Metrics(object):
+    """Prometheus metrics for Grow sensors, pumps and main loop timing."""
+
+    def __init__(self, frame_buckets=FRAME_BUCKETS):
+        """Create a new set of metrics.
+
+        Every value is updated as it changes, from sensor and pump listeners, so a
+        scrape only formats numbers already held and never touches the hardware.
+
+        :param frame_buckets: Upper bounds, in seconds, of the frame time histogram buckets
+
+        """
+        self._lock = threading.Lock()
+        # name: {formatted labels: value}, in the order they are rendered
+        self._series = {name: {} for name, _, _ in _FAMILIES}
+        self._frame_buckets = tuple(frame_buckets) + (math.inf,)
+        self._frame_counts = [0] * len(self._frame_buckets)
+        self._frame_sum = 0.0
+        self._frame_count = 0
+        self._pumps = ()
+
+    def _set(self, name, labels, value):
+        with self._lock:
+            self._series[name][labels] = value
+
+    def _inc(self, name, labels, amount=1):
+        with self._lock:
+            series = self._series[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def attach_moisture(self, channel, sensor):
+        """Track every new reading from a grow.moisture.Moisture sensor."""
+        labels = f'{{channel="{channel}"}}'
+
+        def listener(reading):
+            with self._lock:
+                self._series["grow_moisture_hz"][labels] = reading.moisture
+                self._series["grow_moisture_saturation"][labels] = reading.saturation
+                self._series["grow_moisture_active"][labels] = int(sensor.active)
+                self._series["grow_moisture_stale"][labels] = int(reading.stale)
+                self._series["grow_moisture_reading_timestamp_seconds"][labels] = reading.timestamp
+                readings = self._series["grow_moisture_readings_total"]
+                readings[labels] = readings.get(labels, 0) + 1
+
+        self._inc("grow_moisture_readings_total", labels, 0)
+        sensor.add_listener(listener)
+
+    def attach_pump(self, pump):
+        """Track every dose from a grow.pump.Pump, and its telemetry."""
+        def listener(dose):
+            result = "accepted" if dose.accepted else "rejected"
+            with self._lock:
+                doses = self._series["grow_pump_doses_total"]
+                labels = f'{{channel="{dose.channel}",result="{result}"}}'
+                doses[labels] = doses.get(labels, 0) + 1
+                if dose.accepted:
+                    run_seconds = self._series["grow_pump_run_seconds_total"]
+                    labels = f'{{channel="{dose.channel}"}}'
+                    run_seconds[labels] = run_seconds.get(labels, 0.0) + dose.duration
+
+        pump.add_listener(listener)
+        self._pumps += (pump,)
+
+    def set_alarm(self, channel, state):
+        """Record whether a channel's alarm is raised."""
+        self._set("grow_alarm", f'{{channel="{channel}"}}', int(state))
+
+    def observe_frame(self, duration):
+        """Add the time, in seconds, taken by one pass of a main loop."""
+        with self._lock:
+            for index, bound in enumerate(self._frame_buckets):
+                if duration <= bound:
+                    self._frame_counts[index] += 1
+                    break
+            self._frame_sum += duration
+            self._frame_count += 1
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            # Telemetry counts running time continuously, so take it at the time of the scrape
+            for pump in self._pumps:
+                telemetry = pump.telemetry
+                labels = f'{{channel="{pump.channel}"}}'
+                self._series["grow_pump_on_seconds_total"][labels] = telemetry.on_time
+                self._series["grow_pump_duty_seconds_total"][labels] = telemetry.duty_time
+                self._series["grow_pump_volume_ml_total"][labels] = telemetry.volume
+                self._series["grow_pump_aborted_doses_total"][labels] = telemetry.aborted
+
+            for name, kind, help in _FAMILIES:
+                series = self._series[name]
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series.items():
+                    lines.append(f"{name}{labels} {value}")
+
+            if self._frame_count:
+                lines.append("# HELP grow_frame_seconds Time taken by each pass of the main loop")
+                lines.append("# TYPE grow_frame_seconds histogram")
+                cumulative = 0
+                for bound, count in zip(self._frame_buckets, self._frame_counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f'grow_frame_seconds_bucket{{le="{le}"}} {cumulative}')
+                lines.append(f"grow_frame_seconds_sum {self._frame_sum}")
+                lines.append(f"grow_frame_seconds_count {self._frame_count}")
+
+        lines.append("")
+        return "\n".join(lines)
+
+    def serve(self, port=9100, address=""):
+        """Serve /metrics over HTTP from a background thread.
+
+        :param port: Port to listen on
+        :param address: Address to listen on, defaults to all interfaces
+        :returns: the http.server.ThreadingHTTPServer, call shutdown() on it to stop
+
+        """
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((address, port), Handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
@@ -1,43 +1,124 @@
+import asyncio
+import bisect
+import collections
+import math
+import threading
 import time
 
 import RPi.GPIO as GPIO
 
+from .history import RingBuffer, TieredHistory, downsample
+from .readings import ChannelReading, MoistureReading, MoistureSnapshot
+from .scheduler import default_scheduler
+from .stats import RollingStatistics, Statistics
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 MOISTURE_1_PIN = 23
 MOISTURE_2_PIN = 8
 MOISTURE_3_PIN = 25
 MOISTURE_INT_PIN = 4
 
+MODE_COUNT = "count"
+MODE_PERIOD = "period"
+
 
 class Moisture(object):
     """Grow moisture sensor driver."""
 
-    def __init__(self, channel=1, wet_point=None, dry_point=None):
+    def __init__(self, channel=1, wet_point=None, dry_point=None, history_length=200, capture=None, mode=MODE_COUNT, periods=8,
+                 timeout=3.0, window=1.0, filter=None, statistics_windows=None, history_tiers=None, history_file=None, scheduler=None):
         """Create a new moisture sensor.
 
         Uses an interrupt to count pulses on the GPIO pin corresponding to the selected channel.
 
+        Alternatively, pulses can be read in kernel-timestamped batches through a shared grow.capture.PulseCapture.
+
         The moisture reading is given as pulses per second.
 
+        In MODE_COUNT pulses are counted over a window of at least one second.
+        In MODE_PERIOD the reading is the reciprocal of the mean time between the last few pulses,
+        and is updated on every pulse. History is still recorded once per window in both modes.
+
+        If no pulses arrive for timeout seconds a timer closes the window anyway, so the reading
+        decays towards zero and is flagged as stale rather than holding its last value forever.
+
+        Each new reading is published as an immutable MoistureReading, swapped in with a single
+        assignment, so readers on other threads always see a consistent reading without locks.
+
+        An optional streaming filter from grow.filters, eg: EMAFilter, MedianFilter or KalmanFilter,
+        is updated once per new reading and exposed as filtered_moisture and filtered_saturation.
+
         :param channel: One of 1, 2 or 3. 4 can optionally be used to set up a sensor on the Int pin (BCM4)
         :param wet_point: Wet point in pulses/sec
         :param dry_point: Dry point in pulses/sec
+        :param history_length: Number of past readings to keep in history
+        :param capture: Optional grow.capture.PulseCapture to read pulses from instead of RPi.GPIO
+        :param mode: MODE_COUNT or MODE_PERIOD
+        :param periods: Number of pulse periods to average over in MODE_PERIOD
+        :param timeout: Time, in seconds, without pulses before a reading is stale. None to disable.
+        :param window: Minimum time, in seconds, of a counting window. None if windows are closed externally, eg: by MoistureArray.
+        :param filter: Optional streaming filter applied to each new reading in pulses/sec
+        :param statistics_windows: Optional list of window lengths, in seconds, to keep rolling statistics for, eg: (60, 3600, 86400)
+        :param history_tiers: Optional list of grow.history.HistoryTier to keep downsampled history in, eg: grow.history.DEFAULT_TIERS
+        :param history_file: Optional grow.history.HistoryFile to keep history and calibration in across restarts. Replaces history_length.
+        :param scheduler: grow.scheduler.Scheduler to run the timeout watchdog from, defaults to the shared scheduler
 
         """
-        self._gpio_pin = [MOISTURE_1_PIN, MOISTURE_2_PIN, MOISTURE_3_PIN, MOISTURE_INT_PIN][channel - 1]
+        if mode not in (MODE_COUNT, MODE_PERIOD):
+            raise ValueError("Mode must be one of MODE_COUNT or MODE_PERIOD")
 
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self._gpio_pin, GPIO.IN)
+        self._gpio_pin = [MOISTURE_1_PIN, MOISTURE_2_PIN, MOISTURE_3_PIN, MOISTURE_INT_PIN][channel - 1]
 
+        self._mode = mode
+        self._edges = collections.deque(maxlen=periods + 1)
         self._count = 0
-        self._reading = 0
-        self._history = []
-        self._history_length = 200
+        self._history_file = history_file
+        if history_file is not None:
+            self._history = history_file.values
+            stored_wet_point, stored_dry_point = history_file.calibration
+            wet_point = wet_point if wet_point is not None else stored_wet_point
+            dry_point = dry_point if dry_point is not None else stored_dry_point
+        else:
+            self._history = RingBuffer(history_length)
+        self._history_cache = None
+        self._tiers = TieredHistory(history_tiers) if history_tiers else None
+        self._filter = filter
+        self._statistics = {window: RollingStatistics(window) for window in (statistics_windows or ())}
+        self._listeners = ()
+        self._snapshot = MoistureReading(0, None, None, False, 0, self._history.total, 0)
+        self._consumed = 0
         self._last_pulse = time.time()
-        self._new_data = False
         self._wet_point = wet_point if wet_point is not None else 0.7
         self._dry_point = dry_point if dry_point is not None else 27.6
+        self._store_calibration()
+        self._snapshot = self._snapshot._replace(saturation=self._saturation(0))
         self._time_last_reading = time.time()
+        self._timeout = timeout
+        self._window = window
+        self._scheduler = scheduler if scheduler is not None else default_scheduler()
+        self._watchdog_timer = None
+        # Held while a window is counted or closed, the watchdog runs on another thread
+        self._window_lock = threading.Lock()
+
+        if capture is not None:
+            capture.register(self._gpio_pin, self._pulses)
+        else:
+            self._setup_gpio()
+
+        self._time_start = time.time()
+
+        if timeout is not None:
+            self._schedule_watchdog(timeout)
+
+    def _setup_gpio(self):
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self._gpio_pin, GPIO.IN)
+
         try:
             GPIO.add_event_detect(self._gpio_pin, GPIO.RISING, callback=self._event_handler, bouncetime=1)
         except RuntimeError as e:
@@ -52,30 +133,268 @@ dtoverlay=spi0-cs,cs0_pin=14 # Re-assign CS0 from BCM 8 so that Grow can use it
             else:
                 raise e
 
-        self._time_start = time.time()
-
     def _event_handler(self, pin):
-        self._count += 1
-        self._last_pulse = time.time()
-        if self._time_elapsed >= 1.0:
-            self._reading = self._count / self._time_elapsed
-            self._history.insert(0, self._reading)
-            self._history = self._history[:self._history_length]
-            self._count = 0
-            self._time_last_reading = time.time()
-            self._new_data = True
+        now = time.time()
+        with self._window_lock:
+            self._count += 1
+            self._last_pulse = now
+            if self._mode == MODE_PERIOD:
+                self._edges.append(now)
+                self._update_period()
+            if self._window is not None and now - self._time_last_reading >= self._window:
+                self._complete_reading(now)
+
+    def _pulses(self, timestamps):
+        """Count a batch of pulses from their timestamps, oldest first."""
+        with self._window_lock:
+            self._count_pulses(timestamps)
+
+    def _count_pulses(self, timestamps):
+        if self._mode == MODE_PERIOD:
+            self._edges.extend(timestamps)
+            self._update_period()
+
+        start = 0
+        total = len(timestamps)
+
+        if self._window is None:
+            self._count += total
+            start = total
+
+        while start < total:
+            # Find the first pulse that closes the current window
+            end = bisect.bisect_left(timestamps, self._time_last_reading + self._window, start)
+            if end == total:
+                self._count += end - start
+                break
+            self._count += end - start + 1
+            self._complete_reading(timestamps[end])
+            start = end + 1
+
+        self._last_pulse = timestamps[-1]
+
+    def _update_period(self):
+        elapsed = self._edges[-1] - self._edges[0]
+        if elapsed > 0:
+            self._publish((len(self._edges) - 1) / elapsed, self._edges[-1], False)
+
+    def _complete_reading(self, now):
+        # Swapped out in one step so a pulse can't land between the read and the reset
+        count, self._count = self._count, 0
+        if self._mode == MODE_COUNT:
+            reading = count / (now - self._time_last_reading)
+            self._close_window(now, reading)
+            self._publish(reading, now, False)
+        else:
+            # Period readings are published per pulse, the window only feeds history
+            snapshot = self._snapshot
+            self._close_window(now, snapshot.moisture)
+            self._publish(snapshot.moisture, snapshot.timestamp, snapshot.stale, notify=False)
+
+    def _close_window(self, now, reading):
+        if self._history_file is not None:
+            self._history_file.append(now, reading)
+        else:
+            self._history.append(reading)
+        for statistics in self._statistics.values():
+            statistics.update(now, reading)
+        if self._tiers is not None:
+            self._tiers.append(now, reading)
+        self._time_last_reading = now
+
+    def _publish(self, moisture, timestamp, stale, notify=True):
+        """Swap in a new MoistureReading.
+
+        :param notify: If true, bump the sequence number so readers see new data
+
+        """
+        snapshot = self._snapshot
+        if notify:
+            sequence = snapshot.sequence + 1
+            filtered = self._filter.update(moisture) if self._filter is not None else moisture
+        else:
+            sequence = snapshot.sequence
+            filtered = snapshot.filtered
+        snapshot = MoistureReading(moisture, self._saturation(moisture), timestamp, stale, sequence, self._history.total, filtered)
+        self._snapshot = snapshot
+
+        if notify:
+            for callback in self._listeners:
+                callback(snapshot)
+
+    def _schedule_watchdog(self, delay):
+        if self._watchdog_timer is not None:
+            self._watchdog_timer.cancel()
+        self._watchdog_timer = self._scheduler.call_later(delay, self._watchdog)
+
+    def _watchdog(self):
+        now = time.time()
+        with self._window_lock:
+            # Checked under the lock, a pulse may have closed the window meanwhile
+            if now - self._last_pulse >= self._timeout and now - self._time_last_reading >= self._timeout:
+                self._expire(now)
+        self._schedule_watchdog(max(0.1, self._time_last_reading + self._timeout - now))
+
+    def _expire(self, now):
+        """Close the current window when pulses have stopped arriving."""
+        count, self._count = self._count, 0
+        if self._mode == MODE_PERIOD:
+            # The true rate can be no higher than one pulse since the last edge
+            self._edges.clear()
+            reading = min(self._snapshot.moisture, 1.0 / (now - self._last_pulse))
+        else:
+            reading = count / (now - self._time_last_reading)
+        self._close_window(now, reading)
+        self._publish(reading, now, True)
 
     @property
     def history(self):
+        """Return past saturation readings, newest first.
+
+        The history matches the current snapshot. It is cached as a tuple and only
+        recalculated after a new reading or a change to the wet or dry point.
+
+        """
+        snapshot = self._snapshot
+        key = (snapshot.history_total, self._wet_point, self._dry_point)
+        cache = self._history_cache
+
+        if cache is None or cache[0] != key:
+            values = self._history.copy(snapshot.history_total)
+            cache = (key, tuple(self._to_saturation(memoryview(values)[::-1])))
+            self._history_cache = cache
+
+        return cache[1]
+
+    def raw_history(self, count=None):
+        """Return past raw moisture readings in pulses/sec, newest first.
+
+        The result is a memoryview onto the history buffer, no values are copied,
+        so it may include readings newer than the current snapshot.
+
+        :param count: Number of readings to return, leave as None for all readings
+
+        """
+        return self._history.latest(count)
+
+    @property
+    def tiered_history(self):
+        """Return the grow.history.TieredHistory of raw readings, or None if history_tiers was not set."""
+        return self._tiers
+
+    def history_tier(self, name, start=None, end=None, current=False):
+        """Return downsampled saturation history from one tier, oldest first.
+
+        Use query_history to pick a tier for a time range and reduce it to fit a graph or response.
+
+        :param name: Name of the tier, eg: "raw", "minute" or "hour"
+        :param start: Earliest time.time() to include, leave as None for the oldest entry
+        :param end: Latest time.time() to include, leave as None for the newest entry
+        :param current: If true, include the bucket still being filled
+        :returns: tuple of lists of times, minimum, mean and maximum saturation
+
+        """
+        if self._tiers is None:
+            raise RuntimeError("No history_tiers were configured")
+
+        times, minimum, mean, maximum = self._tiers.read(name, start, end, current)
+
+        # Saturation falls as pulses/sec rises, so the lowest reading is the highest saturation
+        lower = self._to_saturation(minimum)
+        upper = self._to_saturation(maximum)
+        minimum = [min(a, b) for a, b in zip(lower, upper)]
+        maximum = [max(a, b) for a, b in zip(lower, upper)]
+
+        return times.tolist(), minimum, self._to_saturation(mean), maximum
+
+    def query_history(self, start, end=None, points=300):
+        """Return saturation history between two times, downsampled to at most points entries.
+
+        Reads from the finest tier that still reaches back to start, including the bucket
+        it is filling, if history_tiers is set, otherwise from every reading in history_file.
+
+        :param start: Earliest time.time() to include
+        :param end: Latest time.time() to include, leave as None for now
+        :param points: Maximum number of entries to return, eg: the width of a graph in pixels
+        :returns: tuple of lists of times, minimum, mean and maximum saturation
+
+        """
+        end = time.time() if end is None else end
+
+        if self._tiers is not None:
+            times, minimum, mean, maximum = self.history_tier(self._tiers.covering(start), start, end, current=True)
+            return downsample(times, minimum, mean, maximum, points, start, end)
+
+        if self._history_file is None:
+            raise RuntimeError("No history_tiers or history_file were configured")
+
+        total = self._history_file.times.total
+        times = self._history_file.times.copy(total)
+        values = self._history_file.values.copy(total, len(times))
+
+        # Readings overwritten during the copy are dropped from the front, line them up again
+        length = min(len(times), len(values))
+        times, values = times[len(times) - length:], values[len(values) - length:]
+
+        first = bisect.bisect_left(times, start)
+        last = bisect.bisect_right(times, end)
+        times = times[first:last].tolist()
+        saturation = self._to_saturation(values[first:last])
+
+        return downsample(times, saturation, saturation, saturation, points, start, end)
+
+    def _to_saturation(self, values):
+        """Convert a buffer of raw readings to a list of saturation values."""
+        if numpy is not None:
+            values = numpy.asarray(values, dtype=numpy.float64)
+            saturation = numpy.round((values - self._dry_point) / self.range, 3)
+            return numpy.clip(saturation, 0.0, 1.0).tolist()
+
         history = []
 
-        for moisture in self._history:
+        for moisture in values:
             saturation = float(moisture - self._dry_point) / self.range
             saturation = round(saturation, 3)
             history.append(max(0.0, min(1.0, saturation)))
 
         return history
 
+    def statistics(self, window=None, raw=False):
+        """Return rolling statistics of recent readings.
+
+        Statistics are updated once per reading window, so this is cheap to call as often as you like.
+
+        Saturation statistics are converted from pulses/sec using the current wet and dry points.
+        Mean, minimum and maximum are clamped to 0.0 - 1.0, stddev and slope (in saturation per second) are not.
+
+        :param window: One of the statistics_windows, leave as None for the first
+        :param raw: If true, return statistics in pulses/sec rather than saturation
+
+        """
+        if not self._statistics:
+            raise RuntimeError("No statistics_windows were configured")
+
+        if window is None:
+            window = next(iter(self._statistics))
+
+        try:
+            result = self._statistics[window].result
+        except KeyError:
+            raise ValueError(f"Window must be one of: {', '.join(str(window) for window in self._statistics)}")
+
+        if raw or result.count == 0:
+            return result
+
+        lower, upper = sorted((self._saturation(result.minimum), self._saturation(result.maximum)))
+        return Statistics(
+            result.count,
+            self._saturation(result.mean),
+            lower,
+            upper,
+            result.stddev / abs(self.range),
+            result.slope / self.range,
+        )
+
     @property
     def _time_elapsed(self):
         return time.time() - self._time_last_reading
@@ -90,7 +409,8 @@ dtoverlay=spi0-cs,cs0_pin=14 # Re-assign CS0 from BCM 8 so that Grow can use it
         :param value: Wet point value to set in pulses/sec, leave as None to set the last sensor reading.
 
         """
-        self._wet_point = value if value is not None else self._reading
+        self._wet_point = value if value is not None else self._snapshot.moisture
+        self._store_calibration()
 
     def set_dry_point(self, value=None):
         """Set the sensor dry point.
@@ -102,7 +422,12 @@ dtoverlay=spi0-cs,cs0_pin=14 # Re-assign CS0 from BCM 8 so that Grow can use it
         :param value: Dry point value to set in pulses/sec, leave as None to set the last sensor reading.
 
         """
-        self._dry_point = value if value is not None else self._reading
+        self._dry_point = value if value is not None else self._snapshot.moisture
+        self._store_calibration()
+
+    def _store_calibration(self):
+        if self._history_file is not None:
+            self._history_file.calibration = (self._wet_point, self._dry_point)
 
     @property
     def moisture(self):
@@ -117,13 +442,116 @@ dtoverlay=spi0-cs,cs0_pin=14 # Re-assign CS0 from BCM 8 so that Grow can use it
         Fully dry (in air) is approximately 900 pulses/sec.
 
         """
-        self._new_data = False
-        return self._reading
+        snapshot = self._snapshot
+        self._consumed = snapshot.sequence
+        return snapshot.moisture
+
+    @property
+    def filtered_moisture(self):
+        """Return the filtered moisture level in pulses/sec.
+
+        This is the same as moisture if no filter is set, and does not clear new_data.
+
+        """
+        return self._snapshot.filtered
+
+    @property
+    def filtered_saturation(self):
+        """Return the filtered saturation as a float from 0.0 to 1.0.
+
+        This is the same as saturation if no filter is set, and does not clear new_data.
+
+        """
+        return self._saturation(self._snapshot.filtered)
+
+    @property
+    def snapshot(self):
+        """Return the current MoistureReading.
+
+        Unlike moisture and saturation, this does not clear new_data.
+
+        """
+        return self._snapshot
+
+    def add_listener(self, callback):
+        """Call callback with each new MoistureReading.
+
+        Callbacks run on the thread that takes the reading, eg: the RPi.GPIO callback thread,
+        so they must be quick and must not block. Hand the reading off to another thread
+        or event loop for any real work.
+
+        :param callback: Function that takes a MoistureReading
+
+        """
+        self._listeners += (callback,)
+
+    def remove_listener(self, callback):
+        """Stop calling a callback added with add_listener."""
+        self._listeners = tuple(listener for listener in self._listeners if listener != callback)
+
+    def subscribe(self):
+        """Return a MoistureSubscription with its own new_data flag.
+
+        Use one subscription per reader when several parts of a program need to know about each new reading.
+
+        """
+        return MoistureSubscription(self)
+
+    async def next_reading(self):
+        """Wait for, and return, the next new MoistureReading.
+
+        Must be awaited from a running asyncio event loop.
+
+        """
+        return await _next_event(self)
+
+    def readings(self, maxsize=16):
+        """Return an AsyncReadings that yields every new MoistureReading.
+
+        async for reading in moisture1.readings():
+            print(reading.saturation)
+
+        :param maxsize: Number of unread readings to queue before the oldest is dropped
+
+        """
+        return AsyncReadings(self, maxsize)
 
     @property
     def active(self):
         """Check if the moisture sensor is producing a valid reading."""
-        return (time.time() - self._last_pulse) < 1.0 and self._reading > 0 and self._reading < 28
+        reading = self._snapshot.moisture
+        return (time.time() - self._last_pulse) < 1.0 and reading > 0 and reading < 28
+
+    @property
+    def timestamp(self):
+        """Return the time.time() at which the current reading was taken.
+
+        Returns None if no reading has been taken yet.
+
+        """
+        return self._snapshot.timestamp
+
+    @property
+    def age(self):
+        """Return the age, in seconds, of the current reading.
+
+        Returns infinity if no reading has been taken yet.
+
+        """
+        timestamp = self._snapshot.timestamp
+        if timestamp is None:
+            return math.inf
+        return time.time() - timestamp
+
+    @property
+    def stale(self):
+        """Check if the current reading is stale.
+
+        Returns True if no reading has been taken yet, or if pulses have stopped for longer than the timeout.
+
+        """
+        snapshot = self._snapshot
+        return snapshot.timestamp is None or snapshot.stale
 
     @property
     def new_data(self):
@@ -132,7 +560,7 @@ dtoverlay=spi0-cs,cs0_pin=14 # Re-assign CS0 from BCM 8 so that Grow can use it
         Returns True if moisture value has been updated since last reading moisture or saturation.
 
         """
-        return self._new_data
+        return self._snapshot.sequence != self._consumed
 
     @property
     def range(self):
@@ -146,6 +574,317 @@ dtoverlay=spi0-cs,cs0_pin=14 # Re-assign CS0 from BCM 8 so that Grow can use it
         This value is calculated using the wet and dry points.
 
         """
-        saturation = float(self.moisture - self._dry_point) / self.range
+        return self._saturation(self.moisture)
+
+    def _saturation(self, moisture):
+        saturation = float(moisture - self._dry_point) / self.range
         saturation = round(saturation, 3)
         return max(0.0, min(1.0, saturation))
+
+
+class MoistureSubscription(object):
+    """Consume-once notification of new moisture readings."""
+
+    def __init__(self, sensor):
+        """Create a new subscription.
+
+        Each subscription tracks the last reading it consumed, so any number of readers
+        can watch the same sensor without stealing each other's new_data.
+
+        :param sensor: Moisture instance to watch
+
+        """
+        self._sensor = sensor
+        self._sequence = sensor.snapshot.sequence
+
+    @property
+    def new_data(self):
+        """Check if there is a reading this subscription has not yet read."""
+        return self._sensor.snapshot.sequence != self._sequence
+
+    def read(self):
+        """Return the current MoistureReading and mark it as read."""
+        snapshot = self._sensor.snapshot
+        self._sequence = snapshot.sequence
+        return snapshot
+
+
+_CLOSED = object()
+
+
+def put_latest(queue, item):
+    """Put item on an asyncio.Queue, dropping the oldest item if it is full.
+
+    Used to fan out to several readers, so a slow reader skips old items
+    rather than holding up everyone else.
+
+    :param queue: asyncio.Queue with a maxsize
+    :param item: Item to put on the queue
+    :returns: True if an older item was dropped to make room
+
+    """
+    dropped = queue.full()
+    if dropped:
+        queue.get_nowait()
+    queue.put_nowait(item)
+    return dropped
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+async def _next_event(source):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def listener(event):
+        loop.call_soon_threadsafe(_set_result, future, event)
+
+    source.add_listener(listener)
+    try:
+        return await future
+    finally:
+        source.remove_listener(listener)
+
+
+class AsyncReadings(object):
+    """Async iterator over new readings from Moisture or MoistureArray."""
+
+    def __init__(self, source, maxsize=16):
+        """Start queueing new readings for an asyncio event loop.
+
+        Readings are passed from the sampling thread to the event loop with
+        loop.call_soon_threadsafe, so no thread is needed per reader.
+
+        If the reader falls behind, the oldest queued reading is dropped to make room,
+        so a slow reader always catches up to the latest readings.
+
+        Must be created from a running asyncio event loop. Call close(), or use
+        "async with", to stop queueing readings.
+
+        :param source: Moisture or MoistureArray to read from
+        :param maxsize: Number of unread readings to queue before the oldest is dropped
+
+        """
+        if maxsize < 1:
+            raise ValueError("Maxsize must be at least 1")
+
+        self._source = source
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+        self._dropped = 0
+        self._closed = False
+        source.add_listener(self._listener)
+
+    @property
+    def dropped(self):
+        """Return the number of readings dropped because the reader fell behind."""
+        return self._dropped
+
+    def _listener(self, reading):
+        try:
+            self._loop.call_soon_threadsafe(self._put, reading)
+        except RuntimeError:
+            # The event loop has been closed without closing this iterator
+            self._closed = True
+            self._source.remove_listener(self._listener)
+
+    def _put(self, reading):
+        if put_latest(self._queue, reading):
+            self._dropped += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        reading = await self._queue.get()
+        if reading is _CLOSED:
+            raise StopAsyncIteration
+        return reading
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stop queueing new readings, readers waiting for one stop iterating."""
+        if not self._closed:
+            self._closed = True
+            self._source.remove_listener(self._listener)
+            # Wake any reader waiting on an empty queue
+            if not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._put, _CLOSED)
+
+
+class MoistureArray(object):
+    """Grow moisture sensors sampled together."""
+
+    def __init__(self, channels=(1, 2, 3), wet_points=None, dry_points=None, interval=1.0, capture=None, timeout=3.0, background=True, **kwargs):
+        """Create a set of moisture sensors that share one sampling thread.
+
+        Every channel closes its counting window at the same moment, on a boundary aligned
+        to interval, and the readings are published together as one immutable snapshot.
+
+        :param channels: Channels to sample, any of 1, 2, 3 or 4
+        :param wet_points: Optional list of wet points in pulses/sec, one per channel
+        :param dry_points: Optional list of dry points in pulses/sec, one per channel
+        :param interval: Time, in seconds, between samples
+        :param capture: Optional grow.capture.PulseCapture, created with background=False, to be polled by the sampling thread
+        :param timeout: Time, in seconds, without pulses before a channel is stale
+        :param background: If true, start the sampling thread. Otherwise call sample() yourself.
+        :param kwargs: Passed on to each Moisture, eg: history_length or mode
+
+        """
+        if capture is not None and capture.background:
+            raise ValueError("PulseCapture must be created with background=False")
+
+        wet_points = wet_points if wet_points is not None else [None] * len(channels)
+        dry_points = dry_points if dry_points is not None else [None] * len(channels)
+
+        self._channels = tuple(channels)
+        self._sensors = {
+            channel: Moisture(channel, wet_point=wet_point, dry_point=dry_point, capture=capture, timeout=None, window=None, **kwargs)
+            for channel, wet_point, dry_point in zip(channels, wet_points, dry_points)
+        }
+        self._interval = interval
+        self._capture = capture
+        self._timeout = timeout
+        self._poll_interval = 0.1
+        self._snapshot = self._build_snapshot(None)
+        self._listeners = ()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        if background:
+            self.start()
+
+    def __getitem__(self, channel):
+        """Return the Moisture instance for a channel, eg: to set its wet or dry point."""
+        return self._sensors[channel]
+
+    def __iter__(self):
+        return (self._sensors[channel] for channel in self._channels)
+
+    def __len__(self):
+        return len(self._channels)
+
+    @property
+    def channels(self):
+        """Return the sampled channel numbers."""
+        return self._channels
+
+    @property
+    def snapshot(self):
+        """Return the latest MoistureSnapshot.
+
+        All readings in a snapshot come from the same sampling window.
+
+        """
+        return self._snapshot
+
+    def sample(self, now=None):
+        """Close the current window on every channel and publish a new snapshot.
+
+        :param now: time.time() at which to close the window, defaults to now
+
+        """
+        if self._capture is not None:
+            self._capture.poll(0)
+
+        now = time.time() if now is None else now
+
+        for sensor in self._sensors.values():
+            with sensor._window_lock:
+                if self._timeout is not None and now - sensor._last_pulse >= self._timeout:
+                    sensor._expire(now)
+                else:
+                    sensor._complete_reading(now)
+
+        snapshot = self._build_snapshot(now)
+        self._snapshot = snapshot
+        for callback in self._listeners:
+            callback(snapshot)
+        return snapshot
+
+    def add_listener(self, callback):
+        """Call callback with each new MoistureSnapshot.
+
+        Callbacks run on the sampling thread and must not block.
+
+        :param callback: Function that takes a MoistureSnapshot
+
+        """
+        self._listeners += (callback,)
+
+    def remove_listener(self, callback):
+        """Stop calling a callback added with add_listener."""
+        self._listeners = tuple(listener for listener in self._listeners if listener != callback)
+
+    async def next_snapshot(self):
+        """Wait for, and return, the next MoistureSnapshot.
+
+        Must be awaited from a running asyncio event loop.
+
+        """
+        return await _next_event(self)
+
+    def snapshots(self, maxsize=16):
+        """Return an AsyncReadings that yields every new MoistureSnapshot.
+
+        :param maxsize: Number of unread snapshots to queue before the oldest is dropped
+
+        """
+        return AsyncReadings(self, maxsize)
+
+    def start(self):
+        """Start the sampling thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the sampling thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _build_snapshot(self, now):
+        readings = []
+        for channel in self._channels:
+            sensor = self._sensors[channel]
+            snapshot = sensor.snapshot
+            readings.append(ChannelReading(
+                channel,
+                snapshot.moisture,
+                sensor._saturation(snapshot.moisture),
+                sensor.active,
+                snapshot.timestamp is None or snapshot.stale,
+                snapshot.timestamp,
+            ))
+        return MoistureSnapshot(now, tuple(readings))
+
+    def _next_sample(self, now):
+        return (math.floor(now / self._interval) + 1) * self._interval
+
+    def _run(self):
+        next_sample = self._next_sample(time.time())
+        while True:
+            remaining = max(0, next_sample - time.time())
+            if self._capture is not None:
+                remaining = min(remaining, self._poll_interval)
+            if self._stop_event.wait(remaining):
+                break
+            if time.time() >= next_sample:
+                self.sample()
+                next_sample = self._next_sample(time.time())
+            elif self._capture is not None:
+                self._capture.poll(0)
@@ -0,0 +1,75 @@
+import atexit
+import time
+
+from .pwm import create_pwm
+from .scheduler import default_scheduler
+
+
+class Piezo():
+    def __init__(self, gpio_pin=13, scheduler=None, pwm=None):
+        """Create a new piezo.
+
+        BCM 13 can be driven by hardware PWM, see grow.pwm.SysfsPWM.
+
+        :param gpio_pin: BCM pin the piezo is connected to
+        :param scheduler: grow.scheduler.Scheduler to stop non-blocking beeps from, defaults to the shared scheduler
+        :param pwm: PWM backend name or class, see grow.pwm.create_pwm
+
+        """
+        self.pwm = create_pwm(gpio_pin, 440, pwm)
+        self._scheduler = scheduler if scheduler is not None else default_scheduler()
+        self._timeout = None
+        atexit.register(self._exit)
+
+    def frequency(self, value):
+        """Change the piezo frequency.
+
+        Loosely corresponds to musical pitch, if you suspend disbelief.
+
+        """
+        self.pwm.set_frequency(value)
+
+    def start(self, frequency=None):
+        """Start the piezo.
+
+        Sets the Duty Cycle to 100%
+
+        """
+        if frequency is not None:
+            self.frequency(frequency)
+        self.pwm.set_duty_cycle(1)
+
+    def stop(self):
+        """Stop the piezo.
+
+        Sets the Duty Cycle to 0%
+
+        """
+        self.pwm.set_duty_cycle(0)
+
+    def beep(self, frequency=440, timeout=0.1, blocking=True, force=False):
+        """Beep the piezo for time seconds.
+
+        :param freq: Frequency, in hertz, of the piezo
+        :param timeout: Time, in seconds, of the piezo beep
+        :param blocking: If true, function will block until piezo has stopped
+
+        """
+        if blocking:
+            self.start(frequency=frequency)
+            time.sleep(timeout)
+            self.stop()
+            return True
+        else:
+            if self._timeout is not None:
+                if self._timeout.pending:
+                    if force:
+                        self._timeout.cancel()
+                    else:
+                        return False
+            self.start(frequency=frequency)
+            self._timeout = self._scheduler.call_later(timeout, self.stop)
+            return True
+
+    def _exit(self):
+        self.pwm.close()
@@ -1,8 +1,14 @@
 import atexit
+import collections
+import json
+import logging
+import os
 import threading
 import time
 
-import RPi.GPIO as GPIO
+from .pwm import create_pwm
+from .readings import PumpTelemetry
+from .scheduler import default_scheduler
 
 PUMP_1_PIN = 17
 PUMP_2_PIN = 27
@@ -10,52 +16,454 @@ PUMP_3_PIN = 22
 PUMP_PWM_FREQ = 10000
 PUMP_MAX_DUTY = 90
 
+# Duty units the supply can power at once, where one unit is one pump at full speed
+POWER_BUDGET = 1.0
 
-global_lock = threading.Lock()
+Dose = collections.namedtuple("Dose", ("channel", "speed", "duration", "accepted", "timestamp"))
+
+FlowSample = collections.namedtuple("FlowSample", ("speed", "duration", "volume"))
+
+# Time, in seconds, between saves of a pump's telemetry_file
+TELEMETRY_SAVE_INTERVAL = 60.0
+
+# Flow models are saved here, one file per channel, unless another path is given
+FLOW_MODEL_DIRECTORY = os.path.expanduser("~/.config/grow")
+
+
+def flow_model_path(channel, directory=None):
+    """Return the path a channel's FlowModel is saved to by default."""
+    return os.path.join(directory if directory is not None else FLOW_MODEL_DIRECTORY, f"pump-{channel}-flow.json")
+
+
+def telemetry_path(channel, directory=None):
+    """Return the path a channel's telemetry is saved to by default."""
+    return os.path.join(directory if directory is not None else FLOW_MODEL_DIRECTORY, f"pump-{channel}-telemetry.json")
+
+
+def load_telemetry(path):
+    """Load PumpTelemetry saved by a Pump, or return zeroed telemetry if there is none or it is unreadable."""
+    try:
+        with open(path) as file:
+            return PumpTelemetry(**json.load(file))
+    except FileNotFoundError:
+        pass
+    except (ValueError, TypeError):
+        # Truncated by a power cut, or not telemetry at all, don't let it stop the pump from starting
+        logging.warning("%s is not valid pump telemetry, starting from zero", path)
+    return PumpTelemetry(0.0, 0.0, 0.0, 0, 0, 0)
+
+
+class FlowModel(object):
+    """Pump flow rate, in millilitres per second, as a function of speed."""
+
+    VERSION = 1
+
+    def __init__(self, samples=(), path=None):
+        """Create a new flow model.
+
+        Flow rate is fitted as a straight line against speed, by least squares over every
+        calibration run. Below the speed at which the line crosses zero the pump cannot lift
+        water at all. With runs at only one speed the line is taken through zero.
+
+        :param samples: Calibration runs as FlowSample(speed, duration, volume)
+        :param path: Path of a JSON file to save the model to, see load and save
+
+        """
+        self._path = path
+        self._samples = []
+        self._slope = None
+        self._intercept = 0.0
+        for sample in samples:
+            self.add_sample(*sample, save=False)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save, or return an empty model that will save to path.
+
+        Raises ValueError if the file is not a flow model this version can read.
+
+        """
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return cls(path=path)
+
+        try:
+            if data["version"] != cls.VERSION:
+                raise ValueError("Unsupported version")
+            return cls([FlowSample(*sample) for sample in data["samples"]], path=path)
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"{path} is not a compatible flow model") from e
+
+    def save(self, path=None):
+        """Save the model as JSON, replacing any previous file in one step.
+
+        :param path: Path to save to, defaults to the path the model was loaded from
+
+        """
+        path = path if path is not None else self._path
+        if path is None:
+            raise ValueError("No path to save the flow model to")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"version": self.VERSION, "samples": [list(sample) for sample in self._samples]}, file)
+        os.replace(temporary, path)
+
+    @property
+    def samples(self):
+        """Return the calibration runs the model is fitted to."""
+        return tuple(self._samples)
+
+    @property
+    def calibrated(self):
+        """Return True if the model has at least one calibration run."""
+        return self._slope is not None
+
+    @property
+    def minimum_speed(self):
+        """Return the lowest speed that moves any water."""
+        if self._slope is None or self._intercept >= 0:
+            return 0.0
+        return min(1.0, -self._intercept / self._slope)
+
+    def add_sample(self, speed, duration, volume, save=True):
+        """Add a calibration run and refit the model.
+
+        :param speed: Pump speed from 0.0 to 1.0
+        :param duration: Time, in seconds, the pump ran for
+        :param volume: Millilitres of water delivered
+        :param save: If true, and the model has a path, save it
+
+        """
+        if speed <= 0 or speed > 1.0:
+            raise ValueError("Speed must be greater than 0 and at most 1")
+        if duration <= 0:
+            raise ValueError("Duration must be greater than 0")
+        if volume < 0:
+            raise ValueError("Volume must not be negative")
+
+        self._samples.append(FlowSample(speed, duration, volume))
+        self._fit()
+
+        if save and self._path is not None:
+            self.save()
+
+    def _fit(self):
+        # Longer runs give a more accurate rate, so each is weighted by its duration
+        weight = sum(sample.duration for sample in self._samples)
+        mean_speed = sum(sample.speed * sample.duration for sample in self._samples) / weight
+        mean_rate = sum(sample.volume for sample in self._samples) / weight
+        spread = sum(sample.duration * (sample.speed - mean_speed) ** 2 for sample in self._samples)
+
+        if spread > 1e-9:
+            self._slope = sum(sample.duration * (sample.speed - mean_speed) * (sample.volume / sample.duration - mean_rate)
+                              for sample in self._samples) / spread
+            self._intercept = mean_rate - self._slope * mean_speed
+        if spread <= 1e-9 or self._slope <= 0:
+            # Every run at one speed, or too noisy to show flow rising with speed
+            self._slope = mean_rate / mean_speed
+            self._intercept = 0.0
+
+    def rate(self, speed):
+        """Return the expected flow rate, in millilitres per second, at speed."""
+        if self._slope is None:
+            raise RuntimeError("Flow model has no calibration runs")
+        return max(0.0, self._slope * speed + self._intercept)
+
+    def plan(self, volume, speed=None):
+        """Return the (speed, duration) that delivers volume millilitres.
+
+        :param volume: Millilitres of water to deliver
+        :param speed: Pump speed to use, defaults to the fastest calibrated speed
+
+        """
+        if volume <= 0:
+            raise ValueError("Volume must be greater than 0")
+        if self._slope is None:
+            raise RuntimeError("Flow model has no calibration runs")
+        if speed is None:
+            speed = max(sample.speed for sample in self._samples)
+
+        rate = self.rate(speed)
+        if rate <= 0:
+            raise ValueError(f"Speed {speed:.2f} is too slow to move any water, use at least {self.minimum_speed:.2f}")
+
+        return speed, volume / rate
+
+
+class PowerBudget(object):
+    """Share of the supply reserved by each running pump."""
+
+    def __init__(self, capacity=POWER_BUDGET):
+        """Create a new power budget.
+
+        A pump reserves its speed in duty units while it runs, so with the default capacity
+        of one unit either one pump runs at full speed or, eg: two run at half speed.
+
+        :param capacity: Total duty units, raise this if the supply can run more than one pump flat out
+
+        """
+        if capacity <= 0:
+            raise ValueError("Capacity must be greater than 0")
+        self._capacity = capacity
+        self._reservations = {}
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        """Return the total duty units."""
+        return self._capacity
+
+    @capacity.setter
+    def capacity(self, capacity):
+        """Change the total duty units, reservations already made are kept."""
+        if capacity <= 0:
+            raise ValueError("Capacity must be greater than 0")
+        self._capacity = capacity
+
+    def reserve(self, channel, units):
+        """Reserve duty units for a channel, replacing any reservation it already has.
+
+        :param channel: Pump channel
+        :param units: Duty units, the pump's speed from 0.0 to 1.0
+        :returns: False, and leaves the reservation unchanged, if there is not enough headroom
+
+        """
+        with self._lock:
+            others = sum(reserved for reserved_channel, reserved in self._reservations.items() if reserved_channel != channel)
+            # Allow for rounding, so eg: ten pumps at 0.1 fit a capacity of 1.0
+            if others + units > self._capacity + 1e-9:
+                return False
+            self._reservations[channel] = units
+            return True
+
+    def release(self, channel):
+        """Release a channel's reservation, if it has one."""
+        with self._lock:
+            self._reservations.pop(channel, None)
+
+    def reserved(self, channel=None):
+        """Return the duty units reserved by a channel, or by every channel if channel is None."""
+        with self._lock:
+            if channel is not None:
+                return self._reservations.get(channel, 0.0)
+            return sum(self._reservations.values())
+
+    def reservations(self):
+        """Return a dict of channel to reserved duty units."""
+        with self._lock:
+            return dict(self._reservations)
+
+    def headroom(self, channel=None):
+        """Return the duty units still free.
+
+        :param channel: Count this channel's own reservation as free, ie: the most it could change its speed to
+
+        """
+        with self._lock:
+            reserved = sum(units for reserved_channel, units in self._reservations.items() if reserved_channel != channel)
+            return max(0.0, self._capacity - reserved)
+
+
+# Shared by every Pump unless another budget is given
+global_budget = PowerBudget()
 
 
 class Pump(object):
     """Grow pump driver."""
 
-    def __init__(self, channel=1):
+    def __init__(self, channel=1, scheduler=None, flow_model=None, pwm=None, budget=None, telemetry_file=None,
+                 telemetry_interval=TELEMETRY_SAVE_INTERVAL):
         """Create a new pump.
 
-        Uses soft PWM to drive a Grow pump.
+        Uses soft PWM to drive a Grow pump. Soft PWM at PUMP_PWM_FREQ costs CPU time that
+        moisture counting needs, so pass pwm="pigpio" if the pigpio daemon is running.
 
         :param channel: One of 1, 2 or 3.
+        :param scheduler: grow.scheduler.Scheduler to stop non-blocking doses from, defaults to the shared scheduler
+        :param flow_model: FlowModel for dose_volume, defaults to the model saved for this channel, if any
+        :param pwm: PWM backend name or class, see grow.pwm.create_pwm
+        :param budget: PowerBudget to reserve duty from while running, defaults to global_budget
+        :param telemetry_file: Path of a JSON file to keep telemetry in across restarts, eg: telemetry_path(channel), None to keep it in memory only
+        :param telemetry_interval: Time, in seconds, between saves of telemetry_file from a background thread, it is also saved at exit
 
         """
 
+        self._channel = channel
         self._gpio_pin = [PUMP_1_PIN, PUMP_2_PIN, PUMP_3_PIN][channel - 1]
 
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-        GPIO.setup(self._gpio_pin, GPIO.OUT, initial=GPIO.LOW)
-        self._pwm = GPIO.PWM(self._gpio_pin, PUMP_PWM_FREQ)
-        self._pwm.start(0)
+        self._pwm = create_pwm(self._gpio_pin, PUMP_PWM_FREQ, pwm)
+        self._speed = 0
+        self._budget = budget if budget is not None else global_budget
 
+        self._scheduler = scheduler if scheduler is not None else default_scheduler()
+        self._flow_model = flow_model
+        self._flow_model_error = None
+        if flow_model is None:
+            # Loaded up front, a bad file must not surface later on the scheduler thread as a pump stops
+            try:
+                self._flow_model = FlowModel.load(flow_model_path(channel))
+            except ValueError as e:
+                logging.warning("%s, pump %d will not count volume", e, channel)
+                self._flow_model_error = str(e)
         self._timeout = None
+        # Handles of the speed changes still to come in a ramped dose
+        self._steps = ()
+        self._finished = threading.Event()
+        self._listeners = ()
+
+        self._telemetry_file = telemetry_file
+        self._telemetry = load_telemetry(telemetry_file) if telemetry_file is not None else PumpTelemetry(0.0, 0.0, 0.0, 0, 0, 0)
+        self._telemetry_lock = threading.Lock()
+        # Scheduler time of the last speed change, for counting the time run since
+        self._changed = None
+        self._closed = threading.Event()
+        if telemetry_file is not None:
+            # Saved from its own thread, so stops on the scheduler thread never wait on the SD card
+            threading.Thread(target=self._save_telemetry_periodically, args=(telemetry_interval,), daemon=True).start()
 
         atexit.register(self._stop)
 
     def _stop(self):
-        self._pwm.stop(0)
-        GPIO.setup(self._gpio_pin, GPIO.IN)
+        self._closed.set()
+        self._pwm.close()
+        if self._telemetry_file is not None:
+            self.save_telemetry()
+
+    def _save_telemetry_periodically(self, interval):
+        saved = self._telemetry
+        while not self._closed.wait(interval):
+            telemetry = self.telemetry
+            if telemetry == saved:
+                continue
+            try:
+                self.save_telemetry()
+                saved = telemetry
+            except OSError:
+                logging.exception("Saving pump %d telemetry to %s failed", self._channel, self._telemetry_file)
+
+    @property
+    def channel(self):
+        """Return the pump's channel, one of 1, 2 or 3."""
+        return self._channel
+
+    @property
+    def budget(self):
+        """Return the PowerBudget this pump reserves from."""
+        return self._budget
 
     def set_speed(self, speed):
-        """Set pump speed (PWM duty cycle)."""
+        """Set pump speed (PWM duty cycle).
+
+        Returns False if the power budget has no room for the new speed.
+
+        """
         if speed > 1.0 or speed < 0:
             raise ValueError("Speed must be between 0 and 1")
 
         if speed == 0:
-            global_lock.release()
-        elif not global_lock.acquire(blocking=False):
+            self._budget.release(self._channel)
+        elif not self._budget.reserve(self._channel, speed):
             return False
 
-        self._pwm.ChangeDutyCycle(int(PUMP_MAX_DUTY * speed))
-        self._speed = speed
+        try:
+            self._apply(speed)
+        except Exception:
+            # The speed did not change, so neither should the reservation
+            if self._speed:
+                self._budget.reserve(self._channel, self._speed)
+            else:
+                self._budget.release(self._channel)
+            raise
         return True
 
+    def _apply(self, speed):
+        with self._telemetry_lock:
+            # The duty cycle is changed first, so telemetry can never leave a pump running
+            self._pwm.set_duty_cycle(int(PUMP_MAX_DUTY * speed))
+            now = self._scheduler.time()
+            try:
+                self._telemetry = self._running_telemetry(now)
+            except Exception:
+                logging.exception("Counting pump %d telemetry failed", self._channel)
+            self._changed = now
+            self._speed = speed
+
+    def _running_telemetry(self, now):
+        """Return telemetry including the time run at the current speed, up to now."""
+        if not self._speed or self._changed is None:
+            return self._telemetry
+        elapsed = now - self._changed
+        return self._telemetry._replace(
+            on_time=self._telemetry.on_time + elapsed,
+            duty_time=self._telemetry.duty_time + elapsed * self._speed,
+            volume=self._telemetry.volume + elapsed * self._flow_rate(self._speed),
+        )
+
+    def _flow_rate(self, speed):
+        flow_model = self._flow_model
+        # Without a usable model telemetry just goes without, dose_volume reports why
+        return flow_model.rate(speed) if flow_model is not None and flow_model.calibrated else 0.0
+
+    @property
+    def telemetry(self):
+        """Return PumpTelemetry counted since the pump was created, or loaded from telemetry_file.
+
+        on_time is the time, in seconds, spent running at any speed, and duty_time the same
+        weighted by speed. volume is the millilitres delivered according to flow_model, and
+        only counts while it is calibrated. doses and rejected count calls to dose by whether
+        they were accepted, aborted counts non-blocking doses stopped before their time was up.
+
+        """
+        with self._telemetry_lock:
+            return self._running_telemetry(self._scheduler.time())
+
+    def save_telemetry(self, path=None):
+        """Save telemetry as JSON, replacing any previous file in one step.
+
+        :param path: Path to save to, defaults to telemetry_file
+
+        """
+        path = path if path is not None else self._telemetry_file
+        if path is None:
+            raise ValueError("No path to save telemetry to")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.telemetry._asdict(), file)
+        os.replace(temporary, path)
+
+    def add_listener(self, callback):
+        """Call callback with a Dose for every call to dose.
+
+        Callbacks run on the thread that called dose and must not block.
+
+        :param callback: Function that takes a Dose
+
+        """
+        self._listeners += (callback,)
+
+    def remove_listener(self, callback):
+        """Stop calling a callback added with add_listener."""
+        self._listeners = tuple(listener for listener in self._listeners if listener != callback)
+
+    @property
+    def stop_handle(self):
+        """Return the grow.scheduler.Handle of the stop at the end of the latest non-blocking dose, or None.
+
+        The handle is cancelled, rather than run, if the dose was stopped early or replaced.
+
+        """
+        return self._timeout
+
     def get_speed(self):
         """Return Pump speed (PWM duty cycle)."""
         return self._speed
@@ -63,34 +471,108 @@ class Pump(object):
     def stop(self):
         """Stop the pump."""
         if self._timeout is not None:
+            if self._timeout.pending:
+                with self._telemetry_lock:
+                    self._telemetry = self._telemetry._replace(aborted=self._telemetry.aborted + 1)
             self._timeout.cancel()
             self._timeout = None
+        for step in self._steps:
+            step.cancel()
+        self._steps = ()
         self.set_speed(0)
+        self._finished.set()
 
-    def dose(self, speed, timeout=0.1, blocking=True, force=False):
+    def dose(self, speed, timeout=0.1, blocking=True, force=False, ramp=None):
         """Pulse the pump for timeout seconds.
 
         :param timeout: Timeout, in seconds, of the pump pulse
         :param blocking: If true, function will block until pump has stopped
         :param force: Applies only to non-blocking. If true, any previous dose will be replaced
+        :param ramp: Speed profile from grow.ramps, eg: LinearRamp(rise=0.05), None to run at speed throughout
 
         """
+        if timeout < 0:
+            raise ValueError("Timeout must not be negative")
+
+        timestamp = time.time()
+
+        if self._timeout is not None and self._timeout.pending:
+            if blocking or not force:
+                self._notify(Dose(self._channel, speed, timeout, False, timestamp))
+                return False
+            self.stop()
+
+        if ramp is not None:
+            accepted = self._start_ramp(speed, timeout, ramp)
+            self._notify(Dose(self._channel, speed, timeout, accepted, timestamp))
+            if accepted and blocking:
+                self._finished.wait()
 
-        if blocking:
-            if self.set_speed(speed):
+        elif blocking:
+            accepted = self.set_speed(speed)
+            self._notify(Dose(self._channel, speed, timeout, accepted, timestamp))
+            if accepted:
                 time.sleep(timeout)
                 self.stop()
-                return True
 
         else:
-            if self._timeout is not None:
-                if self._timeout.is_alive():
-                    if force:
-                        self._timeout.cancel()
+            accepted = self.set_speed(speed)
+            if accepted:
+                self._timeout = self._scheduler.call_later(timeout, self.stop)
+            self._notify(Dose(self._channel, speed, timeout, accepted, timestamp))
+
+        return accepted
+
+    def _start_ramp(self, speed, timeout, ramp):
+        """Schedule every speed change of a ramped dose, and the stop at its end.
+
+        Steps run on the scheduler thread, so blocking doses need it running, as the
+        shared scheduler always is.
 
-            self._timeout = threading.Timer(timeout, self.stop)
-            if self.set_speed(speed):
-                self._timeout.start()
-                return True
+        """
+        if speed > 1.0 or speed < 0:
+            raise ValueError("Speed must be between 0 and 1")
+
+        # Reserve the peak speed for the whole dose, so pauses and ramps can't be starved of power
+        if not self._budget.reserve(self._channel, speed):
+            return False
+
+        self._finished.clear()
+        start = self._scheduler.time()
+        steps = []
+        for offset, value in ramp.steps(speed, timeout):
+            if offset <= 0:
+                self._apply(value)
+            else:
+                steps.append(self._scheduler.call_at(start + offset, self._apply, value))
+        self._steps = tuple(steps)
+        self._timeout = self._scheduler.call_at(start + timeout, self.stop)
+        return True
+
+    @property
+    def flow_model(self):
+        """Return the FlowModel used by dose_volume, loaded from flow_model_path(channel) when the pump was created."""
+        if self._flow_model is None:
+            raise ValueError(self._flow_model_error)
+        return self._flow_model
+
+    def dose_volume(self, volume, speed=None, blocking=True, force=False):
+        """Deliver a volume of water, using the flow model to pick the speed and time.
+
+        :param volume: Millilitres of water to deliver
+        :param speed: Pump speed to use, defaults to the fastest calibrated speed
+        :param blocking: If true, function will block until pump has stopped
+        :param force: Applies only to non-blocking. If true, any previous dose will be replaced
+
+        """
+        speed, duration = self.flow_model.plan(volume, speed)
+        return self.dose(speed, duration, blocking=blocking, force=force)
 
-        return False
+    def _notify(self, dose):
+        with self._telemetry_lock:
+            if dose.accepted:
+                self._telemetry = self._telemetry._replace(doses=self._telemetry.doses + 1)
+            else:
+                self._telemetry = self._telemetry._replace(rejected=self._telemetry.rejected + 1)
+        for callback in self._listeners:
+            callback(dose)
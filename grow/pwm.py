@@ -0,0 +1,238 @@
+import os
+import socket
+
+try:
+    import pigpio
+except ImportError:
+    pigpio = None
+
+PWM_CHIP = "/sys/class/pwm/pwmchip0"
+
+# Where pigpio.pi() connects to by default, overridden by the same environment variables
+PIGPIO_ADDR = "localhost"
+PIGPIO_PORT = 8888
+
+# BCM pins that can be routed to the two hardware PWM channels, eg: with dtoverlay=pwm-2chan
+HARDWARE_PWM_CHANNELS = {12: 0, 13: 1, 18: 0, 19: 1}
+
+
+class SoftPWM(object):
+    """RPi.GPIO software PWM."""
+
+    def __init__(self, pin, frequency):
+        """Start PWM on a BCM pin, with the output off.
+
+        Timed by a thread inside RPi.GPIO, so high frequencies cost CPU time and
+        jitter when the Pi is busy.
+
+        :param pin: BCM pin
+        :param frequency: PWM frequency in Hz
+
+        """
+        import RPi.GPIO as GPIO
+
+        self._gpio = GPIO
+        self._pin = pin
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
+        self._pwm = GPIO.PWM(pin, frequency)
+        self._pwm.start(0)
+
+    def set_duty_cycle(self, duty_cycle):
+        """Set the duty cycle, in percent from 0 to 100."""
+        self._pwm.ChangeDutyCycle(duty_cycle)
+
+    def set_frequency(self, frequency):
+        """Set the frequency in Hz."""
+        self._pwm.ChangeFrequency(frequency)
+
+    def close(self):
+        """Stop PWM and leave the pin as an input."""
+        self._pwm.stop()
+        self._gpio.setup(self._pin, self._gpio.IN)
+
+
+class PigpioPWM(object):
+    """DMA-timed PWM from the pigpio daemon."""
+
+    # Resolution of the duty cycle, in steps
+    RANGE = 1000
+
+    def __init__(self, pin, frequency, pi=None):
+        """Start PWM on a BCM pin, with the output off.
+
+        Pulses are timed by DMA in the pigpio daemon, so they cost no CPU time and do not
+        jitter under load. Works on any pin. Frequency is rounded by pigpio to the nearest
+        it supports at its sample rate, eg: 8000Hz rather than 10000Hz at the default 5us.
+
+        :param pin: BCM pin
+        :param frequency: PWM frequency in Hz
+        :param pi: Connected pigpio.pi, defaults to a new connection to the local daemon
+
+        """
+        if pi is None:
+            if pigpio is None:
+                raise RuntimeError("pigpio is not installed")
+            pi = pigpio.pi()
+            if not pi.connected:
+                raise RuntimeError("pigpio daemon is not running, start it with: sudo pigpiod")
+            self._owns_pi = True
+        else:
+            self._owns_pi = False
+
+        self._pi = pi
+        self._pin = pin
+        pi.set_PWM_dutycycle(pin, 0)
+        pi.set_PWM_range(pin, self.RANGE)
+        pi.set_PWM_frequency(pin, frequency)
+
+    def set_duty_cycle(self, duty_cycle):
+        """Set the duty cycle, in percent from 0 to 100."""
+        self._pi.set_PWM_dutycycle(self._pin, int(duty_cycle * self.RANGE / 100))
+
+    def set_frequency(self, frequency):
+        """Set the frequency in Hz."""
+        self._pi.set_PWM_frequency(self._pin, frequency)
+
+    def close(self):
+        """Stop PWM and leave the pin as an input."""
+        self._pi.set_PWM_dutycycle(self._pin, 0)
+        self._pi.set_mode(self._pin, pigpio.INPUT if pigpio is not None else 0)
+        if self._owns_pi:
+            self._pi.stop()
+
+
+class SysfsPWM(object):
+    """Hardware PWM through the kernel's sysfs PWM interface."""
+
+    def __init__(self, pin, frequency, chip=PWM_CHIP):
+        """Start PWM on a BCM pin, with the output off.
+
+        Pulses are generated by the PWM peripheral itself, with no CPU time or jitter.
+        Only BCM 12, 13, 18 and 19 can be used, and the pin must be routed to the PWM
+        peripheral first, eg: with "dtoverlay=pwm-2chan,pin=18,func=2,pin2=13,func2=4"
+        in /boot/config.txt.
+
+        :param pin: BCM pin, one of 12, 13, 18 or 19
+        :param frequency: PWM frequency in Hz
+        :param chip: Path of the sysfs PWM chip
+
+        """
+        try:
+            channel = HARDWARE_PWM_CHANNELS[pin]
+        except KeyError:
+            raise ValueError(f"Hardware PWM is only available on BCM {', '.join(map(str, HARDWARE_PWM_CHANNELS))}")
+
+        self._chip = chip
+        self._path = os.path.join(chip, f"pwm{channel}")
+        if not os.path.exists(self._path):
+            self._write(os.path.join(chip, "export"), channel)
+
+        self._period = 0
+        self._duty_cycle = 0
+        self._write_attribute("duty_cycle", 0)
+        self.set_frequency(frequency)
+        self._write_attribute("enable", 1)
+
+    def _write(self, path, value):
+        with open(path, "w") as file:
+            file.write(str(value))
+
+    def _write_attribute(self, name, value):
+        self._write(os.path.join(self._path, name), value)
+
+    def set_duty_cycle(self, duty_cycle):
+        """Set the duty cycle, in percent from 0 to 100."""
+        self._duty_cycle = duty_cycle
+        self._write_attribute("duty_cycle", int(self._period * duty_cycle / 100))
+
+    def set_frequency(self, frequency):
+        """Set the frequency in Hz."""
+        period = int(1e9 / frequency)
+        # The kernel rejects a duty cycle longer than the period, so shrink it first when the period does
+        if period < self._period:
+            self._write_attribute("duty_cycle", int(period * self._duty_cycle / 100))
+            self._write_attribute("period", period)
+        else:
+            self._write_attribute("period", period)
+            self._write_attribute("duty_cycle", int(period * self._duty_cycle / 100))
+        self._period = period
+
+    def close(self):
+        """Stop PWM."""
+        self._write_attribute("duty_cycle", 0)
+        self._write_attribute("enable", 0)
+
+
+class MockPWM(object):
+    """PWM backend that only records what it is asked to do, for testing."""
+
+    def __init__(self, pin, frequency):
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0
+        self.closed = False
+        # (name, value) of every change, oldest first
+        self.changes = []
+
+    def set_duty_cycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.changes.append(("duty_cycle", duty_cycle))
+
+    def set_frequency(self, frequency):
+        self.frequency = frequency
+        self.changes.append(("frequency", frequency))
+
+    def close(self):
+        self.closed = True
+
+
+def pigpiod_running(timeout=0.1):
+    """Return True if the pigpio daemon is accepting connections.
+
+    Checks the daemon's socket directly, since pigpio.pi() prints a long warning when
+    it cannot connect.
+
+    """
+    address = os.environ.get("PIGPIO_ADDR", PIGPIO_ADDR)
+    port = int(os.environ.get("PIGPIO_PORT", PIGPIO_PORT))
+    try:
+        with socket.create_connection((address, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+BACKENDS = {
+    "soft": SoftPWM,
+    "pigpio": PigpioPWM,
+    "sysfs": SysfsPWM,
+    "mock": MockPWM,
+}
+
+
+def create_pwm(pin, frequency, backend=None):
+    """Start PWM on a BCM pin with the chosen backend.
+
+    :param pin: BCM pin
+    :param frequency: PWM frequency in Hz
+    :param backend: One of "soft", "pigpio", "sysfs", "mock" or "auto", or a class taking (pin, frequency).
+        Defaults to the GROW_PWM environment variable, or "soft". "auto" uses pigpio if its daemon is running and soft PWM if not.
+
+    """
+    if backend is None:
+        backend = os.environ.get("GROW_PWM", "soft")
+
+    if callable(backend):
+        return backend(pin, frequency)
+
+    if backend == "auto":
+        if pigpio is not None and pigpiod_running():
+            return PigpioPWM(pin, frequency)
+        return SoftPWM(pin, frequency)
+
+    try:
+        return BACKENDS[backend](pin, frequency)
+    except KeyError:
+        raise ValueError(f"PWM backend must be one of: {', '.join(BACKENDS)}, auto")
@@ -0,0 +1,125 @@
+"""Speed profiles for Pump.dose.
+
+Each profile turns a dose's speed and duration into steps of (offset, speed), where
+offset is the time in seconds from the start of the dose. Every step falls within the
+dose's duration, and the pump always stops once the duration is up, so a ramped dose
+takes exactly as long as a flat one.
+
+"""
+
+# Time, in seconds, between speed changes while ramping
+RAMP_STEP = 0.02
+
+
+def _ease(fraction):
+    # Smoothstep, slow at either end and fastest in the middle
+    return fraction * fraction * (3 - 2 * fraction)
+
+
+class LinearRamp(object):
+    """Ramp speed up and down in a straight line."""
+
+    def __init__(self, rise=0.1, fall=0.0, step=RAMP_STEP):
+        """Create a new linear ramp.
+
+        Starting a pump gently avoids the inrush current of going straight to full duty,
+        which can brown out the supply and makes short doses deliver inconsistent volumes.
+
+        :param rise: Time, in seconds, to reach full speed
+        :param fall: Time, in seconds, to slow down to a stop before the dose ends
+        :param step: Time, in seconds, between speed changes
+
+        """
+        if rise < 0 or fall < 0:
+            raise ValueError("Rise and fall must not be negative")
+        if step <= 0:
+            raise ValueError("Step must be greater than 0")
+
+        self.rise = rise
+        self.fall = fall
+        self.step = step
+
+    def _shape(self, fraction):
+        return fraction
+
+    def _edge(self, start, length, begin, end):
+        # One change per step, finishing at end a step before length is up
+        count = max(1, int(round(length / self.step)))
+        return [(start + length * (i - 1) / count, begin + (end - begin) * self._shape(i / count)) for i in range(1, count + 1)]
+
+    def steps(self, speed, duration):
+        """Return the (offset, speed) steps of a dose.
+
+        :param speed: Full speed, from 0.0 to 1.0
+        :param duration: Length of the dose, in seconds
+
+        """
+        rise, fall = self.rise, self.fall
+        # Too short to reach full speed, so scale both edges to fit
+        if rise + fall > duration:
+            scale = duration / (rise + fall)
+            rise, fall = rise * scale, fall * scale
+
+        steps = self._edge(0.0, rise, 0.0, speed) if rise > 0 else [(0.0, speed)]
+        if fall > 0:
+            steps += self._edge(duration - fall, fall, speed, 0.0)
+        return steps
+
+
+class SCurveRamp(LinearRamp):
+    """Ramp speed up and down along an S-curve."""
+
+    def __init__(self, rise=0.1, fall=0.0, step=RAMP_STEP):
+        """Create a new S-curve ramp.
+
+        Like LinearRamp, but speed changes slowly at the start and end of each ramp, for
+        the least mechanical and electrical shock.
+
+        :param rise: Time, in seconds, to reach full speed
+        :param fall: Time, in seconds, to slow down to a stop before the dose ends
+        :param step: Time, in seconds, between speed changes
+
+        """
+        LinearRamp.__init__(self, rise, fall, step)
+
+    def _shape(self, fraction):
+        return _ease(fraction)
+
+
+class PulseTrain(object):
+    """Run the pump in pulses, with pauses in between."""
+
+    def __init__(self, on=0.1, off=0.1, ramp=None):
+        """Create a new pulse train.
+
+        Pulsing lets water soak in between pulses rather than running off.
+
+        :param on: Time, in seconds, of each pulse
+        :param off: Time, in seconds, of each pause
+        :param ramp: LinearRamp or SCurveRamp to start and stop each pulse with, None for none
+
+        """
+        if on <= 0 or off < 0:
+            raise ValueError("Pulses must be longer than 0 and pauses must not be negative")
+
+        self.on = on
+        self.off = off
+        self.ramp = ramp
+
+    def steps(self, speed, duration):
+        """Return the (offset, speed) steps of a dose.
+
+        :param speed: Speed of each pulse, from 0.0 to 1.0
+        :param duration: Length of the dose, in seconds, including pauses
+
+        """
+        steps = []
+        start = 0.0
+        while start < duration:
+            on = min(self.on, duration - start)
+            pulse = self.ramp.steps(speed, on) if self.ramp is not None else [(0.0, speed)]
+            steps += [(start + offset, value) for offset, value in pulse]
+            if start + on < duration:
+                steps.append((start + on, 0.0))
+            start += self.on + self.off
+        return steps
@@ -0,0 +1,9 @@
+import collections
+
+MoistureReading = collections.namedtuple("MoistureReading", ("moisture", "saturation", "timestamp", "stale", "sequence", "history_total", "filtered"))
+
+ChannelReading = collections.namedtuple("ChannelReading", ("channel", "moisture", "saturation", "active", "stale", "timestamp"))
+
+MoistureSnapshot = collections.namedtuple("MoistureSnapshot", ("timestamp", "channels"))
+
+PumpTelemetry = collections.namedtuple("PumpTelemetry", ("on_time", "duty_time", "volume", "doses", "rejected", "aborted"))
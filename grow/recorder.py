@@ -0,0 +1,229 @@
+import collections
+import logging
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (time REAL NOT NULL, channel INTEGER NOT NULL, moisture REAL NOT NULL, saturation REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS doses (time REAL NOT NULL, channel INTEGER NOT NULL, speed REAL NOT NULL, duration REAL NOT NULL, accepted INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS alarms (time REAL NOT NULL, channel INTEGER NOT NULL, state INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS readings_channel_time ON readings (channel, time);
+CREATE INDEX IF NOT EXISTS readings_time ON readings (time);
+CREATE INDEX IF NOT EXISTS doses_channel_time ON doses (channel, time);
+CREATE INDEX IF NOT EXISTS doses_time ON doses (time);
+CREATE INDEX IF NOT EXISTS alarms_channel_time ON alarms (channel, time);
+CREATE INDEX IF NOT EXISTS alarms_time ON alarms (time);
+"""
+
+_INSERT = {
+    "readings": "INSERT INTO readings (time, channel, moisture, saturation) VALUES (?, ?, ?, ?)",
+    "doses": "INSERT INTO doses (time, channel, speed, duration, accepted) VALUES (?, ?, ?, ?, ?)",
+    "alarms": "INSERT INTO alarms (time, channel, state) VALUES (?, ?, ?)",
+}
+
+# Events kept in memory while the database can't be written, the oldest are dropped beyond this
+MAX_PENDING = 100000
+
+_COLUMNS = {
+    "readings": "time, channel, moisture, saturation",
+    "doses": "time, channel, speed, duration, accepted",
+    "alarms": "time, channel, state",
+}
+
+
+class Recorder(object):
+    """Batched SQLite recorder for moisture readings, pump doses and alarms."""
+
+    def __init__(self, path, flush_interval=60.0, retention=None, compact_interval=60 * 60, background=True, max_pending=MAX_PENDING):
+        """Create a new recorder.
+
+        Events are appended to an in-memory queue, which never blocks the caller, and written
+        to the database in one transaction per flush from a background thread.
+
+        The database uses WAL mode so queries can run while a flush is in progress.
+
+        :param path: Path to the SQLite database, created if it does not exist
+        :param flush_interval: Time, in seconds, between flushes
+        :param retention: Time, in seconds, to keep events for. None to keep everything.
+        :param compact_interval: Minimum time, in seconds, between removing expired events
+        :param background: If true, start the flush thread. Otherwise call flush() yourself.
+        :param max_pending: Maximum number of events to queue, eg: while the database is locked, the oldest are dropped beyond this
+
+        """
+        self._path = path
+        self._flush_interval = flush_interval
+        self._retention = retention
+        self._compact_interval = compact_interval
+        self._last_compact = None
+        self._queue = collections.deque(maxlen=max_pending)
+        self._flush_lock = threading.Lock()
+        self._connection = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        connection = self._connect()
+        connection.close()
+
+        if background:
+            self.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self._path, check_same_thread=False)
+        # auto_vacuum only takes effect on a new database, before any tables exist
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def record_reading(self, channel, moisture, saturation, timestamp=None):
+        """Queue a moisture reading.
+
+        :param channel: Moisture channel
+        :param moisture: Reading in pulses/sec
+        :param saturation: Saturation from 0.0 to 1.0
+        :param timestamp: time.time() of the reading, defaults to now
+
+        """
+        self._queue.append(("readings", (time.time() if timestamp is None else timestamp, channel, moisture, saturation)))
+
+    def record_dose(self, channel, speed, duration, accepted=True, timestamp=None):
+        """Queue a pump dose.
+
+        :param channel: Pump channel
+        :param speed: Pump speed from 0.0 to 1.0
+        :param duration: Time, in seconds, of the dose
+        :param accepted: False if the dose was refused, eg: because another pump was running
+        :param timestamp: time.time() of the dose, defaults to now
+
+        """
+        self._queue.append(("doses", (time.time() if timestamp is None else timestamp, channel, speed, duration, int(accepted))))
+
+    def record_alarm(self, channel, state, timestamp=None):
+        """Queue an alarm transition.
+
+        :param channel: Channel the alarm belongs to
+        :param state: True if the alarm was raised, False if it was cleared
+        :param timestamp: time.time() of the transition, defaults to now
+
+        """
+        self._queue.append(("alarms", (time.time() if timestamp is None else timestamp, channel, int(state))))
+
+    def attach_moisture(self, channel, sensor):
+        """Record every new reading from a grow.moisture.Moisture sensor."""
+        sensor.add_listener(lambda reading: self.record_reading(channel, reading.moisture, reading.saturation, reading.timestamp))
+
+    def attach_pump(self, pump):
+        """Record every dose from a grow.pump.Pump."""
+        pump.add_listener(lambda dose: self.record_dose(dose.channel, dose.speed, dose.duration, dose.accepted, dose.timestamp))
+
+    @property
+    def pending(self):
+        """Return the number of events waiting to be flushed."""
+        return len(self._queue)
+
+    def flush(self):
+        """Write all queued events in a single transaction, and remove expired events.
+
+        If the write fails, eg: because the database is locked, the events are queued again for the next flush.
+
+        """
+        with self._flush_lock:
+            # Only take what is queued now, events added meanwhile wait for the next flush
+            batch = [self._queue.popleft() for _ in range(len(self._queue))]
+            rows = {table: [] for table in _INSERT}
+            for table, row in batch:
+                rows[table].append(row)
+
+            try:
+                if self._connection is None:
+                    self._connection = self._connect()
+                with self._connection:
+                    for table, table_rows in rows.items():
+                        if table_rows:
+                            self._connection.executemany(_INSERT[table], table_rows)
+            except sqlite3.Error:
+                self._requeue(batch)
+                raise
+
+            now = time.time()
+            if self._retention is not None and (self._last_compact is None or now - self._last_compact >= self._compact_interval):
+                self._compact(now - self._retention)
+                self._last_compact = now
+
+    def _requeue(self, batch):
+        # The batch is older than anything queued since, so goes back in front, and is the first to drop if there is no room
+        room = self._queue.maxlen - len(self._queue) if self._queue.maxlen is not None else len(batch)
+        if room > 0:
+            self._queue.extendleft(reversed(batch[-room:]))
+
+    def _compact(self, cutoff):
+        with self._connection:
+            for table in _INSERT:
+                self._connection.execute(f"DELETE FROM {table} WHERE time < ?", (cutoff,))
+        self._connection.execute("PRAGMA incremental_vacuum")
+
+    def readings(self, channel=None, start=None, end=None):
+        """Return recorded readings as (time, channel, moisture, saturation) tuples, oldest first."""
+        return self._query("readings", channel, start, end)
+
+    def doses(self, channel=None, start=None, end=None):
+        """Return recorded doses as (time, channel, speed, duration, accepted) tuples, oldest first."""
+        return self._query("doses", channel, start, end)
+
+    def alarms(self, channel=None, start=None, end=None):
+        """Return recorded alarm transitions as (time, channel, state) tuples, oldest first."""
+        return self._query("alarms", channel, start, end)
+
+    def _query(self, table, channel, start, end):
+        conditions = []
+        parameters = []
+        for condition, value in (("channel = ?", channel), ("time >= ?", start), ("time <= ?", end)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+
+        query = f"SELECT {_COLUMNS[table]} FROM {table}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY time"
+
+        # A separate connection, so queries never wait on the flush thread
+        connection = sqlite3.connect(self._path)
+        try:
+            return connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def start(self):
+        """Start the flush thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread, writing any queued events first."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def close(self):
+        """Stop recording and close the database."""
+        self.stop()
+        with self._flush_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _run(self):
+        while not self._stop_event.wait(self._flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # eg: the database is locked by another process, try again next time
+                logging.exception("Writing events to %s failed", self._path)
@@ -0,0 +1,173 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class Handle(object):
+    """Cancellation handle for a call scheduled with Scheduler.call_at or call_later."""
+
+    def __init__(self, when, callback, args, lock):
+        self._when = when
+        self._callback = callback
+        self._args = args
+        # The scheduler's lock, held while a due call is taken off the heap
+        self._lock = lock
+        self._cancelled = False
+        self._done = False
+
+    @property
+    def when(self):
+        """Return the scheduler clock time at which the call is due."""
+        return self._when
+
+    @property
+    def cancelled(self):
+        """Return True if the call was cancelled before it could run."""
+        return self._cancelled
+
+    @property
+    def pending(self):
+        """Return True if the call has neither run nor been cancelled."""
+        return not self._cancelled and not self._done
+
+    def cancel(self):
+        """Stop the call from running, returns False if it has already run."""
+        with self._lock:
+            if self._done:
+                return False
+            self._cancelled = True
+            return True
+
+
+class VirtualClock(object):
+    """Manually advanced clock, for testing a Scheduler without waiting."""
+
+    def __init__(self, start=0.0):
+        self._now = start
+
+    def __call__(self):
+        return self._now
+
+    def advance(self, seconds):
+        """Move the clock forward by seconds."""
+        self._now += seconds
+
+
+class Scheduler(object):
+    """Delayed calls, all run from one thread."""
+
+    def __init__(self, clock=time.monotonic, background=True):
+        """Create a new scheduler.
+
+        Calls are kept in a heap ordered by due time, so scheduling and cancelling
+        are cheap and no thread is created per call.
+
+        Callbacks run one at a time on the scheduler thread and must not block.
+
+        :param clock: Function returning the current time in seconds, eg: a VirtualClock for testing
+        :param background: If true, start a thread on the first call scheduled. Otherwise call run_pending() yourself.
+
+        """
+        self._clock = clock
+        self._background = background
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def time(self):
+        """Return the current time of the scheduler's clock."""
+        return self._clock()
+
+    def call_at(self, when, callback, *args):
+        """Call callback(*args) once the clock reaches when.
+
+        :returns: Handle to cancel the call with
+
+        """
+        handle = Handle(when, callback, args, self._condition)
+        with self._condition:
+            heapq.heappush(self._heap, (when, next(self._sequence), handle))
+            # Wake the thread in case this is now the first call due
+            self._condition.notify()
+        if self._background:
+            self.start()
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        """Call callback(*args) after delay seconds.
+
+        :returns: Handle to cancel the call with
+
+        """
+        return self.call_at(self._clock() + delay, callback, *args)
+
+    def run_pending(self):
+        """Run every call that is due.
+
+        :returns: Clock time at which the next call is due, or None if nothing is scheduled
+
+        """
+        while True:
+            with self._condition:
+                while self._heap and self._heap[0][2]._cancelled:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    return None
+                when, _, handle = self._heap[0]
+                if when > self._clock():
+                    return when
+                heapq.heappop(self._heap)
+                handle._done = True
+
+            try:
+                handle._callback(*handle._args)
+            except Exception:
+                logging.exception("Scheduled call to %r failed", handle._callback)
+
+    def start(self):
+        """Start the scheduler thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the scheduler thread. Calls not yet due are kept."""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            next_call = self.run_pending()
+            with self._condition:
+                if self._stop_event.is_set():
+                    break
+                # A call scheduled since run_pending returned may be due sooner
+                if self._heap and (next_call is None or self._heap[0][0] < next_call):
+                    next_call = self._heap[0][0]
+                self._condition.wait(None if next_call is None else max(0, next_call - self._clock()))
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler():
+    """Return the Scheduler shared by Pump, Piezo and Moisture, created on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Scheduler()
+        return _default
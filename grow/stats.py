@@ -0,0 +1,119 @@
+import collections
+import math
+
+Statistics = collections.namedtuple("Statistics", ("count", "mean", "minimum", "maximum", "stddev", "slope"))
+
+EMPTY_STATISTICS = Statistics(0, None, None, None, None, None)
+
+
+class RollingStatistics(object):
+    """Mean, min, max, standard deviation and slope over a rolling time window."""
+
+    def __init__(self, window):
+        """Create a new set of rolling statistics.
+
+        Min and max are tracked with monotonic deques, mean, variance and slope with
+        running sums, so each update is O(1) amortized however long the window is.
+
+        :param window: Length of the window in seconds
+
+        """
+        if window <= 0:
+            raise ValueError("Window must be greater than 0")
+
+        self._window = window
+        self._times = collections.deque()
+        self._values = collections.deque()
+        self._minimum = collections.deque()
+        self._maximum = collections.deque()
+        self._origin = None
+        self._updates = 0
+        self._reset_sums()
+        self._result = EMPTY_STATISTICS
+
+    @property
+    def window(self):
+        """Return the length of the window in seconds."""
+        return self._window
+
+    @property
+    def result(self):
+        """Return the current Statistics.
+
+        Slope is in units per second. Fields other than count are None if the window is empty.
+
+        """
+        return self._result
+
+    def update(self, timestamp, value):
+        """Add a value and drop any that have fallen out of the window.
+
+        :param timestamp: time.time() of the value, must not go backwards
+        :param value: Value to add
+
+        """
+        if self._origin is None:
+            self._origin = timestamp
+
+        self._times.append(timestamp)
+        self._values.append(value)
+        self._add(timestamp - self._origin, value)
+
+        while self._minimum and self._minimum[-1][1] >= value:
+            self._minimum.pop()
+        self._minimum.append((timestamp, value))
+
+        while self._maximum and self._maximum[-1][1] <= value:
+            self._maximum.pop()
+        self._maximum.append((timestamp, value))
+
+        cutoff = timestamp - self._window
+        while self._times and self._times[0] <= cutoff:
+            self._add(self._times.popleft() - self._origin, self._values.popleft(), -1)
+        while self._minimum[0][0] <= cutoff:
+            self._minimum.popleft()
+        while self._maximum[0][0] <= cutoff:
+            self._maximum.popleft()
+
+        # Running sums drift as values come and go, rebuild them once per window's worth of updates
+        self._updates += 1
+        if self._updates >= len(self._times):
+            self._rebuild()
+
+        self._result = self._calculate()
+        return self._result
+
+    def _reset_sums(self):
+        self._count = 0
+        self._sum = 0.0
+        self._sum_squares = 0.0
+        self._sum_time = 0.0
+        self._sum_time_squares = 0.0
+        self._sum_time_value = 0.0
+
+    def _add(self, time, value, sign=1):
+        self._count += sign
+        self._sum += sign * value
+        self._sum_squares += sign * value * value
+        self._sum_time += sign * time
+        self._sum_time_squares += sign * time * time
+        self._sum_time_value += sign * time * value
+
+    def _rebuild(self):
+        self._reset_sums()
+        self._origin = self._times[0]
+        for timestamp, value in zip(self._times, self._values):
+            self._add(timestamp - self._origin, value)
+        self._updates = 0
+
+    def _calculate(self):
+        count = self._count
+        mean = self._sum / count
+        variance = max(0.0, self._sum_squares / count - mean * mean)
+
+        slope = 0.0
+        spread = count * self._sum_time_squares - self._sum_time * self._sum_time
+        if count > 1 and spread > 0:
+            slope = (count * self._sum_time_value - self._sum_time * self._sum) / spread
+
+        return Statistics(count, mean, self._minimum[0][1], self._maximum[0][1], math.sqrt(variance), slope)
@@ -2,7 +2,9 @@
 These allow the mocking of various Python modules
 that might otherwise have runtime side-effects.
 """
+import asyncio
 import sys
+import threading
 
 import mock
 import pytest
@@ -15,21 +17,30 @@ class SMBusFakeDevice(MockSMBus):
         self.regs[0x00:0x01] = 0x0f, 0x00
 
 
+class FakeEventSource(object):
+    """Stand-in for grow.capture.GPIOChipEventSource."""
+
+    def __init__(self):
+        self.pins = set()
+        self.events = {}
+
+    def add(self, pin):
+        self.pins.add(pin)
+
+    def remove(self, pin):
+        self.pins.discard(pin)
+
+    def read(self, timeout=None):
+        events, self.events = self.events, {}
+        return events
+
+
 @pytest.fixture(scope='function', autouse=True)
 def cleanup():
     yield None
-    try:
-        del sys.modules['grow']
-    except KeyError:
-        pass
-    try:
-        del sys.modules['grow.moisture']
-    except KeyError:
-        pass
-    try:
-        del sys.modules['grow.pump']
-    except KeyError:
-        pass
+    # Every grow module holds a reference to the RPi.GPIO mock it was imported with
+    for module in [name for name in sys.modules if name == 'grow' or name.startswith('grow.')]:
+        del sys.modules[module]
 
 
 @pytest.fixture(scope='function', autouse=False)
@@ -71,3 +82,32 @@ def atexit():
     sys.modules['atexit'] = atexit
     yield atexit
     del sys.modules['atexit']
+
+
+@pytest.fixture(scope='function', autouse=False)
+def event_source():
+    """Fake GPIO character device edge event source."""
+    yield FakeEventSource()
+
+
+@pytest.fixture(scope='function', autouse=False)
+def daemon(GPIO, smbus, tmp_path):
+    """Run a GrowDaemon on its own event loop thread."""
+    from grow.daemon import GrowDaemon
+    from grow.moisture import MoistureArray
+    from grow.pump import Pump
+
+    meter = MoistureArray(channels=(1, 2), background=False)
+    daemon = GrowDaemon(str(tmp_path / "grow.sock"), meter=meter, pumps={1: Pump(1)}, piezo=mock.Mock(**{"beep.return_value": True}))
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(daemon.start(), loop).result(1.0)
+
+    yield daemon, meter
+
+    asyncio.run_coroutine_threadsafe(daemon.close(), loop).result(1.0)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
@@ -0,0 +1,49 @@
+import time
+
+
+def test_capture_dispatches_batches(GPIO, event_source):
+    from grow.capture import PulseCapture
+
+    source = event_source
+    capture = PulseCapture(source=source, background=False)
+
+    batches = []
+    capture.register(23, batches.append)
+    assert source.pins == {23}
+
+    source.events = {23: [1.0, 2.0], 8: [3.0]}
+    capture.poll()
+    assert batches == [[1.0, 2.0]]
+
+    capture.unregister(23)
+    assert source.pins == set()
+
+
+def test_moisture_counts_batches(GPIO, smbus, event_source):
+    from grow.capture import PulseCapture
+    from grow.moisture import MOISTURE_1_PIN, Moisture
+
+    source = event_source
+    capture = PulseCapture(source=source, background=False)
+
+    ch1 = Moisture(channel=1, capture=capture)
+    GPIO.add_event_detect.assert_not_called()
+
+    start = ch1._time_last_reading
+    # 10Hz for 2.5 seconds, should close two windows of ten pulses each
+    source.events = {MOISTURE_1_PIN: [start + 0.1 * (n + 1) for n in range(25)]}
+    capture.poll()
+
+    assert ch1._history.total == 2
+    assert round(ch1.moisture, 3) == 10.0
+    assert ch1._count == 5
+    assert ch1._last_pulse == start + 2.5
+
+
+def test_capture_thread_stops(GPIO, event_source):
+    from grow.capture import PulseCapture
+
+    capture = PulseCapture(source=event_source, interval=0.01)
+    capture.register(23, lambda timestamps: None)
+    time.sleep(0.05)
+    capture.stop()
@@ -0,0 +1,45 @@
+import json
+
+
+def test_cli_reads_from_daemon(daemon, capsys):
+    from grow.cli import main
+
+    daemon, meter = daemon
+    meter.sample(now=100.0)
+
+    assert main(["read", "2", "--json", "--socket", daemon.path]) is None
+    output = json.loads(capsys.readouterr().out)
+    assert output["timestamp"] == 100.0
+    assert [reading["channel"] for reading in output["channels"]] == [2]
+
+    assert main(["dose", "1", "0.5", "0.05", "--socket", daemon.path]) is None
+    assert main(["status", "--socket", daemon.path]) is None
+    assert "Pump 1: running at 0.50" in capsys.readouterr().out
+
+
+def test_cli_without_daemon(GPIO, smbus, tmp_path, capsys):
+    from grow.cli import main
+
+    socket = str(tmp_path / "missing.sock")
+
+    # History is only kept by the daemon
+    assert main(["history", "1", "--socket", socket]) == 1
+
+    # Doses fall back to driving the pump directly
+    assert main(["dose", "2", "0.5", "0.01", "--socket", socket]) is None
+    GPIO.PWM.return_value.ChangeDutyCycle.assert_called_with(0)
+
+    assert main(["read", "--interval", "0.01", "--socket", socket]) is None
+    assert len(capsys.readouterr().out.splitlines()) == 3
+
+
+def test_cli_does_not_import_hardware_modules():
+    import os
+    import subprocess
+    import sys
+
+    # A fresh interpreter, since the other tests have already imported everything
+    check = "import sys, grow.cli; print(sorted(m for m in ('RPi', 'numpy', 'PIL', 'grow.moisture') if m in sys.modules))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, "-c", check], cwd=root)
+    assert output.strip() == b"[]"
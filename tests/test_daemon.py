@@ -0,0 +1,138 @@
+import pytest
+
+
+def test_daemon_requests(daemon):
+    from grow.client import GrowClient
+
+    daemon, meter = daemon
+    meter.sample(now=100.0)
+
+    with GrowClient(daemon.path) as client:
+        snapshot = client.snapshot()
+        assert snapshot == meter.snapshot
+
+        assert client.dose(1, 0.5, 0.05) is True
+        status = client.status()
+        assert status["pumps"] == {1: 0.5}
+        assert status["power"] == {"capacity": 1.0, "headroom": 0.5}
+        assert status["telemetry"][1].doses == 1
+        client.stop(1)
+
+        # Errors are reported without dropping the connection
+        with pytest.raises(RuntimeError):
+            client.dose(3, 0.5, 0.05)
+        assert client.beep(880, 0.1) is True
+        daemon._piezo.beep.assert_called_once_with(880, 0.1, blocking=False)
+
+
+def test_daemon_subscribe(daemon):
+    from grow.client import GrowClient
+
+    daemon, meter = daemon
+
+    with GrowClient(daemon.path) as client:
+        snapshots = client.subscribe()
+        meter.sample(now=200.0)
+        meter.sample(now=201.0)
+        assert next(snapshots).timestamp == 200.0
+        assert next(snapshots).timestamp == 201.0
+
+
+def test_daemon_rejects_malformed_requests(daemon):
+    import json
+    import socket
+
+    daemon, meter = daemon
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(1.0)
+        connection.connect(daemon.path)
+        responses = connection.makefile("rwb")
+        for line in (b'["x"]\n', b'"status"\n', b'{"id": 1}\n', b'{"command": "status"}\n'):
+            responses.write(line)
+            responses.flush()
+            response = json.loads(responses.readline())
+            assert response["ok"] is (line == b'{"command": "status"}\n')
+
+
+def test_daemon_will_not_take_over_a_live_socket(daemon, tmp_path):
+    import asyncio
+
+    from grow.client import GrowClient
+    from grow.daemon import GrowDaemon
+
+    daemon, meter = daemon
+
+    second = GrowDaemon(daemon.path, meter=meter, pumps={})
+    with pytest.raises(RuntimeError):
+        asyncio.run(second.start())
+
+    # The running daemon still answers
+    with GrowClient(daemon.path) as client:
+        assert client.snapshot() == meter.snapshot
+
+
+def test_daemon_replaces_a_stale_socket(GPIO, smbus, tmp_path):
+    import asyncio
+    import socket
+
+    from grow.daemon import GrowDaemon
+    from grow.moisture import MoistureArray
+
+    path = str(tmp_path / "grow.sock")
+    # Bound but never listening, like a socket left behind by a daemon that crashed
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    daemon = GrowDaemon(path, meter=MoistureArray(channels=(1,), background=False), pumps={})
+
+    async def start_and_close():
+        await daemon.start()
+        await daemon.close()
+
+    asyncio.run(start_and_close())
+
+
+def test_daemon_socket_is_private(daemon):
+    import os
+    import stat
+
+    daemon, meter = daemon
+    assert stat.S_IMODE(os.stat(daemon.path).st_mode) == 0o600
+
+
+def test_socket_belonging_to_another_user(GPIO, smbus, tmp_path, monkeypatch):
+    import os
+    import socket
+
+    import grow.daemon
+    from grow.daemon import main
+
+    path = str(tmp_path / "grow.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    def unlink(path):
+        raise PermissionError(13, "Permission denied", path)
+
+    monkeypatch.setattr(grow.daemon.os, "unlink", unlink)
+    # A clean error before the hardware is touched, rather than a traceback
+    assert main(["--socket", path]) == 1
+    assert os.path.exists(path)
+
+
+def test_socket_path(monkeypatch):
+    from grow.client import DEFAULT_SOCKET, socket_path
+
+    monkeypatch.delenv("GROW_SOCKET", raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    assert socket_path() == DEFAULT_SOCKET
+
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert socket_path() == "/run/user/1000/grow.sock"
+
+    monkeypatch.setenv("GROW_SOCKET", "/srv/grow.sock")
+    assert socket_path() == "/srv/grow.sock"
+    assert socket_path("/var/grow.sock") == "/var/grow.sock"
@@ -0,0 +1,159 @@
+import time
+
+import pytest
+
+
+def test_doses_queue_instead_of_being_refused(GPIO, smbus):
+    from grow.dosing import DoseScheduler
+    from grow.pump import Pump, global_budget
+
+    scheduler = DoseScheduler({channel: Pump(channel) for channel in (1, 2, 3)}, background=False)
+
+    first = scheduler.submit(1, 0.5, 0.05)
+    second = scheduler.submit(2, 0.5, 0.05)
+    urgent = scheduler.submit(3, 0.5, 0.05, priority=1)
+
+    # The highest priority dose starts first, the others wait their turn
+    now = time.time()
+    assert scheduler.run_pending(now) == pytest.approx(now + 0.05)
+    assert scheduler.running() == (3,)
+    assert scheduler.pending() == 2
+    assert not urgent.done()
+
+    for future in (urgent, first, second):
+        time.sleep(0.1)
+        scheduler.run_pending()
+        assert future.result(0) is True
+
+    assert scheduler.pending() == 0
+    assert scheduler.running() == ()
+    assert scheduler.run_pending() is None
+    assert global_budget.reserved() == 0
+
+
+def test_doses_expire_and_cancel(GPIO, smbus):
+    from grow.dosing import DoseScheduler
+    from grow.pump import Pump
+
+    scheduler = DoseScheduler({1: Pump(1), 2: Pump(2)}, background=False)
+
+    running = scheduler.submit(1, 0.5, 0.05)
+    expires = scheduler.submit(2, 0.5, 0.05, deadline=time.time() + 0.01)
+    cancelled = scheduler.submit(2, 0.5, 0.05)
+    assert cancelled.cancel()
+
+    scheduler.run_pending()
+    time.sleep(0.1)
+    scheduler.run_pending()
+
+    assert running.result(0) is True
+    assert expires.result(0) is False
+    assert scheduler.pending() == 0
+
+
+def test_expired_doses_do_not_spin_the_thread(GPIO, smbus):
+    from grow.dosing import DoseScheduler
+    from grow.pump import Pump
+
+    scheduler = DoseScheduler({1: Pump(1), 2: Pump(2)})
+    calls = []
+    run_pending = scheduler.run_pending
+
+    def counted_run_pending(now=None):
+        calls.append(now)
+        return run_pending(now)
+
+    scheduler.run_pending = counted_run_pending
+
+    running = scheduler.submit(1, 0.5, 0.5)
+    # Expires while the only slot is taken
+    expires = scheduler.submit(2, 0.5, 0.05, deadline=time.time() + 0.1)
+
+    assert expires.result(1.0) is False
+    assert scheduler.pending() == 0
+    assert running.result(1.0) is True
+    # About one pass per 0.1s recheck, rather than one per loop
+    assert len(calls) < 50
+    scheduler.stop()
+
+
+def test_dose_scheduler_thread(GPIO, smbus):
+    from grow.dosing import DoseScheduler
+    from grow.pump import Pump
+
+    pumps = {1: Pump(1), 2: Pump(2)}
+    doses = []
+    for pump in pumps.values():
+        pump.add_listener(doses.append)
+
+    scheduler = DoseScheduler(pumps)
+    futures = [scheduler.submit(channel, 0.5, 0.02) for channel in (1, 2, 1)]
+
+    assert [future.result(2.0) for future in futures] == [True, True, True]
+    assert [dose.channel for dose in doses] == [1, 2, 1]
+    assert all(dose.accepted for dose in doses)
+    scheduler.stop()
+
+
+def test_concurrent_doses_share_the_power_budget(GPIO, smbus):
+    from grow.dosing import DoseScheduler
+    from grow.pump import Pump, global_budget
+
+    scheduler = DoseScheduler({channel: Pump(channel) for channel in (1, 2, 3)}, concurrency=3, background=False)
+
+    halves = [scheduler.submit(channel, 0.5, 0.05) for channel in (1, 2)]
+    full = scheduler.submit(3, 1.0, 0.05)
+
+    # Two half speed doses fit the budget together, the full speed dose waits for them
+    scheduler.run_pending()
+    assert scheduler.running() == (1, 2)
+    assert global_budget.headroom() == 0
+
+    time.sleep(0.1)
+    scheduler.run_pending()
+    assert [future.result(0) for future in halves] == [True, True]
+    assert scheduler.running() == (3,)
+
+    time.sleep(0.1)
+    scheduler.run_pending()
+    assert full.result(0) is True
+
+
+def test_dose_errors_do_not_stop_the_queue(GPIO, smbus):
+    from grow.dosing import DoseScheduler
+    from grow.pump import Pump, global_budget
+    from grow.pwm import MockPWM
+
+    class Broken(MockPWM):
+        def set_duty_cycle(self, duty_cycle):
+            if duty_cycle:
+                raise OSError("PWM write failed")
+
+    scheduler = DoseScheduler({1: Pump(1, pwm=Broken), 2: Pump(2, pwm="mock")})
+
+    failed = scheduler.submit(1, 0.5, 0.02)
+    delivered = scheduler.submit(2, 0.5, 0.02)
+
+    with pytest.raises(OSError):
+        failed.result(2.0)
+    assert delivered.result(2.0) is True
+    # The failed pump does not keep its share of the budget
+    assert global_budget.reserved() == 0
+    scheduler.stop()
+
+
+def test_dose_stopped_on_the_pump_is_not_delivered(GPIO, smbus):
+    from grow.dosing import DoseScheduler
+    from grow.pump import Pump
+
+    pump = Pump(1, pwm="mock")
+    scheduler = DoseScheduler({1: pump}, background=False)
+
+    dose = scheduler.submit(1, 0.5, 1.0)
+    scheduler.run_pending()
+    assert scheduler.running() == (1,)
+
+    pump.stop()
+    scheduler.run_pending()
+    assert dose.result(0) is False
+    assert scheduler.running() == ()
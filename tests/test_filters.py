@@ -0,0 +1,64 @@
+import pytest
+
+
+def test_ema_filter(GPIO):
+    from grow.filters import EMAFilter
+
+    ema = EMAFilter(alpha=0.5)
+    assert ema.value is None
+    assert ema.update(10.0) == 10.0
+    assert ema.update(20.0) == 15.0
+
+    with pytest.raises(ValueError):
+        EMAFilter(alpha=0)
+
+
+def test_median_filter_rejects_outliers(GPIO):
+    from grow.filters import MedianFilter
+
+    median = MedianFilter(size=3, threshold=5.0)
+    for value in (10.0, 11.0, 12.0):
+        median.update(value)
+    assert median.value == 11.0
+
+    # A single spike is ignored
+    assert median.update(50.0) == 11.0
+    assert median.rejected == 1
+
+    # A sustained step is accepted once a full window has been rejected
+    median.update(50.0)
+    assert median.update(50.0) == 50.0
+    assert median.rejected == 0
+
+
+def test_median_filter_rolls(GPIO):
+    from grow.filters import MedianFilter
+
+    median = MedianFilter(size=4)
+    for value in (1.0, 2.0, 3.0, 4.0, 5.0):
+        median.update(value)
+    assert median.value == 3.5
+
+
+def test_kalman_filter_converges(GPIO):
+    from grow.filters import KalmanFilter
+
+    kalman = KalmanFilter(process_variance=0.001, measurement_variance=1.0)
+    kalman.update(0.0)
+    for _ in range(200):
+        kalman.update(10.0)
+    assert kalman.value == pytest.approx(10.0, abs=0.1)
+    assert kalman.variance < 1.0
+
+
+def test_moisture_filtered_saturation(GPIO, smbus):
+    from grow.filters import EMAFilter
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, wet_point=1.0, dry_point=21.0, timeout=None, filter=EMAFilter(alpha=0.5))
+    ch1._publish(21.0, 1.0, False)
+    ch1._publish(1.0, 2.0, False)
+
+    assert ch1.filtered_moisture == 11.0
+    assert ch1.filtered_saturation == 0.5
+    assert ch1.saturation == 1.0
@@ -0,0 +1,68 @@
+import pytest
+
+
+def test_flow_model_fits_speed(GPIO):
+    from grow.pump import FlowModel
+
+    # 20ml/s per unit of speed, but nothing moves below 0.25
+    model = FlowModel([(0.5, 2.0, 10.0), (1.0, 1.0, 15.0), (0.75, 4.0, 40.0)])
+
+    assert model.rate(0.5) == pytest.approx(5.0)
+    assert model.rate(0.2) == 0.0
+    assert model.minimum_speed == pytest.approx(0.25)
+    assert model.plan(30.0) == (1.0, pytest.approx(2.0))
+    assert model.plan(30.0, speed=0.5) == (0.5, pytest.approx(6.0))
+
+    with pytest.raises(ValueError):
+        model.plan(30.0, speed=0.2)
+
+
+def test_flow_model_single_speed(GPIO):
+    from grow.pump import FlowModel
+
+    model = FlowModel()
+    assert not model.calibrated
+    with pytest.raises(RuntimeError):
+        model.plan(10.0)
+
+    model.add_sample(0.5, 2.0, 8.0)
+    assert model.calibrated
+    assert model.rate(0.5) == pytest.approx(4.0)
+    assert model.rate(1.0) == pytest.approx(8.0)
+
+
+def test_flow_model_persists(GPIO, tmp_path):
+    from grow.pump import FlowModel, flow_model_path
+
+    path = flow_model_path(1, str(tmp_path / "grow"))
+    model = FlowModel.load(path)
+    model.add_sample(0.5, 2.0, 8.0)
+
+    assert FlowModel.load(path).samples == ((0.5, 2.0, 8.0),)
+
+
+def test_pump_dose_volume(GPIO, smbus):
+    from grow.pump import FlowModel, Pump
+
+    pump = Pump(channel=1, flow_model=FlowModel([(0.5, 1.0, 100.0)]))
+    doses = []
+    pump.add_listener(doses.append)
+
+    assert pump.dose_volume(2.0) is True
+    assert doses[0].speed == 0.5
+    assert doses[0].duration == pytest.approx(0.02)
+
+
+def test_dose_volume_rejects_negative_volume(GPIO, smbus):
+    from grow.pump import FlowModel, Pump, global_budget
+
+    pump = Pump(channel=1, flow_model=FlowModel([(0.5, 1.0, 100.0)]))
+
+    for volume in (-5, 0):
+        with pytest.raises(ValueError):
+            pump.dose_volume(volume)
+    with pytest.raises(ValueError):
+        pump.dose(1.0, timeout=-1)
+
+    assert pump.get_speed() == 0
+    assert global_budget.reserved() == 0
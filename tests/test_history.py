@@ -0,0 +1,267 @@
+import time
+
+import pytest
+
+
+def test_ringbuffer_wraps(GPIO):
+    from grow.history import RingBuffer
+
+    buffer = RingBuffer(3)
+    assert len(buffer) == 0
+    assert list(buffer) == []
+
+    for value in range(5):
+        buffer.append(value)
+
+    assert len(buffer) == 3
+    assert buffer.total == 5
+    assert list(buffer) == [4.0, 3.0, 2.0]
+    assert list(buffer.view()) == [2.0, 3.0, 4.0]
+    assert list(buffer.latest(2)) == [4.0, 3.0]
+
+
+def test_ringbuffer_invalid_capacity(GPIO):
+    from grow.history import RingBuffer
+
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+def test_moisture_history_newest_first(GPIO, smbus):
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, history_length=2)
+
+    for _ in range(3):
+        ch1._time_last_reading = time.time() - 1.0
+        ch1._event_handler(ch1._gpio_pin)
+
+    assert len(ch1.history) == 2
+    assert ch1._history.total == 3
+
+
+def test_moisture_history_cached(GPIO, smbus):
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, wet_point=1.0, dry_point=21.0)
+    for reading in (1.0, 11.0, 21.0):
+        ch1._close_window(0, reading)
+        ch1._publish(reading, 0, False)
+
+    history = ch1.history
+    assert history == (0.0, 0.5, 1.0)
+    assert ch1.history is history
+    assert list(ch1.raw_history(2)) == [21.0, 11.0]
+
+    ch1.set_dry_point(11.0)
+    assert ch1.history is not history
+    assert ch1.history == (0.0, 0.0, 1.0)
+
+
+def test_moisture_history_without_numpy(GPIO, smbus):
+    import grow.moisture
+    from grow.moisture import Moisture
+
+    grow.moisture.numpy = None
+
+    ch1 = Moisture(channel=1, wet_point=1.0, dry_point=21.0)
+    for reading in (1.0, 11.0, 21.0):
+        ch1._close_window(0, reading)
+        ch1._publish(reading, 0, False)
+
+    assert ch1.history == (0.0, 0.5, 1.0)
+
+
+def test_ringbuffer_copy(GPIO):
+    from grow.history import RingBuffer
+
+    buffer = RingBuffer(4)
+    for value in range(6):
+        buffer.append(value)
+
+    assert list(buffer.copy()) == [2.0, 3.0, 4.0, 5.0]
+    assert list(buffer.copy(count=2)) == [4.0, 5.0]
+
+    # Copy as of an earlier append, the oldest value has since been overwritten
+    assert list(buffer.copy(end=5)) == [2.0, 3.0, 4.0]
+
+
+def test_tiered_history_rolls_up(GPIO):
+    from grow.history import HistoryTier, TieredHistory
+
+    history = TieredHistory((
+        HistoryTier("raw", 1, 10),
+        HistoryTier("minute", 60, 10),
+        HistoryTier("hour", 3600, 10),
+    ))
+
+    # Two and a bit hours of one reading per 30 seconds
+    for t in range(0, 2 * 3600 + 60, 30):
+        history.append(float(t), float(t % 90))
+
+    times, minimum, mean, maximum = history.read("raw")
+    assert len(times) == 10
+    assert times[-1] == 7230.0
+
+    times, minimum, mean, maximum = history.read("minute")
+    assert len(times) == 10
+    assert times[-1] == 7140.0
+    assert list(minimum[-3:]) == [0.0, 0.0, 30.0]
+    assert list(maximum[-3:]) == [30.0, 60.0, 60.0]
+    assert list(mean[-3:]) == [15.0, 30.0, 45.0]
+
+    # The second hour is still being filled
+    times, minimum, mean, maximum = history.read("hour")
+    assert list(times) == [0.0]
+    assert mean[0] == 30.0
+    assert history.read("minute", start=7000, end=7100)[0].tolist() == [7020.0, 7080.0]
+
+    assert history.select(span=5, points=100) == "raw"
+    assert history.select(span=600, points=1000) == "minute"
+    assert history.select(span=3 * 3600, points=300) == "hour"
+    assert history.select(span=24 * 3600, points=100) == "hour"
+
+
+def test_moisture_history_tier(GPIO, smbus):
+    from grow.history import DEFAULT_TIERS
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, wet_point=1.0, dry_point=21.0, timeout=None, history_tiers=DEFAULT_TIERS)
+
+    for t, reading in ((0.0, 21.0), (30.0, 1.0), (60.0, 11.0)):
+        ch1._close_window(t, reading)
+
+    times, minimum, mean, maximum = ch1.history_tier("minute")
+    assert times == [0.0]
+    assert minimum == [0.0]
+    assert mean == [0.5]
+    assert maximum == [1.0]
+
+
+def test_history_file_survives_reopen(GPIO, tmp_path):
+    from grow.history import HistoryFile
+
+    path = str(tmp_path / "moisture-1.hist")
+
+    history = HistoryFile(path, capacity=4)
+    assert history.calibration == (None, None)
+    for t in range(6):
+        history.append(1000.0 + t, t)
+    history.calibration = (1.0, 25.0)
+    history.close()
+
+    # Capacity comes from the existing file
+    history = HistoryFile(path, capacity=100)
+    assert history.values.capacity == 4
+    assert history.values.total == 6
+    assert list(history.values.latest()) == [5.0, 4.0, 3.0, 2.0]
+    assert list(history.times.copy()) == [1002.0, 1003.0, 1004.0, 1005.0]
+    assert history.updated == 1005.0
+    assert history.calibration == (1.0, 25.0)
+    history.close()
+
+
+def test_history_file_rejects_other_files(GPIO, tmp_path):
+    from grow.history import HistoryFile
+
+    path = tmp_path / "not-history"
+    path.write_bytes(b"\0" * 128)
+
+    with pytest.raises(ValueError):
+        HistoryFile(str(path))
+
+
+def test_moisture_attaches_history_file(GPIO, smbus, tmp_path):
+    from grow.history import HistoryFile
+    from grow.moisture import Moisture
+
+    path = str(tmp_path / "moisture-1.hist")
+
+    ch1 = Moisture(channel=1, wet_point=1.0, dry_point=21.0, timeout=None, history_file=HistoryFile(path, capacity=10))
+    ch1._complete_reading(ch1._time_last_reading + 1.0)
+    ch1._close_window(ch1._time_last_reading + 1.0, 11.0)
+    ch1._history_file.close()
+
+    # A restarted sensor picks up history and calibration where it left off
+    ch1 = Moisture(channel=1, timeout=None, history_file=HistoryFile(path))
+    assert ch1.range == -20.0
+    assert ch1.history == (0.5, 1.0)
+
+
+def test_downsample_keeps_extremes(GPIO):
+    from grow.history import downsample
+
+    times = [float(t) for t in range(10)]
+    values = [0.5] * 10
+    values[3] = 0.0
+    values[8] = 1.0
+
+    times, minimum, mean, maximum = downsample(times, values, values, values, points=2, start=0.0, end=10.0)
+    assert times == [0.0, 5.0]
+    assert minimum == [0.0, 0.5]
+    assert mean == pytest.approx([0.4, 0.6])
+    assert maximum == [0.5, 1.0]
+
+    # Fewer entries than points are returned as they are
+    assert downsample([1.0], [2.0], [3.0], [4.0], points=10) == ([1.0], [2.0], [3.0], [4.0])
+
+
+def test_moisture_query_history(GPIO, smbus, tmp_path):
+    from grow.history import HistoryFile
+    from grow.moisture import Moisture
+
+    history_file = HistoryFile(str(tmp_path / "moisture-1.hist"), capacity=100)
+    ch1 = Moisture(channel=1, wet_point=1.0, dry_point=21.0, timeout=None, history_file=history_file)
+
+    for t in range(20):
+        ch1._close_window(1000.0 + t, 21.0 if t < 10 else 1.0)
+
+    # The sensor is watered at 1010, which shows up in the first bucket's maximum
+    times, minimum, mean, maximum = ch1.query_history(1007.0, 1015.0, points=2)
+    assert times == [1007.0, 1011.0]
+    assert minimum == [0.0, 1.0]
+    assert mean == [0.25, 1.0]
+    assert maximum == [1.0, 1.0]
+    history_file.close()
+
+
+def test_query_history_picks_tier_by_range(GPIO, smbus):
+    from grow.history import DEFAULT_TIERS
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, wet_point=1.0, dry_point=21.0, timeout=None, window=None, history_tiers=DEFAULT_TIERS)
+
+    # Two days of one reading per second
+    now = 1000000.0
+    for t in range(2 * 24 * 3600):
+        ch1._close_window(now - 2 * 24 * 3600 + 1 + t, 11.0)
+
+    # The last day comes from minutes, including the minute still being filled
+    times, minimum, mean, maximum = ch1.query_history(now - 24 * 3600, now, points=300)
+    assert len(times) == 300
+    assert now - times[-1] <= 24 * 3600 / 300
+
+    # Raw readings are still held for the last ten minutes
+    assert len(ch1.query_history(now - 600, now, points=300)[0]) == 300
+
+    # Raw readings from a day ago are gone, so minutes are used however many points are asked for
+    times, minimum, mean, maximum = ch1.query_history(now - 24 * 3600, now - 23 * 3600, points=3600)
+    assert len(times) == 60
+    assert mean == [0.5] * 60
+
+
+def test_tiered_history_covering_and_current_bucket():
+    from grow.history import HistoryTier, TieredHistory
+
+    history = TieredHistory((HistoryTier("raw", 1, 10), HistoryTier("minute", 60, 10)))
+    for t in range(90):
+        history.append(float(t), float(t))
+
+    assert history.covering(85.0) == "raw"
+    assert history.covering(50.0) == "minute"
+    assert history.covering(-1000.0) == "minute"
+
+    assert history.read("minute")[0].tolist() == [0.0]
+    times, minimum, mean, maximum = history.read("minute", current=True)
+    assert times.tolist() == [0.0, 60.0]
+    assert (minimum[-1], mean[-1], maximum[-1]) == (60.0, 74.5, 89.0)
@@ -1,5 +1,7 @@
 import time
 
+import pytest
+
 
 def test_pumps_actually_stop(GPIO, smbus):
     from grow.pump import Pump
@@ -11,37 +13,81 @@ def test_pumps_actually_stop(GPIO, smbus):
     assert ch1.get_speed() == 0
 
 
-def test_pumps_are_mutually_exclusive(GPIO, smbus):
-    from grow.pump import Pump, global_lock
+def test_pumps_share_the_power_budget(GPIO, smbus):
+    from grow.pump import Pump, global_budget
 
     ch1 = Pump(channel=1)
     ch2 = Pump(channel=2)
     ch3 = Pump(channel=3)
 
     ch1.dose(speed=0.5, timeout=1.0, blocking=False)
+    assert global_budget.reservations() == {1: 0.5}
+    assert global_budget.headroom() == 0.5
+
+    # Two pumps at half speed fit, a third does not
+    assert ch2.dose(speed=0.5, timeout=1.0, blocking=False) is True
+    assert global_budget.headroom() == 0
+
+    assert ch3.dose(speed=0.5) is False
+    assert ch3.dose(speed=0.1, blocking=False) is False
 
-    assert global_lock.locked() is True
+    ch1.stop()
+    ch2.stop()
+    assert global_budget.reserved() == 0
+
+
+def test_pump_at_full_speed_runs_alone(GPIO, smbus):
+    from grow.pump import Pump, global_budget
+
+    ch1 = Pump(channel=1)
+    ch2 = Pump(channel=2)
 
-    assert ch2.dose(speed=0.5) is False
+    assert ch1.dose(speed=1.0, timeout=1.0, blocking=False) is True
     assert ch2.dose(speed=0.5, blocking=False) is False
+    assert global_budget.headroom(1) == 1.0
 
-    assert ch3.dose(speed=0.5) is False
-    assert ch3.dose(speed=0.5, blocking=False) is False
+    # Stopping an idle pump must not release another pump's reservation
+    ch2.stop()
+    assert global_budget.reserved(1) == 1.0
+    ch1.stop()
 
 
 def test_pumps_run_sequentially(GPIO, smbus):
-    from grow.pump import Pump, global_lock
+    from grow.pump import Pump, global_budget
 
     ch1 = Pump(channel=1)
     ch2 = Pump(channel=2)
     ch3 = Pump(channel=3)
 
-    assert ch1.dose(speed=0.5, timeout=0.1, blocking=False) is True
-    assert global_lock.locked() is True
+    assert ch1.dose(speed=1.0, timeout=0.1, blocking=False) is True
+    assert global_budget.reserved() == 1.0
     time.sleep(0.3)
-    assert ch2.dose(speed=0.5, timeout=0.1, blocking=False) is True
-    assert global_lock.locked() is True
+    assert ch2.dose(speed=1.0, timeout=0.1, blocking=False) is True
+    assert global_budget.reserved() == 1.0
     time.sleep(0.3)
-    assert ch3.dose(speed=0.5, timeout=0.1, blocking=False) is True
-    assert global_lock.locked() is True
+    assert ch3.dose(speed=1.0, timeout=0.1, blocking=False) is True
+    assert global_budget.reserved() == 1.0
     time.sleep(0.3)
+    assert global_budget.reserved() == 0
+
+
+def test_budget_capacity(GPIO, smbus):
+    from grow.pump import PowerBudget, Pump
+
+    budget = PowerBudget(capacity=2.0)
+    pumps = [Pump(channel, budget=budget) for channel in (1, 2, 3)]
+
+    assert all(pump.set_speed(0.6) for pump in pumps)
+    assert budget.headroom() == pytest.approx(0.2)
+    # A running pump can speed up into the headroom, counting its own reservation
+    assert budget.headroom(1) == pytest.approx(0.8)
+    assert pumps[0].set_speed(0.8) is True
+    assert pumps[1].set_speed(0.9) is False
+    assert budget.reserved(2) == 0.6
+
+    budget.capacity = 1.0
+    assert pumps[0].set_speed(0.1) is False
+
+    for pump in pumps:
+        pump.set_speed(0)
+    assert budget.reservations() == {}
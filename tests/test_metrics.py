@@ -0,0 +1,44 @@
+def test_metrics_track_sensors_and_pumps(GPIO, smbus):
+    from grow.metrics import Metrics
+    from grow.moisture import Moisture
+    from grow.pump import Pump
+
+    metrics = Metrics()
+    moisture = Moisture(channel=1, wet_point=1.0, dry_point=21.0, timeout=None, window=None)
+    pump = Pump(channel=1)
+    metrics.attach_moisture(1, moisture)
+    metrics.attach_pump(pump)
+
+    moisture._publish(11.0, 100.0, False)
+    assert pump.dose(speed=0.5, timeout=0.01) is True
+    metrics.set_alarm(1, True)
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE grow_moisture_hz gauge" in lines
+    assert 'grow_moisture_hz{channel="1"} 11.0' in lines
+    assert 'grow_moisture_saturation{channel="1"} 0.5' in lines
+    assert 'grow_moisture_reading_timestamp_seconds{channel="1"} 100.0' in lines
+    assert 'grow_moisture_readings_total{channel="1"} 1' in lines
+    assert 'grow_pump_doses_total{channel="1",result="accepted"} 1' in lines
+    assert 'grow_pump_run_seconds_total{channel="1"} 0.01' in lines
+    assert 'grow_pump_aborted_doses_total{channel="1"} 0' in lines
+    on_seconds = [line for line in lines if line.startswith('grow_pump_on_seconds_total{channel="1"}')]
+    assert float(on_seconds[0].split()[-1]) >= 0.01
+    assert 'grow_alarm{channel="1"} 1' in lines
+
+
+def test_metrics_frame_histogram(GPIO):
+    from grow.metrics import Metrics
+
+    metrics = Metrics(frame_buckets=(0.1, 1.0))
+    assert "grow_frame_seconds" not in metrics.render()
+
+    for duration in (0.05, 0.5, 2.0):
+        metrics.observe_frame(duration)
+
+    lines = metrics.render().splitlines()
+    assert 'grow_frame_seconds_bucket{le="0.1"} 1' in lines
+    assert 'grow_frame_seconds_bucket{le="1.0"} 2' in lines
+    assert 'grow_frame_seconds_bucket{le="+Inf"} 3' in lines
+    assert "grow_frame_seconds_sum 2.55" in lines
+    assert "grow_frame_seconds_count 3" in lines
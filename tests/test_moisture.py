@@ -0,0 +1,264 @@
+import pytest
+
+
+def test_moisture_invalid_mode(GPIO, smbus):
+    from grow.moisture import Moisture
+
+    with pytest.raises(ValueError):
+        Moisture(channel=1, mode="magic")
+
+
+def test_moisture_period_mode(GPIO, smbus, event_source):
+    from grow.capture import PulseCapture
+    from grow.moisture import MODE_PERIOD, MOISTURE_1_PIN, Moisture
+
+    capture = PulseCapture(source=event_source, background=False)
+    ch1 = Moisture(channel=1, capture=capture, mode=MODE_PERIOD, periods=4)
+
+    start = ch1._time_last_reading
+    event_source.events = {MOISTURE_1_PIN: [start + 0.1, start + 0.35]}
+    capture.poll()
+
+    # A reading is available after two pulses, well inside the first window
+    assert ch1.new_data
+    assert ch1.moisture == pytest.approx(4.0)
+    assert ch1._history.total == 0
+
+    event_source.events = {MOISTURE_1_PIN: [start + 0.6, start + 0.85, start + 1.1, start + 1.35]}
+    capture.poll()
+
+    assert ch1.moisture == pytest.approx(4.0)
+    assert len(ch1._edges) == 5
+    assert ch1._history.total == 1
+
+
+def test_moisture_goes_stale(GPIO, smbus):
+    import time
+
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, timeout=3.0)
+    assert ch1.stale
+    assert ch1.timestamp is None
+
+    # Two pulses, then nothing for four seconds
+    now = time.time()
+    ch1._count = 2
+    ch1._time_last_reading = now - 4.0
+    ch1._last_pulse = now - 3.5
+    ch1._watchdog()
+
+    assert ch1.stale
+    assert ch1.new_data
+    assert ch1.moisture == pytest.approx(0.5, abs=0.01)
+    assert ch1.age < 1.0
+    assert ch1._history.total == 1
+
+    # Pulses resume, the next complete window is fresh
+    ch1._time_last_reading = time.time() - 1.0
+    ch1._event_handler(ch1._gpio_pin)
+    assert not ch1.stale
+    ch1._watchdog_timer.cancel()
+
+
+def test_watchdog_waits_for_the_window(GPIO, smbus):
+    import threading
+    import time
+
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, timeout=3.0)
+    ch1._last_pulse = ch1._time_last_reading = time.time() - 4.0
+
+    # A pulse is closing the window on the GPIO thread as the watchdog fires
+    with ch1._window_lock:
+        watchdog = threading.Thread(target=ch1._watchdog)
+        watchdog.start()
+        watchdog.join(0.05)
+        assert watchdog.is_alive()
+        ch1._last_pulse = ch1._time_last_reading = time.time()
+
+    watchdog.join()
+    # The window is fresh by the time the watchdog gets to it, so nothing expires
+    assert ch1._history.total == 0
+    assert not ch1.new_data
+    ch1._watchdog_timer.cancel()
+
+
+def test_moisture_period_mode_decays(GPIO, smbus):
+    import time
+
+    from grow.moisture import MODE_PERIOD, Moisture
+
+    ch1 = Moisture(channel=1, mode=MODE_PERIOD, timeout=None)
+    ch1._edges.extend([1.0, 1.1])
+    ch1._update_period()
+    assert ch1.moisture == pytest.approx(10.0)
+
+    ch1._last_pulse = time.time() - 4.0
+    ch1._expire(time.time())
+
+    assert ch1.stale
+    assert len(ch1._edges) == 0
+    assert ch1.moisture == pytest.approx(0.25, abs=0.01)
+
+
+def test_moisture_array_snapshot(GPIO, smbus):
+    import time
+
+    from grow.moisture import MoistureArray
+
+    array = MoistureArray(channels=(1, 2), dry_points=[20.0, 20.0], background=False)
+    assert len(array) == 2
+    assert array.snapshot.timestamp is None
+
+    now = time.time()
+    for sensor, pulses in zip(array, (10, 4)):
+        sensor._event_handler(sensor._gpio_pin)
+        sensor._count = pulses
+        sensor._time_last_reading = now - 1.0
+
+    # Pulses alone never close a window
+    assert array[1]._history.total == 0
+
+    snapshot = array.sample(now)
+    assert snapshot is array.snapshot
+    assert snapshot.timestamp == now
+    assert [reading.channel for reading in snapshot.channels] == [1, 2]
+    assert [reading.moisture for reading in snapshot.channels] == [pytest.approx(10.0), pytest.approx(4.0)]
+    assert [reading.timestamp for reading in snapshot.channels] == [now, now]
+    assert not snapshot.channels[0].stale
+
+
+def test_moisture_array_keeps_pulses_during_sample(GPIO, smbus):
+    import time
+
+    from grow.moisture import MoistureArray
+
+    array = MoistureArray(channels=(1,), dry_points=[20.0], background=False)
+    sensor = array[1]
+    now = time.time()
+    sensor._count = 10
+    sensor._time_last_reading = now - 1.0
+
+    # A pulse arrives while the window is being written to history
+    append = sensor._history.append
+
+    def pulse_then_append(reading):
+        sensor._count += 1
+        append(reading)
+
+    sensor._history.append = pulse_then_append
+    array.sample(now)
+
+    assert sensor.moisture == pytest.approx(10.0)
+    # Counted towards the next window instead of being reset away
+    assert sensor._count == 1
+
+
+def test_moisture_array_rejects_background_capture(GPIO, smbus, event_source):
+    from grow.capture import PulseCapture
+    from grow.moisture import MoistureArray
+
+    with pytest.raises(ValueError):
+        MoistureArray(capture=PulseCapture(source=event_source), background=False)
+
+
+def test_moisture_subscriptions(GPIO, smbus):
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, timeout=None)
+    first = ch1.subscribe()
+    second = ch1.subscribe()
+
+    ch1._publish(5.0, 1.0, False)
+    assert ch1.new_data
+    assert first.new_data and second.new_data
+
+    reading = first.read()
+    assert reading.moisture == 5.0
+    assert reading.timestamp == 1.0
+    assert not first.new_data
+    assert second.new_data
+    assert ch1.new_data
+
+    assert ch1.moisture == 5.0
+    assert not ch1.new_data
+    assert second.new_data
+
+
+def test_moisture_next_reading(GPIO, smbus):
+    import asyncio
+    import threading
+
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, timeout=None, window=None)
+
+    async def main():
+        waiter = asyncio.ensure_future(ch1.next_reading())
+        await asyncio.sleep(0)
+        # Readings are published from the GPIO thread
+        threading.Thread(target=ch1._publish, args=(12.0, 100.0, False)).start()
+        return await asyncio.wait_for(waiter, 1.0)
+
+    reading = asyncio.run(main())
+    assert reading.moisture == 12.0
+    assert reading.timestamp == 100.0
+    assert ch1._listeners == ()
+
+
+def test_moisture_async_readings_drop_oldest(GPIO, smbus):
+    import asyncio
+
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, timeout=None, window=None)
+
+    async def main():
+        async with ch1.readings(maxsize=2) as readings:
+            for moisture in (1.0, 2.0, 3.0):
+                ch1._publish(moisture, moisture, False)
+            # Let the loop run the queued call_soon_threadsafe callbacks
+            await asyncio.sleep(0)
+            first = await readings.__anext__()
+            second = await readings.__anext__()
+            return readings.dropped, first.moisture, second.moisture
+
+    assert asyncio.run(main()) == (1, 2.0, 3.0)
+    assert ch1._listeners == ()
+
+
+def test_put_latest(GPIO):
+    import asyncio
+
+    from grow.moisture import put_latest
+
+    queue = asyncio.Queue(2)
+    assert not put_latest(queue, 1)
+    assert not put_latest(queue, 2)
+    assert put_latest(queue, 3)
+    assert [queue.get_nowait() for _ in range(queue.qsize())] == [2, 3]
+
+
+def test_moisture_array_snapshots(GPIO, smbus):
+    import asyncio
+
+    from grow.moisture import MoistureArray
+
+    meter = MoistureArray(channels=(1, 2), background=False)
+
+    async def main():
+        readings = meter.snapshots()
+        meter.sample(now=50.0)
+        snapshot = await asyncio.wait_for(readings.__anext__(), 1.0)
+        # Closing ends iteration, rather than leaving the reader waiting forever
+        readings.close()
+        remaining = [snapshot async for snapshot in readings]
+        return snapshot, remaining
+
+    snapshot, remaining = asyncio.run(main())
+    assert snapshot.timestamp == 50.0
+    assert [reading.channel for reading in snapshot.channels] == [1, 2]
+    assert remaining == []
+    assert meter._listeners == ()
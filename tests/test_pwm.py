@@ -0,0 +1,122 @@
+import mock
+import pytest
+
+
+def test_pump_mock_backend(GPIO, smbus):
+    from grow.pump import PUMP_MAX_DUTY, PUMP_PWM_FREQ, Pump
+    from grow.pwm import MockPWM
+
+    pump = Pump(channel=1, pwm="mock")
+    assert isinstance(pump._pwm, MockPWM)
+    assert pump._pwm.frequency == PUMP_PWM_FREQ
+    GPIO.PWM.assert_not_called()
+
+    assert pump.dose(0.5, timeout=0.01)
+    assert pump._pwm.changes == [("duty_cycle", int(PUMP_MAX_DUTY * 0.5)), ("duty_cycle", 0)]
+
+    pump._stop()
+    assert pump._pwm.closed
+
+
+def test_piezo_mock_backend(GPIO):
+    from grow.piezo import Piezo
+    from grow.pwm import MockPWM
+
+    piezo = Piezo(pwm=MockPWM)
+    piezo.beep(880, timeout=0.01)
+    assert piezo.pwm.changes == [("frequency", 880), ("duty_cycle", 1), ("duty_cycle", 0)]
+
+
+def test_soft_pwm_is_the_default(GPIO, monkeypatch):
+    from grow.pwm import SoftPWM, create_pwm
+
+    monkeypatch.delenv("GROW_PWM", raising=False)
+    pwm = create_pwm(17, 10000)
+    assert isinstance(pwm, SoftPWM)
+    GPIO.PWM.assert_called_once_with(17, 10000)
+
+    pwm.set_duty_cycle(45)
+    GPIO.PWM.return_value.ChangeDutyCycle.assert_called_with(45)
+
+
+def test_auto_checks_for_pigpiod_quietly(GPIO, monkeypatch):
+    import grow.pwm
+    from grow.pwm import SoftPWM, create_pwm
+
+    pigpio = mock.Mock()
+    monkeypatch.setattr(grow.pwm, "pigpio", pigpio)
+    monkeypatch.setattr(grow.pwm, "pigpiod_running", lambda: False)
+
+    assert isinstance(create_pwm(17, 10000, "auto"), SoftPWM)
+    # pigpio.pi() prints a warning when pigpiod is not running, so it must not be called
+    pigpio.pi.assert_not_called()
+
+
+def test_pigpiod_running(monkeypatch):
+    import socket
+
+    from grow.pwm import pigpiod_running
+
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        monkeypatch.setenv("PIGPIO_ADDR", "127.0.0.1")
+        monkeypatch.setenv("PIGPIO_PORT", str(server.getsockname()[1]))
+        assert pigpiod_running()
+
+    assert not pigpiod_running()
+
+
+def test_backend_from_environment(GPIO, monkeypatch):
+    from grow.pwm import MockPWM, create_pwm
+
+    monkeypatch.setenv("GROW_PWM", "mock")
+    assert isinstance(create_pwm(17, 10000), MockPWM)
+
+    monkeypatch.setenv("GROW_PWM", "dma")
+    with pytest.raises(ValueError):
+        create_pwm(17, 10000)
+
+
+def test_pigpio_backend():
+    from grow.pwm import PigpioPWM
+
+    pi = mock.Mock()
+    pwm = PigpioPWM(17, 10000, pi=pi)
+    pi.set_PWM_frequency.assert_called_once_with(17, 10000)
+
+    pwm.set_duty_cycle(45)
+    pi.set_PWM_dutycycle.assert_called_with(17, 45 * PigpioPWM.RANGE // 100)
+
+    pwm.close()
+    pi.set_PWM_dutycycle.assert_called_with(17, 0)
+    # The connection was passed in, so belongs to someone else
+    pi.stop.assert_not_called()
+
+
+def test_sysfs_backend(tmp_path):
+    from grow.pwm import SysfsPWM
+
+    # The kernel creates pwm1 when it is exported, fake that up front
+    (tmp_path / "pwm1").mkdir()
+
+    def read(name):
+        return int((tmp_path / "pwm1" / name).read_text())
+
+    pwm = SysfsPWM(13, 1000, chip=str(tmp_path))
+    assert read("period") == 1000000
+    assert read("duty_cycle") == 0
+    assert read("enable") == 1
+
+    pwm.set_duty_cycle(50)
+    assert read("duty_cycle") == 500000
+
+    pwm.set_frequency(2000)
+    assert read("period") == 500000
+    assert read("duty_cycle") == 250000
+
+    pwm.close()
+    assert read("enable") == 0
+
+    with pytest.raises(ValueError):
+        SysfsPWM(17, 1000, chip=str(tmp_path))
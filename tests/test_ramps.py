@@ -0,0 +1,107 @@
+import pytest
+
+
+def test_linear_ramp_steps():
+    from grow.ramps import LinearRamp
+
+    steps = LinearRamp(rise=0.1, fall=0.05, step=0.025).steps(0.8, 1.0)
+    offsets = [offset for offset, _ in steps]
+    speeds = [speed for _, speed in steps]
+
+    assert offsets == pytest.approx([0.0, 0.025, 0.05, 0.075, 0.95, 0.975])
+    assert speeds == pytest.approx([0.2, 0.4, 0.6, 0.8, 0.4, 0.0])
+
+    # No rise goes straight to speed
+    assert LinearRamp(rise=0).steps(0.5, 1.0) == [(0.0, 0.5)]
+
+
+def test_ramp_shrinks_to_fit_short_doses():
+    from grow.ramps import SCurveRamp
+
+    steps = SCurveRamp(rise=0.2, fall=0.2, step=0.02).steps(1.0, 0.2)
+    assert all(0 <= offset < 0.2 for offset, _ in steps)
+    assert max(speed for _, speed in steps) == pytest.approx(1.0)
+    assert steps[-1][1] == 0
+
+
+def test_s_curve_starts_gently():
+    from grow.ramps import LinearRamp, SCurveRamp
+
+    linear = LinearRamp(rise=0.1, step=0.01).steps(1.0, 1.0)
+    s_curve = SCurveRamp(rise=0.1, step=0.01).steps(1.0, 1.0)
+
+    assert s_curve[0][1] < linear[0][1]
+    assert s_curve[-1][1] == linear[-1][1] == 1.0
+
+
+def test_pulse_train_steps():
+    from grow.ramps import PulseTrain
+
+    steps = PulseTrain(on=0.2, off=0.1).steps(0.5, 0.7)
+    assert [offset for offset, _ in steps] == pytest.approx([0.0, 0.2, 0.3, 0.5, 0.6])
+    assert [speed for _, speed in steps] == [0.5, 0.0, 0.5, 0.0, 0.5]
+
+    with pytest.raises(ValueError):
+        PulseTrain(on=0)
+
+
+def test_ramped_dose_runs_on_scheduler(GPIO, smbus):
+    from grow.pump import PUMP_MAX_DUTY, Pump, global_budget
+    from grow.ramps import LinearRamp
+    from grow.scheduler import Scheduler, VirtualClock
+
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+    pump = Pump(channel=1, scheduler=scheduler, pwm="mock")
+
+    assert pump.dose(1.0, timeout=1.0, blocking=False, ramp=LinearRamp(rise=0.5, step=0.25))
+    # The first step is applied straight away
+    assert pump.get_speed() == 0.5
+    assert global_budget.reserved(1) == 1.0
+
+    clock.advance(0.25)
+    scheduler.run_pending()
+    assert pump.get_speed() == 1.0
+
+    clock.advance(0.75)
+    scheduler.run_pending()
+    assert pump.get_speed() == 0
+    assert global_budget.reserved() == 0
+    assert pump._pwm.changes == [("duty_cycle", PUMP_MAX_DUTY // 2), ("duty_cycle", PUMP_MAX_DUTY), ("duty_cycle", 0)]
+
+
+def test_stop_cancels_ramp(GPIO, smbus):
+    from grow.pump import Pump, global_budget
+    from grow.ramps import PulseTrain
+    from grow.scheduler import Scheduler, VirtualClock
+
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+    pump = Pump(channel=1, scheduler=scheduler, pwm="mock")
+
+    assert pump.dose(0.5, timeout=1.0, blocking=False, ramp=PulseTrain(on=0.1, off=0.1))
+    assert not pump.dose(0.5, timeout=1.0, blocking=False, ramp=PulseTrain(on=0.1, off=0.1))
+    pump.stop()
+    assert global_budget.reserved() == 0
+
+    clock.advance(1.0)
+    scheduler.run_pending()
+    assert pump.get_speed() == 0
+
+    # force replaces a ramped dose that is still running
+    assert pump.dose(0.5, timeout=1.0, blocking=False, ramp=PulseTrain(on=0.1, off=0.1))
+    assert pump.dose(0.8, timeout=1.0, blocking=False, force=True, ramp=PulseTrain(on=0.1, off=0.1))
+    assert pump.get_speed() == 0.8
+    pump.stop()
+
+
+def test_blocking_ramped_dose(GPIO, smbus):
+    from grow.pump import Pump, global_budget
+    from grow.ramps import SCurveRamp
+
+    pump = Pump(channel=1, pwm="mock")
+
+    assert pump.dose(0.5, timeout=0.1, ramp=SCurveRamp(rise=0.05, fall=0.02, step=0.01))
+    assert pump.get_speed() == 0
+    assert global_budget.reserved() == 0
+    assert max(value for name, value in pump._pwm.changes) == int(0.5 * 90)
@@ -0,0 +1,105 @@
+def test_recorder_flushes_in_batches(GPIO, tmp_path):
+    from grow.recorder import Recorder
+
+    recorder = Recorder(str(tmp_path / "grow.db"), background=False)
+
+    recorder.record_reading(1, 12.5, 0.4, timestamp=100.0)
+    recorder.record_reading(2, 20.0, 0.1, timestamp=101.0)
+    recorder.record_dose(1, 0.5, 0.8, timestamp=102.0)
+    recorder.record_alarm(2, True, timestamp=103.0)
+
+    # Nothing reaches the database until a flush
+    assert recorder.pending == 4
+    assert recorder.readings() == []
+
+    recorder.flush()
+
+    assert recorder.pending == 0
+    assert recorder.readings() == [(100.0, 1, 12.5, 0.4), (101.0, 2, 20.0, 0.1)]
+    assert recorder.readings(channel=2, start=100.5) == [(101.0, 2, 20.0, 0.1)]
+    assert recorder.doses() == [(102.0, 1, 0.5, 0.8, 1)]
+    assert recorder.alarms(channel=2) == [(103.0, 2, 1)]
+
+    recorder.close()
+
+
+def test_recorder_retention(GPIO, tmp_path):
+    import time
+
+    from grow.recorder import Recorder
+
+    recorder = Recorder(str(tmp_path / "grow.db"), retention=60, background=False)
+
+    now = time.time()
+    recorder.record_reading(1, 10.0, 0.5, timestamp=now - 120)
+    recorder.record_reading(1, 11.0, 0.5, timestamp=now)
+    recorder.flush()
+
+    assert [row[0] for row in recorder.readings()] == [now]
+
+    recorder.close()
+
+
+def test_recorder_keeps_events_while_the_database_is_locked(GPIO, tmp_path):
+    import sqlite3
+    import time
+
+    from grow.recorder import Recorder
+
+    path = str(tmp_path / "grow.db")
+    recorder = Recorder(path, flush_interval=0.01, background=False)
+    # Fail straight away rather than waiting for the lock
+    recorder._connection = sqlite3.connect(path, timeout=0, check_same_thread=False)
+
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    recorder.record_reading(1, 10.0, 0.5, timestamp=100.0)
+    recorder.record_reading(1, 11.0, 0.5, timestamp=101.0)
+    recorder.start()
+    time.sleep(0.05)
+    recorder.record_reading(1, 12.0, 0.5, timestamp=102.0)
+    time.sleep(0.05)
+
+    # The flush thread carries on, with every event still queued in order
+    assert recorder._thread.is_alive()
+    assert [row[0] for _, row in recorder._queue] == [100.0, 101.0, 102.0]
+
+    other.execute("COMMIT")
+    other.close()
+    recorder.close()
+    assert [row[0] for row in recorder.readings()] == [100.0, 101.0, 102.0]
+
+
+def test_recorder_queue_is_bounded(GPIO, tmp_path):
+    from grow.recorder import Recorder
+
+    recorder = Recorder(str(tmp_path / "grow.db"), background=False, max_pending=2)
+    for timestamp in (100.0, 101.0, 102.0):
+        recorder.record_reading(1, 10.0, 0.5, timestamp=timestamp)
+
+    assert recorder.pending == 2
+    recorder.flush()
+    assert [row[0] for row in recorder.readings()] == [101.0, 102.0]
+    recorder.close()
+
+
+def test_recorder_attaches_to_sensors(GPIO, smbus, tmp_path):
+    from grow.moisture import Moisture
+    from grow.pump import Pump
+    from grow.recorder import Recorder
+
+    recorder = Recorder(str(tmp_path / "grow.db"), background=False)
+
+    moisture = Moisture(channel=1, timeout=None, window=None)
+    pump = Pump(channel=2)
+    recorder.attach_moisture(1, moisture)
+    recorder.attach_pump(pump)
+
+    moisture._publish(15.0, 200.0, False)
+    assert pump.dose(speed=0.5, timeout=0.01) is True
+    recorder.close()
+
+    assert recorder.readings() == [(200.0, 1, 15.0, moisture.snapshot.saturation)]
+    (dose,) = recorder.doses()
+    assert dose[1:] == (2, 0.5, 0.01, 1)
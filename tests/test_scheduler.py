@@ -0,0 +1,124 @@
+def test_scheduler_runs_calls_in_order(GPIO):
+    from grow.scheduler import Scheduler, VirtualClock
+
+    clock = VirtualClock(100.0)
+    scheduler = Scheduler(clock=clock, background=False)
+    calls = []
+
+    scheduler.call_later(2.0, calls.append, "second")
+    scheduler.call_later(1.0, calls.append, "first")
+    cancelled = scheduler.call_at(101.5, calls.append, "cancelled")
+    assert cancelled.cancel()
+
+    assert scheduler.run_pending() == 101.0
+    assert calls == []
+
+    clock.advance(1.0)
+    assert scheduler.run_pending() == 102.0
+    assert calls == ["first"]
+
+    clock.advance(5.0)
+    assert scheduler.run_pending() is None
+    assert calls == ["first", "second"]
+    assert not cancelled.pending
+
+
+def test_scheduler_survives_failing_calls(GPIO):
+    from grow.scheduler import Scheduler, VirtualClock
+
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+    calls = []
+
+    scheduler.call_later(0, lambda: 1 / 0)
+    handle = scheduler.call_later(0, calls.append, "after")
+    scheduler.run_pending()
+
+    assert calls == ["after"]
+    assert not handle.cancel()
+
+
+def test_cancel_races_with_a_due_call(GPIO):
+    import threading
+
+    from grow.scheduler import Scheduler, VirtualClock
+
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+    calls = []
+    cancelled = []
+    threads = []
+    handle = scheduler.call_at(1.0, calls.append, "ran")
+    clock.advance(1.0)
+
+    def cancelling_clock():
+        # Cancel from another thread as run_pending checks whether the call is due
+        thread = threading.Thread(target=lambda: cancelled.append(handle.cancel()))
+        thread.start()
+        thread.join(0.05)
+        threads.append(thread)
+        return clock()
+
+    scheduler._clock = cancelling_clock
+    scheduler.run_pending()
+    for thread in threads:
+        thread.join()
+
+    # The call was already taken to run, so the cancel must say it was too late
+    assert calls == ["ran"]
+    assert cancelled == [False]
+    assert not handle.cancelled
+
+
+def test_scheduler_thread(GPIO):
+    import threading
+
+    from grow.scheduler import Scheduler
+
+    scheduler = Scheduler()
+    done = threading.Event()
+    scheduler.call_later(0.05, scheduler.call_later, 0.01, done.set)
+
+    assert done.wait(1.0)
+    scheduler.stop()
+
+
+def test_pump_dose_uses_scheduler(GPIO, smbus):
+    from grow.pump import Pump
+    from grow.scheduler import Scheduler, VirtualClock
+
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+    pump = Pump(channel=1, scheduler=scheduler)
+
+    assert pump.dose(0.5, timeout=1.0, blocking=False)
+    clock.advance(0.9)
+    scheduler.run_pending()
+    assert pump.get_speed() == 0.5
+
+    clock.advance(0.1)
+    scheduler.run_pending()
+    assert pump.get_speed() == 0
+
+
+def test_piezo_beep_uses_scheduler(GPIO):
+    from grow.piezo import Piezo
+    from grow.scheduler import Scheduler, VirtualClock
+
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+    piezo = Piezo(scheduler=scheduler)
+    pwm = GPIO.PWM.return_value
+
+    assert piezo.beep(440, 0.1, blocking=False)
+    # A beep is already playing
+    assert not piezo.beep(440, 0.1, blocking=False)
+    assert piezo.beep(880, 0.2, blocking=False, force=True)
+
+    clock.advance(0.1)
+    scheduler.run_pending()
+    pwm.ChangeDutyCycle.assert_called_with(1)
+
+    clock.advance(0.1)
+    scheduler.run_pending()
+    pwm.ChangeDutyCycle.assert_called_with(0)
@@ -0,0 +1,57 @@
+import statistics
+
+import pytest
+
+
+def test_rolling_statistics_window(GPIO):
+    from grow.stats import RollingStatistics
+
+    rolling = RollingStatistics(window=10)
+    assert rolling.result.count == 0
+
+    values = [5.0, 3.0, 8.0, 1.0, 9.0, 2.0, 7.0, 4.0, 6.0, 0.0, 10.0, 3.5]
+    for t, value in enumerate(values):
+        result = rolling.update(1000.0 + t, value)
+
+    # Only the last ten seconds are kept, the window excludes its start
+    expected = values[-10:]
+    assert result.count == 10
+    assert result.mean == pytest.approx(statistics.fmean(expected))
+    assert result.minimum == min(expected)
+    assert result.maximum == max(expected)
+    assert result.stddev == pytest.approx(statistics.pstdev(expected))
+
+
+def test_rolling_statistics_slope(GPIO):
+    from grow.stats import RollingStatistics
+
+    rolling = RollingStatistics(window=60)
+    for t in range(200):
+        result = rolling.update(1.7e9 + t, 20.0 - 0.5 * t)
+
+    assert result.count == 60
+    assert result.slope == pytest.approx(-0.5)
+    assert result.stddev > 0
+
+
+def test_moisture_statistics(GPIO, smbus):
+    from grow.moisture import Moisture
+
+    ch1 = Moisture(channel=1, wet_point=1.0, dry_point=21.0, timeout=None, statistics_windows=(60, 3600))
+
+    for t, reading in enumerate((21.0, 11.0, 1.0)):
+        ch1._close_window(1000.0 + t, reading)
+
+    raw = ch1.statistics(3600, raw=True)
+    assert raw.mean == 11.0
+    assert raw.slope == pytest.approx(-10.0)
+
+    saturation = ch1.statistics()
+    assert saturation.count == 3
+    assert saturation.mean == 0.5
+    assert saturation.minimum == 0.0
+    assert saturation.maximum == 1.0
+    assert saturation.slope == pytest.approx(0.5)
+
+    with pytest.raises(ValueError):
+        ch1.statistics(5)
@@ -0,0 +1,135 @@
+import pytest
+
+
+def test_telemetry_counts_running_time(GPIO, smbus):
+    from grow.pump import FlowModel, Pump
+    from grow.ramps import PulseTrain
+    from grow.scheduler import Scheduler, VirtualClock
+
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+    pump = Pump(channel=1, scheduler=scheduler, pwm="mock", flow_model=FlowModel([(0.5, 1.0, 10.0)]))
+
+    # On for 0.2s, off for 0.2s, then on for 0.1s
+    assert pump.dose(0.5, timeout=0.5, blocking=False, ramp=PulseTrain(on=0.2, off=0.2))
+    for _ in range(5):
+        clock.advance(0.1)
+        scheduler.run_pending()
+        # Counted as it runs, not only when the dose ends
+        if clock() == pytest.approx(0.1):
+            assert pump.telemetry.on_time == pytest.approx(0.1)
+
+    telemetry = pump.telemetry
+    assert telemetry.on_time == pytest.approx(0.3)
+    assert telemetry.duty_time == pytest.approx(0.15)
+    assert telemetry.volume == pytest.approx(3.0)
+    assert (telemetry.doses, telemetry.rejected, telemetry.aborted) == (1, 0, 0)
+
+
+def test_telemetry_counts_rejected_and_aborted(GPIO, smbus):
+    from grow.pump import PowerBudget, Pump
+    from grow.scheduler import Scheduler, VirtualClock
+
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+    budget = PowerBudget()
+    ch1 = Pump(channel=1, scheduler=scheduler, pwm="mock", budget=budget)
+    ch2 = Pump(channel=2, scheduler=scheduler, pwm="mock", budget=budget)
+
+    assert ch1.dose(1.0, timeout=1.0, blocking=False)
+    assert not ch2.dose(0.5, timeout=1.0, blocking=False)
+    clock.advance(0.25)
+    ch1.stop()
+    clock.advance(1.0)
+
+    assert ch1.telemetry == (0.25, 0.25, 0.0, 1, 0, 1)
+    assert ch2.telemetry == (0.0, 0.0, 0.0, 0, 1, 0)
+
+
+def test_telemetry_persists(GPIO, smbus, tmp_path):
+    import time
+
+    from grow.pump import Pump, load_telemetry, telemetry_path
+    from grow.scheduler import Scheduler, VirtualClock
+
+    path = telemetry_path(1, str(tmp_path / "grow"))
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+
+    pump = Pump(channel=1, scheduler=scheduler, pwm="mock", telemetry_file=path, telemetry_interval=0.05)
+    assert pump.dose(0.5, timeout=1.0, blocking=False)
+    clock.advance(1.0)
+    scheduler.run_pending()
+
+    # Saved by the pump's own thread, not by the stop on the scheduler thread
+    for _ in range(100):
+        if load_telemetry(path).on_time == 1.0:
+            break
+        time.sleep(0.01)
+
+    restarted = Pump(channel=1, scheduler=scheduler, pwm="mock", telemetry_file=path)
+    assert restarted.telemetry == (1.0, 0.5, 0.0, 1, 0, 0)
+    pump._stop()
+    restarted._stop()
+
+
+def test_stop_does_not_save_telemetry(GPIO, smbus, tmp_path):
+    import os
+
+    from grow.pump import Pump, telemetry_path
+    from grow.scheduler import Scheduler, VirtualClock
+
+    path = telemetry_path(1, str(tmp_path / "grow"))
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+
+    pump = Pump(channel=1, scheduler=scheduler, pwm="mock", telemetry_file=path)
+    assert pump.dose(0.5, timeout=1.0, blocking=False)
+    clock.advance(1.0)
+    scheduler.run_pending()
+    assert not os.path.exists(path)
+
+    # Written out at exit
+    pump._stop()
+    assert os.path.exists(path)
+
+
+def test_bad_flow_model_never_leaves_the_pump_running(GPIO, smbus, tmp_path, monkeypatch):
+    import grow.pump
+    from grow.pump import Pump, global_budget
+    from grow.scheduler import Scheduler, VirtualClock
+
+    monkeypatch.setattr(grow.pump, "FLOW_MODEL_DIRECTORY", str(tmp_path))
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, background=False)
+
+    for content in ('{"version": 1}', '[1, 2]', '{"version": 1, "samples": [[0.5, 1.0]]}', '{"vers'):
+        (tmp_path / "pump-1-flow.json").write_text(content)
+        pump = Pump(channel=1, scheduler=scheduler, pwm="mock")
+        with pytest.raises(ValueError):
+            pump.flow_model
+
+        assert pump.dose(0.5, timeout=0.1, blocking=False)
+        clock.advance(0.1)
+        scheduler.run_pending()
+
+        assert pump.get_speed() == 0
+        assert pump._pwm.changes[-1] == ("duty_cycle", 0)
+        assert global_budget.reserved() == 0
+        assert pump.telemetry.on_time == pytest.approx(0.1)
+        assert pump.telemetry.volume == 0.0
+        pump._stop()
+
+
+def test_unreadable_telemetry_starts_from_zero(GPIO, smbus, tmp_path):
+    from grow.pump import Pump, load_telemetry, telemetry_path
+
+    path = telemetry_path(1, str(tmp_path))
+    for content in ('{"on_time": 1.0, "duty', '[1, 2]', '{"on_time": 1.0}'):
+        with open(path, "w") as file:
+            file.write(content)
+        assert load_telemetry(path) == (0.0, 0.0, 0.0, 0, 0, 0)
+
+        pump = Pump(channel=1, pwm="mock", telemetry_file=path)
+        assert pump.telemetry == (0.0, 0.0, 0.0, 0, 0, 0)
+        pump._stop()